@@ -3,13 +3,62 @@ The main application.
 """
 
 
+import asyncio
+import os
 import sys
 import getopt
 import io
 import itertools
+import random
 
 from tournament import Tournament
+from league import League
 from match import Match
+from async_match import AsyncMatch
+from game import Game
+from game import ENGINES
+from game.corpus import Corpus
+from game.corpus import write_corpus
+from game.ww.transposition import TRANSPOSITION_CACHE
+from distributed import Coordinator
+from distributed import parse_address
+from distributed import run_worker
+from output import GameLogSink
+from output import NullSink
+from output import check_compression
+from profiler import Profile
+from process import PersistentProcessPool
+from process import ForkServerPool
+from results_store import ResultsStore
+from results_store import ResultsStoreError
+from replay import read_replay
+from replay_match import play_replay
+from sprt import SPRT
+from timing import parse_turn_budgets
+
+
+# The options of the application (for getopt)
+SHORT_OPTIONS = "tvmn:s:d:234j:pfa:e:c:o:r:lM:"
+LONG_OPTIONS = ["resume", "replay=", "replay-stderr", "sprt=", "corpus=", "make-corpus=", "profile", "profile-trace=",
+                "budget=", "coordinator=", "worker=", "pairs", "quiet", "log-dir=", "log-compression="]
+
+# The command lines of the application ({0} is the program name).  Keep it
+# in sync with the options above.
+USAGE = """\
+usage: {0} bot1 [bot2] [bot3] [bot4] [-t] [-v] [-m] [-s <config> | -d <config>] [-2|-3|-4] [-n <number>]
+           [-j <jobs>|-a <games>|--pairs] [-p|-f] [-e <engine>] [-c <entries>] [-o <file> [--resume]]
+           [-r <dir> [--replay-stderr]] [--sprt <elo0>,<elo1>[,<alpha>,<beta>]] [--corpus <file>]
+           [--profile] [--profile-trace <file>] [-M <MB>] [--budget <first ms>,<later ms>[,<grace ms>]]
+           [--coordinator [<host>:]<port>] [--quiet | --log-dir <dir> [--log-compression gzip|zstd]]
+   or: {0} -l bot1 bot2 [bot3 ...] [-n <number>] [other tournament options]
+           (rank any number of bots in a league of two player games)
+   or: {0} --replay <file> [-m] [--budget <first ms>,<later ms>[,<grace ms>]]
+           (replay a recorded game without the bots)
+   or: {0} --make-corpus <file> [-n <number>]
+           (write a corpus of <number> configurations for --corpus)
+   or: {0} --worker <host>:<port> [-j <jobs>] [-p|-f] [-e <engine>] [-c <entries>]
+           [--quiet | --log-dir <dir> [--log-compression gzip|zstd]]
+           (play the games of a coordinator on this machine)"""
 
 
 def print_side_by_side(stream0, stream1, col_width=80):
@@ -41,9 +90,8 @@ class Arena:
         """
         Parse the arguments to the application and store the settings.
 
-        We assume the arguments to the app follow this pattern:
-
-        bot1 [bot2] [bot3] [bot4] [-t] [-v] [-m] [-s <config>] [-2|-3|-4] [-n <number>]
+        The arguments follow one of the patterns of USAGE: a tournament (or
+        a single or double game), a league, a replay, a corpus or a worker.
 
         :param argv: The command line arguments passed to the application as given
                      by sys.argv
@@ -52,6 +100,29 @@ class Arena:
 
         # parameters (set to defaults)
         self.number_of_games = 10  # Defaults to 10
+        self.jobs = 1  # Number of matches played at the same time in a tournament
+        self.process_pool_type = None  # How tournament bot processes are started
+        self.async_games = 0  # If positive, number of games played at once in an asyncio loop
+        self.engine = Game.engine  # The implementation of the game engine
+        self.cache_size = TRANSPOSITION_CACHE.maxsize  # Positions kept in the transposition cache
+        self.results_path = None  # File where each finished tournament game is recorded
+        self.resume = False  # Continue the tournament recorded in results_path
+        self.replay_dir = None  # Directory where the replay of each game is written
+        self.replay_stderr = False  # Include the bots' stderr in the replays
+        self.replay_path = None  # Replay file to play instead of running the bots
+        self.corpus_path = None  # Corpus file to draw the tournament configurations from
+        self.make_corpus_path = None  # Corpus file to write instead of playing
+        self.profile = False  # Time the phases of the arena in each game
+        self.profile_trace_path = None  # File to write a Chrome trace of the phases to
+        self.coordinator_address = None  # If set, remote workers play the tournament games
+        self.worker_address = None  # If set, play the games of the coordinator at this address
+        self.concurrent_sets = False  # Play the games of each set of a tournament at the same time
+        self.quiet = False  # Drop the output of the tournament games (without formatting it)
+        self.log_dir = None  # Directory where the output of each tournament game is written
+        self.log_compression = None  # None, "gzip" or "zstd"
+        self.turn_budgets = None  # If set, the arena deactivates bots which go over these TurnBudgets
+        self.memory_limit = None  # If set, the memory of each bot is capped at this many MB
+        self.sprt_args = None  # (elo0, elo1, alpha, beta) to stop the tournament early with an SPRT
         self.time_limits = False
         self.verbose = False
         self.show_map = False  # Only works if verbose and show_map are both True
@@ -60,20 +131,21 @@ class Arena:
         self.double_game = False
         self.config_str = None
         self.player_list = []
+        self.league = False  # Rank any number of bots by rating-driven two player games
 
         try:
-            opts, args = getopt.gnu_getopt(argv[1:], "tvmn:s:d:234", [])
+            opts, args = getopt.gnu_getopt(argv[1:], SHORT_OPTIONS, LONG_OPTIONS)
         except getopt.GetoptError:
-            print(argv[0], 'bot1 [bot2] [bot3] [bot4] [-t] [-v] [-m] [-s <config>] [-n <number>] [-2|-3|-4]')
+            print(USAGE.format(argv[0]))
             sys.exit(2)
 
-        if len(args) > 4:
-            print("Too many bots.")
+        if len(args) > 4 and not any(opt == '-l' for opt, _ in opts):
+            print("Too many bots (use -l for a league).")
             sys.exit(2)
 
-        elif len(args) < 1:
+        elif len(args) < 1 and not any(opt in ('--replay', '--make-corpus', '--worker') for opt, _ in opts):
             print("Need at least one bot.")
-            print(argv[0], 'bot1 [bot2] [bot3] [bot4] [-t] [-v] [-m] [-s <config>] [-n <number>] [-2|-3|-4]')
+            print(USAGE.format(argv[0]))
             sys.exit(2)
 
         for opt, arg in opts:
@@ -85,12 +157,99 @@ class Arena:
                 self.show_map = True
             elif opt in ('-2', '-3', '-4'):  # Play <2,3,4> player games only
                 n = int(opt[1])
-                if len(args) > n:
+                if len(args) > n and not any(opt == '-l' for opt, _ in opts):
                     print("Too many bots for a", n, "player game.")
                     sys.exit(2)
                 self.game_arity = n
+            elif opt == '-l':  # Play a league between any number of bots
+                self.league = True
             elif opt == '-n':  # Set number of games
                 self.number_of_games = int(arg)
+            elif opt == '-j':  # Play tournament games in parallel
+                self.jobs = int(arg)
+                if self.jobs < 1:
+                    print("Need at least one job.")
+                    sys.exit(2)
+            elif opt == '-a':  # Play tournament games concurrently in one event loop
+                self.async_games = int(arg)
+                if self.async_games < 1:
+                    print("Need at least one game at a time.")
+                    sys.exit(2)
+            elif opt in ('-p', '-f'):
+                if self.process_pool_type is not None:
+                    print("Can't reuse bot processes and fork them at the same time.")
+                    sys.exit(2)
+                if opt == '-p':  # Keep one bot process running for many games
+                    self.process_pool_type = PersistentProcessPool
+                else:  # Fork bot processes from a preloaded fork server
+                    self.process_pool_type = ForkServerPool
+            elif opt == '-e':  # Choose the game engine implementation
+                if arg not in ENGINES:
+                    print("Unknown engine", arg, "(choose from {})".format(", ".join(ENGINES)))
+                    sys.exit(2)
+                self.engine = arg
+            elif opt == '-c':  # Set the transposition cache size (0 turns it off)
+                self.cache_size = int(arg)
+                if self.cache_size < 0:
+                    print("The cache size can't be negative.")
+                    sys.exit(2)
+            elif opt == '-o':  # Record the tournament games in a file
+                self.results_path = arg
+            elif opt == '--resume':  # Skip the games already recorded in the file
+                self.resume = True
+            elif opt == '-r':  # Write the replay of each game in a directory
+                self.replay_dir = arg
+            elif opt == '--replay-stderr':  # Include the bots' stderr in the replays
+                self.replay_stderr = True
+            elif opt == '--replay':  # Replay a recorded game (no bots needed)
+                self.replay_path = arg
+            elif opt == '--corpus':  # Draw the tournament configurations from a corpus file
+                self.corpus_path = arg
+            elif opt == '--make-corpus':  # Write a corpus of -n configurations
+                self.make_corpus_path = arg
+            elif opt == '--profile':  # Print the time spent in each phase of the arena
+                self.profile = True
+            elif opt == '--profile-trace':  # Also write the phases as a Chrome trace
+                self.profile = True
+                self.profile_trace_path = arg
+            elif opt == '-M':  # Cap the memory of each bot (a bot going over it is deactivated)
+                self.memory_limit = float(arg)
+                if self.memory_limit <= 0:
+                    print("The memory limit must be positive.")
+                    sys.exit(2)
+            elif opt == '--coordinator':  # Hand the tournament games to remote workers
+                self.coordinator_address = arg
+            elif opt == '--worker':  # Play the games of a coordinator
+                self.worker_address = arg
+            elif opt == '--pairs':  # Play the mirrored games of each configuration at the same time
+                self.concurrent_sets = True
+            elif opt == '--quiet':  # Don't print (or format) the output of the tournament games
+                self.quiet = True
+            elif opt == '--log-dir':  # Write the output of each tournament game to its own file
+                self.log_dir = arg
+            elif opt == '--log-compression':  # Compress the game logs
+                try:
+                    check_compression(arg)
+                except ValueError as e:
+                    print("Bad log compression", arg, ":", e)
+                    sys.exit(2)
+                self.log_compression = arg
+            elif opt == '--budget':  # Enforce time budgets (first turn, later turns, grace) in ms
+                try:
+                    self.turn_budgets = parse_turn_budgets(arg)
+                except ValueError as e:
+                    print("Bad time budgets", arg, ":", e)
+                    sys.exit(2)
+                self.time_limits = True  # tell the bots they are timed
+            elif opt == '--sprt':  # Stop the tournament once bot1 is shown better (or not) than bot2
+                try:
+                    self.sprt_args = tuple(float(x) for x in arg.split(","))
+                    if len(self.sprt_args) not in (2, 4):
+                        raise ValueError("expected elo0,elo1 or elo0,elo1,alpha,beta")
+                    SPRT(*self.sprt_args)
+                except ValueError as e:
+                    print("Bad SPRT parameters", arg, ":", e)
+                    sys.exit(2)
             elif opt == '-s':   # Play a single game with a particular given
                                 # configuration.  Some other arguments are ignored.
                 if self.double_game:
@@ -110,12 +269,81 @@ class Arena:
                 self.double_game = True
                 self.config_str = arg
 
+        if self.coordinator_address is not None and (self.jobs > 1 or self.async_games or self.process_pool_type
+                                                     or self.profile or self.single_game or self.double_game):
+            print("A coordinator only hands out the games (-j, -a, -p and -f are options of the workers).")
+            sys.exit(2)
+
+        if self.async_games and (self.jobs > 1 or self.process_pool_type is not None):
+            print("Asyncio games can't be combined with -j, -p or -f.")
+            sys.exit(2)
+
+        if self.concurrent_sets and (self.jobs > 1 or self.async_games or self.process_pool_type is not None
+                                     or self.coordinator_address is not None or self.league):
+            print("Concurrent pairs can't be combined with -j, -a, -p, -f, -l or --coordinator.")
+            sys.exit(2)
+
+        if self.quiet and self.log_dir is not None:
+            print("Can't drop the output of the games and log it at the same time.")
+            sys.exit(2)
+        if self.log_compression is not None and self.log_dir is None:
+            print("Need a log directory (--log-dir <dir>) to compress the logs.")
+            sys.exit(2)
+        if self.coordinator_address is not None and (self.quiet or self.log_dir is not None):
+            print("A coordinator only hands out the games (--quiet and --log-dir are options of the workers).")
+            sys.exit(2)
+
+        if self.replay_stderr and self.replay_dir is None:
+            print("Need a replay directory (-r <dir>) to record stderr in replays.")
+            sys.exit(2)
+
+        if self.resume and self.results_path is None:
+            print("Need a results file (-o <file>) to resume.")
+            sys.exit(2)
+        if self.results_path is not None and not self.resume and not ResultsStore(self.results_path).is_empty():
+            print("The results file", self.results_path, "already exists (use --resume to continue it).")
+            sys.exit(2)
+
+        if self.league:
+            if len(args) < 2 or len(set(args)) != len(args):
+                print("A league needs at least two different bots.")
+                sys.exit(2)
+            if self.game_arity not in (None, 2) or self.single_game or self.double_game or self.sprt_args:
+                print("A league only plays tournaments of two player games (no -3, -4, -s, -d or --sprt).")
+                sys.exit(2)
+
+        if self.sprt_args is not None and (len(args) != 2 or self.game_arity not in (None, 2)):
+            print("The SPRT needs two bots playing two player games.")
+            sys.exit(2)
+
         self.player_list = args
 
     def run(self):
         """Run the application according to the provided arguments."""
 
-        if self.single_game or self.double_game:
+        Game.engine = self.engine
+        TRANSPOSITION_CACHE.resize(self.cache_size)
+
+        if self.make_corpus_path is not None:
+            self.make_corpus()
+            return
+
+        if self.worker_address is not None:
+            run_worker(self.worker_address, self.jobs, self.process_pool_type, self.output_sink())
+            return
+
+        Game.corpus = None
+        if self.corpus_path is not None:
+            try:
+                Game.corpus = Corpus(self.corpus_path)
+            except (OSError, ValueError) as e:
+                print("Can't read the corpus", self.corpus_path, ":", e)
+                sys.exit(2)
+
+        if self.replay_path is not None:
+            self.play_replay()
+
+        elif self.single_game or self.double_game:
             self.verbose = True
 
             if self.single_game:
@@ -131,9 +359,14 @@ class Arena:
         """Play a single verbose match."""
 
         match = None
+        profile = self.new_profile()
+        if profile is not None:
+            profile.game_id = 0
         try:
             # Initialization
-            match = Match(0, self.config_str, self.player_list, self.time_limits, self.verbose, self.show_map)
+            match = Match(0, self.config_str, self.player_list, self.time_limits, self.verbose, self.show_map,
+                          profile=profile, memory_limit=self.memory_limit,
+                          turn_budgets=self.turn_budgets)
 
             match.pregame()
             # Game Loop
@@ -153,105 +386,134 @@ class Arena:
                     if p:
                         p.kill()
 
+        if profile is not None:
+            profile.finish()
+            for line in profile.summary():
+                print(line)
+            self.write_profile_trace(profile)
+
     def play_double_game(self):
-        """Play a verbose two-player match in two columns"""
+        """
+        Play a verbose two-player match and its mirror at the same time, in two columns.
+
+        Both matches are driven by one asyncio event loop and print to their own
+        buffers, which are printed side by side after each turn.  So the
+        mirrored match doesn't wait for the other match's bots.
+        """
 
         player_names = list(set(self.player_list))
         reverse_player_list = []
         for p in self.player_list:
             reverse_player_list.append(player_names[1] if p == player_names[0]
                                        else player_names[0])
-        match0 = None
-        match1 = None
-        try:
-            # Initialization (don't pass show map)
-            match0 = Match(0, self.config_str, self.player_list, self.time_limits, self.verbose, False)
-            match1 = Match(1, self.config_str, reverse_player_list, self.time_limits, self.verbose, False)
-
-            stdout_ = sys.stdout  # Keep track of the previous value.
-
-            stream0 = io.StringIO()
-            sys.stdout = stream0  # capture stdout to a stream
-            match0.pregame()
-
-            stream1 = io.StringIO()
-            sys.stdout = stream1  # capture stdout to a stream
-            match1.pregame()
+        asyncio.run(self.play_double_game_async([self.player_list, reverse_player_list]))
 
-            sys.stdout = stdout_  # restore the previous stdout.
-            print_side_by_side(stream0.getvalue(), stream1.getvalue())
+    async def play_double_game_async(self, player_lists):
+        """
+        :param player_lists: The player lists of the two matches
+        """
+        outputs = [io.StringIO() for _ in player_lists]
+        # Initialization (don't pass show map)
+        matches = [AsyncMatch(i, self.config_str, player_list, self.time_limits, self.verbose, False,
+                              memory_limit=self.memory_limit, turn_budgets=self.turn_budgets, output=output)
+                   for i, (player_list, output) in enumerate(zip(player_lists, outputs))]
+
+        def print_outputs():
+            print_side_by_side(*(output.getvalue() for output in outputs))
+            for output in outputs:
+                output.seek(0)
+                output.truncate()
 
-            stream0.close()
-            stream1.close()
+        try:
+            for match in matches:
+                await match.start()
+            for match in matches:
+                match.pregame()
+            print_outputs()
 
             # Game Loop
-            while match0.is_active() or match1.is_active():
+            while any(match.is_active() for match in matches):
                 # Play one round of each game
-                stream0 = io.StringIO()
-                sys.stdout = stream0  # capture stdout to a stream
-                if match0.is_active():
-                    match0.one_turn()
-
-                stream1 = io.StringIO()
-                sys.stdout = stream1  # capture stdout to a stream
-                if match1.is_active():
-                    match1.one_turn()
-
-                sys.stdout = stdout_  # restore the previous stdout.
-                print_side_by_side(stream0.getvalue(), stream1.getvalue())
-
-                stream0.close()
-                stream1.close()
+                await asyncio.gather(*(match.one_turn() for match in matches if match.is_active()))
+                print_outputs()
 
                 if self.show_map:
-                    stream0 = io.StringIO()
-                    sys.stdout = stream0  # capture stdout to a stream
-                    match0.print_board()  # not implemented yet
-
-                    stream1 = io.StringIO()
-                    sys.stdout = stream1  # capture stdout to a stream
-                    match0.print_board()  # not implemented yet
-
-                    sys.stdout = stdout_  # restore the previous stdout.
-                    print_side_by_side(stream0.getvalue(), stream1.getvalue())
-
-                    stream0.close()
-                    stream1.close()
+                    for match in matches:
+                        match.print_board()
+                    print_outputs()
 
             # Handle end of game details
-            stream0 = io.StringIO()
-            sys.stdout = stream0  # capture stdout to a stream
-            match0.end_of_game()
+            for match in matches:
+                match.end_of_game()
+            print_outputs()
 
-            stream1 = io.StringIO()
-            sys.stdout = stream1  # capture stdout to a stream
-            match1.end_of_game()
+        finally:
+            # Kill all subprocesses even if a crash
+            await asyncio.gather(*(match.close() for match in matches))
 
-            sys.stdout = stdout_  # restore the previous stdout.
-            print_side_by_side(stream0.getvalue(), stream1.getvalue())
+    def play_replay(self):
+        """Print a recorded game (like -v, and -m for the boards) without running the bots."""
 
-            stream0.close()
-            stream1.close()
+        try:
+            replay = read_replay(self.replay_path)
+        except (OSError, ValueError) as e:
+            print("Can't read the replay", self.replay_path, ":", e)
+            sys.exit(2)
+        play_replay(replay, verbose=True, show_map=self.show_map, turn_budgets=self.turn_budgets)
 
-        except:
-            raise
-        finally:
-            # Kill all subprocesses even if a crash
-            if match0 is not None:
-                for p in match0.player_processes:
-                    if p:
-                        p.kill()
+    def make_corpus(self):
+        """Write the configurations of a -n game tournament to a corpus file."""
 
-            if match1 is not None:
-                for p in match1.player_processes:
-                    if p:
-                        p.kill()
+        rng = random.Random(0)
+        write_corpus(self.make_corpus_path, (Game.random_configuration(rng) for _ in range(self.number_of_games)))
+        print("Wrote", self.number_of_games, "configurations to", self.make_corpus_path)
 
     def play_tournament(self):
         """Play a tournament with multiple matches."""
 
-        t = Tournament(self.number_of_games, self.player_list,
-                       self.game_arity, self.time_limits,
-                       self.verbose, self.show_map)
-        t.play_all_games()
+        results_store = ResultsStore(self.results_path) if self.results_path is not None else None
+        if self.replay_dir is not None:
+            os.makedirs(self.replay_dir, exist_ok=True)
+        sprt = SPRT(*self.sprt_args) if self.sprt_args is not None else None
+        profile = self.new_profile()
+        coordinator = None
+        if self.coordinator_address is not None:
+            coordinator = Coordinator(*parse_address(self.coordinator_address, default_host=""))
+        if self.league:
+            t = League(self.number_of_games, self.player_list, self.time_limits, self.verbose, self.show_map,
+                       self.jobs, self.process_pool_type, self.async_games, results_store,
+                       self.replay_dir, self.replay_stderr, profile, self.memory_limit, self.turn_budgets,
+                       coordinator, self.output_sink())
+        else:
+            t = Tournament(self.number_of_games, self.player_list,
+                           self.game_arity, self.time_limits,
+                           self.verbose, self.show_map, self.jobs, self.process_pool_type, self.async_games,
+                           results_store, self.replay_dir, self.replay_stderr, sprt, profile, self.memory_limit,
+                           self.turn_budgets, coordinator, self.concurrent_sets, self.output_sink())
+        try:
+            t.play_all_games()
+        except ResultsStoreError as e:  # the results store is corrupt or from another tournament
+            print(e)
+            sys.exit(2)
         t.print_win_data()
+        self.write_profile_trace(profile)
+
+    def output_sink(self):
+        """:return: The sink of the tournament games' output (None for the terminal)."""
+        if self.quiet:
+            return NullSink()
+        if self.log_dir is not None:
+            return GameLogSink(self.log_dir, self.log_compression)
+        return None
+
+    def new_profile(self):
+        """:return: A Profile if --profile is on, else None."""
+        if not self.profile:
+            return None
+        return Profile(keep_events=self.profile_trace_path is not None)
+
+    def write_profile_trace(self, profile):
+        """Write the Chrome trace of a profile (if --profile-trace was given)."""
+        if profile is not None and self.profile_trace_path is not None:
+            profile.write_chrome_trace(self.profile_trace_path)
+            print("Wrote the Chrome trace of the arena phases to", self.profile_trace_path)
@@ -0,0 +1,250 @@
+"""
+A match engine built on asyncio so that one process can drive many matches.
+
+Each bot is an asyncio subprocess.  Its output streams are read by tasks on the
+event loop instead of by threads, and writes to its stdin never block: they are
+buffered by the event loop (up to MAX_STDIN_BUFFER bytes), so a bot which stops
+reading can't stall the other matches.
+"""
+
+import asyncio
+import time
+from asyncio.subprocess import PIPE
+
+from match import Match
+from replay import replay_path
+from resources import memory_limiter
+from resources import proc_usage
+from resources import process_rss
+from timing import process_cpu_time
+
+MAX_STDIN_BUFFER = 2**20  # A bot with more unread input than this is treated as crashed
+MAX_LINE_LENGTH = 2**20
+
+
+async def _enqueue_output(stream, queue):
+    """Put the lines of the output stream into the queue as they arrive."""
+    while True:
+        try:
+            line = await stream.readline()
+        except ValueError:  # line too long (it is dropped)
+            continue
+        if not line:
+            return
+        queue.put_nowait((time.perf_counter(), line.decode(errors="replace")))
+
+
+def _take_lines(queue):
+    """
+    Return all the (arrival time, line) pairs currently in the stream queue
+    without waiting.
+    """
+    lines = []
+    while not queue.empty():
+        lines.append(queue.get_nowait())
+    return lines
+
+
+class AsyncPlayerProcess:
+    """
+    The asyncio version of PlayerProcess.  Create it with AsyncPlayerProcess.create.
+    """
+
+    def __init__(self, process):
+        self._process = process
+        self.pid = process.pid
+        self._stdout_queue = asyncio.Queue()
+        self._stderr_queue = asyncio.Queue()
+        self._readers = [asyncio.ensure_future(_enqueue_output(process.stdout, self._stdout_queue)),
+                         asyncio.ensure_future(_enqueue_output(process.stderr, self._stderr_queue))]
+        self.write_calls = 0
+        self.final_usage = None
+
+    @classmethod
+    async def create(cls, program_name, options, memory_limit=None):
+        process = await asyncio.create_subprocess_exec('python3', '-u', program_name, *options,
+                                                       stdin=PIPE, stdout=PIPE, stderr=PIPE,
+                                                       limit=MAX_LINE_LENGTH,
+                                                       preexec_fn=memory_limiter(memory_limit))
+        return cls(process)
+
+    async def read_streams(self, expected_stdout_lines=1, timeout=.1):
+        """
+        Read the output of the bot for one turn.
+
+        Returns as soon as the expected number of stdout lines has arrived (or
+        the timeout passes).  Stderr is then collected without waiting.
+
+        :param int expected_stdout_lines: Number of stdout lines which end the turn
+        :param timeout: The longest time to wait for the stdout lines
+        :return: stdout lines, stderr lines, output time (when the last stdout line arrived)
+        """
+        stdout_lines = _take_lines(self._stdout_queue)
+        deadline = time.perf_counter() + timeout
+        while len(stdout_lines) < expected_stdout_lines:
+            try:
+                stdout_lines.append(await asyncio.wait_for(self._stdout_queue.get(),
+                                                           deadline - time.perf_counter()))
+            except asyncio.TimeoutError:
+                break
+        stdout_lines += _take_lines(self._stdout_queue)
+
+        output_time = stdout_lines[-1][0] if stdout_lines else time.perf_counter()
+
+        # Let the stderr reader handle data which arrived with the stdout lines
+        await asyncio.sleep(0)
+        stderr_lines = _take_lines(self._stderr_queue)
+        return [line for _, line in stdout_lines], [line for _, line in stderr_lines], output_time
+
+    def cpu_time(self):
+        """
+        :return: The CPU time used so far by the bot (in seconds), or None if unknown
+        """
+        return process_cpu_time(self.pid)
+
+    def rss(self):
+        """
+        :return: The resident memory of the bot now (in kB), or None if unknown
+        """
+        return process_rss(self.pid)
+
+    def resource_usage(self):
+        """
+        :return: The ResourceUsage of the bot (read from /proc when it was killed), or None if unknown
+        """
+        return self.final_usage
+
+    def write_input(self, data):
+        """
+        Write to the bot's stdin without blocking.
+
+        The event loop writes as much as the pipe takes right away and
+        buffers the rest.
+
+        :param bytes data: The input
+        :raises BrokenPipeError: if the bot closed its stdin or has too much unread input
+        """
+        transport = self._process.stdin.transport
+        if transport.is_closing() or transport.get_write_buffer_size() > MAX_STDIN_BUFFER:
+            raise BrokenPipeError()
+        self._process.stdin.write(data)
+        self.write_calls += 1
+
+    def io_calls(self):
+        """
+        :return: The number of writes to stdin, and None for the reads (they
+                 are done by the event loop and not counted)
+        """
+        return self.write_calls, None
+
+    def kill(self):
+        if self.final_usage is None and self._process.returncode is None:
+            # The same /proc reading as PlayerProcess.kill (the event loop reaps the process)
+            self.final_usage = proc_usage(self.pid)
+        try:
+            self._process.kill()
+        except ProcessLookupError:
+            pass  # already gone
+
+    async def wait_closed(self):
+        """Wait for the process to exit and its streams to be read."""
+        self.kill()
+        await self._process.wait()
+        for reader in self._readers:
+            reader.cancel()
+        await asyncio.gather(*self._readers, return_exceptions=True)
+
+
+class AsyncMatch(Match):
+    """
+    A Match whose player processes are driven by an asyncio event loop.
+
+    Call (and await) start before pregame, one_turn instead of Match.one_turn,
+    and close at the end.  Everything else is the same as in Match.
+    """
+
+    def start_player_processes(self, process_pool):
+        self.all_processes = []  # player_processes loses killed processes
+
+    async def start(self):
+        """Start one process per player."""
+        options = self.player_options()
+        for program_name in self.player_program_list:
+            p = await AsyncPlayerProcess.create(program_name, options, self.memory_limit)
+            self.player_processes.append(p)
+            self.all_processes.append(p)
+
+    async def read_player_streams(self, timeout=0.1, expected_stdout_size=1):
+        """
+        Get the actions from the player processes stdin (and stuff from stderr)
+
+        :param timeout:
+        :param expected_stdout_size:
+        :return: time that the output was collected
+        :return: stdout stream
+        :return: stderr stream
+        """
+
+        p = self.player_processes[self.current_player]
+        stdout_stream, stderr_stream, output_time = await p.read_streams(expected_stdout_size, timeout=timeout)
+
+        return output_time, stdout_stream, stderr_stream
+
+    async def one_turn(self):
+        """
+        Perform one turn in the game (for each player).
+
+        Send info to process, read info from process, validate and process moves
+        """
+
+        input_time, input_flag = self.begin_turn()
+        expected_stdout_size = self.game.expected_output_lines(self.current_player)
+        output_time, stdout_stream, stderr_stream = await self.read_player_streams(timeout=self.read_timeout(input_time),
+                                                                                   expected_stdout_size=expected_stdout_size)
+        self.end_turn(input_time, input_flag, output_time, stdout_stream, stderr_stream)
+
+    async def close(self):
+        """Kill all the player processes and wait for them to exit."""
+        await asyncio.gather(*(p.wait_closed() for p in self.all_processes))
+
+
+async def play_match_async(id_number, player_list, config_str, time_limits, verbose, show_map,
+                           replay_dir=None, replay_stderr=False, profile=None, memory_limit=None,
+                           turn_budgets=None, output=None):
+    """
+    Plays the match from beginning to end.
+
+    :param str replay_dir: If given, write the replay of the match in this directory
+    :param bool replay_stderr: Include the players' stderr in the replay
+    :param profile: A profiler.Profile to time the phases of the match in (or None)
+    :param memory_limit: If given, cap the memory of the bots at this many MB
+    :param turn_budgets: If given, the timing.TurnBudgets enforced by the arena
+    :param output: The text stream the match prints to (None for sys.stdout)
+    :return: The finished AsyncMatch
+    """
+    match = AsyncMatch(id_number, config_str, player_list, time_limits, verbose, show_map,
+                       record_replay=replay_dir is not None, replay_stderr=replay_stderr, profile=profile,
+                       memory_limit=memory_limit, turn_budgets=turn_budgets, output=output)
+    try:
+        await match.start()
+
+        match.pregame()
+        # Game Loop
+        while match.is_active():
+            # Play one round of the game
+            await match.one_turn()
+
+        # Handle end of game details
+        match.end_of_game()
+        if replay_dir is not None:
+            match.write_replay(replay_path(replay_dir, id_number))
+    finally:
+        # Kill all subprocesses even if a crash
+        await match.close()
+
+    if profile is not None:
+        profile.finish()
+        if match.printing:
+            match.print(profile.game_summary())
+
+    return match
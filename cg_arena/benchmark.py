@@ -0,0 +1,261 @@
+"""
+Benchmarks of the game engines and of the match pipeline.
+
+    python3 cg_arena/benchmark.py [-o <file>] [-c <old file>] [-t <seconds>] [-n <matches>]
+                                  [-d <depth>] [-s <config>] [--perft]
+
+It times the engine operations (legal actions, next_board_state,
+turn_input) on positions of random games, Game.validate_output, the batch
+engine, and full matches between two trivial built-in bots (so the time is
+the arena's, not the bots').  It also runs perft (the number of move
+sequences of length -d from the configuration -s) with every engine,
+checks that they agree and measures their nodes per second.
+
+-o saves the results as JSON and -c compares them with a saved file, so
+engine and I/O changes can be compared from one version to the next.
+--perft only runs perft.  The exit status is 1 if the engines disagree.
+"""
+
+import contextlib
+import getopt
+import io
+import json
+import os
+import platform
+import random
+import sys
+import tempfile
+import time
+
+import numpy as np
+
+from game import ENGINES
+from game import Game
+from game.ww.batch import BatchBoardState
+from game.ww.perft import batch_perft
+from game.ww.perft import perft
+from game.ww.transposition import TRANSPOSITION_CACHE
+from tournament import play_match
+
+FORMAT_VERSION = 1
+
+# A bot which plays its first legal action at once
+ECHO_BOT = """\
+try:
+    size = int(input())
+    units_per_player = int(input())
+    while True:
+        for _ in range(size + 2 * units_per_player):
+            input()
+        actions = [input() for _ in range(int(input()))]
+        print(actions[0] if actions else "ACCEPT-DEFEAT", flush=True)
+except EOFError:
+    pass
+"""
+
+
+def measure(function, inputs, min_time):
+    """
+    Call function on the inputs (over and over) for at least min_time seconds.
+
+    :return: The average time of a call in seconds
+    """
+    calls = 0
+    start = time.perf_counter()
+    while True:
+        for x in inputs:
+            function(x)
+        calls += len(inputs)
+        elapsed = time.perf_counter() - start
+        if elapsed >= min_time:
+            return elapsed / calls
+
+
+def sample_positions(engine, number_of_games=10, positions_per_game=20, seed=0):
+    """
+    Play random games and keep some of their positions.
+
+    :return: list of board states of the engine (the same positions for every engine)
+    """
+    Game.engine = engine
+    rng = random.Random(seed)
+    positions = []
+    for _ in range(number_of_games):
+        game = Game(Game.random_configuration(rng))
+        states = []
+        while game.is_active():
+            states.append(game.board_state)
+            actions = game.legal_actions(game.current_player())
+            game.process_output(game.current_player(), rng.choice(actions) if actions else "ACCEPT-DEFEAT", False)
+        positions.extend(states[::max(1, len(states) // positions_per_game)][:positions_per_game])
+    Game.engine = "numpy"
+    return positions
+
+
+def first_action(board_state):
+    return str(board_state.legal_actions[0]) if board_state.legal_actions else "ACCEPT-DEFEAT"
+
+
+def engine_benchmarks(min_time):
+    """
+    Time the engine operations, without the transposition cache (so that
+    every call does the work).
+
+    :return: dict name -> seconds per call
+    """
+    results = {}
+    cache_size = TRANSPOSITION_CACHE.maxsize
+    TRANSPOSITION_CACHE.resize(0)
+    try:
+        for engine in ENGINES:
+            positions = sample_positions(engine)
+            pairs = [(s, first_action(s)) for s in positions]
+            for method in ("my_legal_mask", "my_legal_actions"):
+                if hasattr(positions[0], method):
+                    results["{}.{}".format(engine, method)] = measure(lambda s: getattr(s, method)(),
+                                                                      positions, min_time)
+            results[engine + ".next_board_state"] = measure(lambda p: p[0].next_board_state(p[1]), pairs, min_time)
+            render = "render_turn_input" if hasattr(positions[0], "render_turn_input") else "turn_input"
+            results[engine + ".turn_input"] = measure(lambda s: getattr(s, render)(), positions, min_time)
+
+        positions = sample_positions("numpy")
+        game = Game("mapIndex=0;seed=0")
+        game.board_state = positions[0]
+        outputs = [[first_action(positions[0]) + "\n"], ["MOVE&BUILD 0 N N\n"], ["HELLO\n"], []]
+        results["Game.validate_output"] = measure(game.validate_output, outputs, min_time)
+
+        batch = BatchBoardState.from_board_states(positions)
+        ranks = BatchBoardState.action_ranks([first_action(s) for s in positions])
+        all_lanes = np.arange(len(batch))  # legal_mask isn't cached when the lanes are given
+        results["batch.legal_mask (per lane)"] = measure(
+            lambda b: b.legal_mask(all_lanes), [batch], min_time) / len(batch)
+        results["batch.next_board_states (per lane)"] = measure(
+            lambda b: b.next_board_states(ranks), [batch], min_time) / len(batch)
+    finally:
+        TRANSPOSITION_CACHE.resize(cache_size)
+    return results
+
+
+def match_benchmark(number_of_matches):
+    """
+    Play matches between two copies of ECHO_BOT.
+
+    :return: dict name -> seconds (per match and per turn)
+    """
+    rng = random.Random(0)
+    total_time = 0.0
+    turns = 0
+    with tempfile.TemporaryDirectory() as directory:
+        bot = os.path.join(directory, "echo_bot.py")
+        with open(bot, "w") as f:
+            f.write(ECHO_BOT)
+        for i in range(number_of_matches):
+            config_str = Game.random_configuration(rng)
+            start = time.perf_counter()
+            with contextlib.redirect_stdout(io.StringIO()):
+                result = play_match(i, [bot, bot], config_str, False, False, False)
+            total_time += time.perf_counter() - start
+            turns += sum(h.count for h in result.turn_times) + len(result.player_list)  # the first turns aren't timed
+    return {"Match (per match)": total_time / number_of_matches,
+            "Match (per turn)": total_time / turns}
+
+
+def perft_benchmark(config_str, depth):
+    """
+    Run perft with every engine.
+
+    :return: dict with the leaves of each engine, their nodes per second and
+             whether they all agree
+    """
+    leaves = {}
+    nodes_per_sec = {}
+    engines = [(engine, perft, engine) for engine in ENGINES] + [("batch", batch_perft, "numpy")]
+    for name, function, engine in engines:
+        Game.engine = engine
+        board_state = Game(config_str).board_state
+        start = time.perf_counter()
+        leaves[name], nodes = function(board_state, depth)
+        nodes_per_sec[name] = nodes / (time.perf_counter() - start)
+    Game.engine = "numpy"
+    return {"config": config_str, "depth": depth, "leaves": leaves, "nodes_per_sec": nodes_per_sec,
+            "ok": len(set(leaves.values())) == 1}
+
+
+def print_results(results, old_results=None):
+    """Print the timings (and how they compare with old_results)."""
+    old_timings = old_results["timings"] if old_results else {}
+    for name, seconds in results["timings"].items():
+        line = "{:38} {:12.3f} us".format(name, seconds * 1e6)
+        if name in old_timings:
+            line += "   (was {:.3f} us, {:.2f}x faster)".format(old_timings[name] * 1e6, old_timings[name] / seconds)
+        print(line)
+
+    p = results["perft"]
+    print("perft({}) of {}: {}".format(p["depth"], p["config"], "ok" if p["ok"] else "ENGINES DISAGREE"))
+    old_speeds = old_results["perft"]["nodes_per_sec"] if old_results and "perft" in old_results else {}
+    for name, leaves in p["leaves"].items():
+        line = "    {:10} {:10} leaves {:12.0f} nodes/sec".format(name, leaves, p["nodes_per_sec"][name])
+        if name in old_speeds:
+            line += "   (was {:.0f}, {:.2f}x faster)".format(old_speeds[name], p["nodes_per_sec"][name] / old_speeds[name])
+        print(line)
+
+
+def main(argv):
+    output_path = None
+    compare_path = None
+    min_time = 0.5
+    number_of_matches = 3
+    depth = 2
+    config_str = "mapIndex=1;seed=2"
+    perft_only = False
+
+    usage = "benchmark.py [-o <file>] [-c <old file>] [-t <seconds>] [-n <matches>] [-d <depth>] [-s <config>] [--perft]"
+    try:
+        opts, args = getopt.gnu_getopt(argv[1:], "o:c:t:n:d:s:", ["perft"])
+    except getopt.GetoptError:
+        print(usage)
+        return 2
+    for opt, arg in opts:
+        if opt == '-o':  # Save the results as JSON
+            output_path = arg
+        elif opt == '-c':  # Compare with results saved by -o
+            compare_path = arg
+        elif opt == '-t':  # Minimum time of each timing
+            min_time = float(arg)
+        elif opt == '-n':  # Number of matches between the built-in bots
+            number_of_matches = int(arg)
+        elif opt == '-d':  # Depth of perft
+            depth = int(arg)
+        elif opt == '-s':  # Configuration of perft
+            config_str = arg
+        elif opt == '--perft':  # Only run perft
+            perft_only = True
+
+    old_results = None
+    if compare_path is not None:
+        with open(compare_path) as f:
+            old_results = json.load(f)
+
+    timings = {}
+    if not perft_only:
+        timings.update(engine_benchmarks(min_time))
+        if number_of_matches > 0:
+            timings.update(match_benchmark(number_of_matches))
+    results = {"version": FORMAT_VERSION,
+               "time": time.strftime("%Y-%m-%dT%H:%M:%S"),
+               "python": platform.python_version(),
+               "numpy": np.__version__,
+               "machine": platform.machine(),
+               "timings": timings,
+               "perft": perft_benchmark(config_str, depth)}
+
+    print_results(results, old_results)
+    if output_path is not None:
+        with open(output_path, "w") as f:
+            json.dump(results, f, indent=2)
+        print("Saved the results to", output_path)
+    return 0 if results["perft"]["ok"] else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv))
@@ -0,0 +1,118 @@
+"""
+A thin wrapper which keeps one Python interpreter running for many games.
+
+Run as
+
+    python3 -u bot_shim.py <bot> [options]
+
+The bot script is compiled once.  For every game it is executed again with
+fresh globals and a fresh stdin/stdout/stderr, so an unmodified CodinGame bot
+plays game after game without paying for interpreter startup and module
+imports each time.  (Modules imported by the bot stay imported, so a bot must
+not rely on module state being fresh.)
+
+The arena ends a game by writing END_OF_GAME on the bot's stdin.  The bot sees
+it as an EndOfGame exception raised from input().  When the bot is done, the
+shim writes END_OF_GAME to stdout and stderr so the arena knows the streams
+hold nothing else from that game.
+"""
+
+import builtins
+import io
+import os
+import sys
+import traceback
+
+END_OF_GAME = "\x1e--cg-arena-end-of-game--\n"
+
+
+class EndOfGame(BaseException):
+    """
+    Raised inside the bot when the arena ends the game.
+
+    It is not an Exception so that the "except Exception" blocks in a bot
+    don't catch it.
+    """
+    pass
+
+
+class _GameStdin(io.TextIOBase):
+    """
+    The stdin seen by the bot during one game.
+    """
+
+    def __init__(self, real_stdin):
+        self._real_stdin = real_stdin
+        self.game_over = False  # the arena ended the game
+        self.arena_closed = False  # the arena closed the pipe
+
+    def readable(self):
+        return True
+
+    def readline(self, size=-1):
+        if self.game_over:
+            raise EndOfGame()
+        line = self._real_stdin.readline()
+        if line == END_OF_GAME:
+            self.game_over = True
+            raise EndOfGame()
+        if not line:
+            self.arena_closed = True
+        return line
+
+
+def _text_stream(fd):
+    """A fresh unbuffered text stream on the file descriptor (like python3 -u)."""
+    return io.TextIOWrapper(open(fd, "wb", buffering=0, closefd=False),
+                            line_buffering=True, write_through=True)
+
+
+def play_games(program_name, options):
+    """
+    Play games until the arena closes the stdin pipe.
+
+    :param str program_name: The path of the bot script
+    :param options: The command line options passed to the bot
+    """
+    with open(program_name, "rb") as f:
+        code = compile(f.read(), program_name, "exec")
+    sys.path[0] = os.path.dirname(os.path.abspath(program_name))
+    real_stdin = sys.stdin
+
+    while True:
+        game_stdin = _GameStdin(real_stdin)
+        sys.stdin = game_stdin
+        sys.stdout = _text_stream(1)
+        sys.stderr = _text_stream(2)
+        sys.argv = [program_name] + options
+        bot_globals = {"__name__": "__main__",
+                       "__file__": program_name,
+                       "__builtins__": builtins}
+        try:
+            exec(code, bot_globals)
+        except EndOfGame:
+            pass
+        except SystemExit:
+            pass
+        except BaseException as e:
+            if game_stdin.arena_closed:
+                return
+            # Print the traceback without the frames of this wrapper
+            traceback.print_exception(type(e), e, e.__traceback__.tb_next)
+
+        # Skip the rest of the game if the bot stopped early
+        while not game_stdin.game_over:
+            line = real_stdin.readline()
+            if not line:
+                return
+            game_stdin.game_over = (line == END_OF_GAME)
+
+        for fd in (1, 2):
+            try:
+                os.write(fd, END_OF_GAME.encode())
+            except OSError:
+                return
+
+
+if __name__ == "__main__":
+    play_games(sys.argv[1], sys.argv[2:])
@@ -0,0 +1,358 @@
+"""
+Play a tournament on many machines.
+
+The arena started with --coordinator owns the tournament: it draws the
+games from the schedule of the tournament (so they are the same games as
+on one machine) and hands them out in batches to the workers which connect
+to it.  A worker (--worker) plays the games with its own pool of processes,
+sends back each result as soon as its game is over and asks for more games
+as soon as one of its processes is free, so it always has about -j games
+running.
+
+The protocol is one JSON object per line over TCP:
+
+    worker -> coordinator   {"type": "hello"}
+    coordinator -> worker   {"type": "settings", ...}  (the options of the matches)
+    worker -> coordinator   {"type": "request", "size": n}  (wants up to n games)
+    coordinator -> worker   {"type": "batch", "games": [[id, player list, config], ...]}
+                            or {"type": "done"}
+    worker -> coordinator   {"type": "result", "result": {...}}  (one per game of the batch)
+
+A worker has at most one request waiting for an answer, but it keeps sending
+the results of the games it is playing while it waits.
+
+A worker which disconnects (or says nothing for worker_timeout seconds) is
+dead, and its unfinished games go to the next worker which asks.  Once the
+schedule is exhausted, an idle worker steals games which another worker
+hasn't finished yet; the first result of a game is kept and the others are
+ignored.  The bots must be at the same paths on every machine.
+"""
+
+import asyncio
+import collections
+import functools
+import json
+import multiprocessing
+import os
+import socket
+import threading
+
+from results_store import result_from_record
+from results_store import result_record
+from timing import TurnBudgets
+from tournament import GameResult
+from tournament import _init_worker
+from tournament import game_settings
+from tournament import _play_match_in_worker
+from tournament import print_pool_report
+
+DEFAULT_PORT = 7777
+
+
+def parse_address(address, default_host="localhost"):
+    """
+    :param str address: "host:port", "port" or "host"
+    :return: (host, port)
+    """
+    host, _, port = address.rpartition(":")
+    if not port.isdigit():
+        host, port = address, DEFAULT_PORT
+    return host or default_host, int(port)
+
+
+def _encode(message):
+    return (json.dumps(message, separators=(",", ":")) + "\n").encode()
+
+
+class Coordinator:
+    """
+    Hands the games of a tournament to remote workers (see Tournament.play_all_games).
+
+    :param str host: The interface to listen on ("" for all of them)
+    :param int port: The port to listen on (0 for any free port)
+    :param float worker_timeout: Seconds of silence after which a worker is dead
+    """
+
+    def __init__(self, host="", port=DEFAULT_PORT, worker_timeout=600.0):
+        self.host = host
+        self.port = port
+        self.worker_timeout = worker_timeout
+        self.listening = threading.Event()  # set once workers can connect (port is then the real port)
+        self.workers = 0
+        self.redispatched = 0
+        self.stolen = 0
+        self.duplicates = 0
+
+    def play_all_games(self, tournament):
+        """
+        Play the unplayed games of the tournament on the workers, recording
+        their results as they arrive.
+
+        :param tournament: The Tournament
+        """
+        asyncio.run(self._serve(tournament))
+        for line in self.report():
+            print(line)
+
+    def report(self):
+        return ["Coordinator: {} workers, {} games re-dispatched, {} games stolen, {} duplicate results".format(
+            self.workers, self.redispatched, self.stolen, self.duplicates)]
+
+    async def _serve(self, tournament):
+        self.tournament = tournament
+        self.schedule = tournament.unplayed_games()
+        self.unfinished = {}  # game id -> game drawn from the schedule which isn't finished
+        self.pending = collections.deque()  # unfinished games which no worker is playing
+        self.players = collections.Counter()  # game id -> number of workers playing it
+        self.connections = set()
+        self.handlers = set()  # the tasks talking to the workers
+        self.changed = asyncio.Condition()
+        self.finished = asyncio.Event()
+        self.error = None  # an exception which stopped the tournament
+
+        tournament.print_win_data()
+        server = await asyncio.start_server(self._handle_worker, self.host, self.port)
+        self.port = server.sockets[0].getsockname()[1]
+        print("Coordinator listening on port", self.port)
+        self.listening.set()
+        await self._check_finished()
+        await self.finished.wait()
+
+        server.close()  # no new workers
+        for writer in list(self.connections):
+            writer.write(_encode({"type": "done"}))
+            writer.close()
+        # Workers accepted just before the server closed get their handlers in
+        # the next iterations of the event loop (which tell them it is over)
+        while True:
+            for _ in range(3):
+                await asyncio.sleep(0)
+            if not self.handlers:
+                break
+            await asyncio.gather(*self.handlers)
+        await server.wait_closed()
+        if self.error is not None:
+            raise self.error
+
+    def settings(self):
+        """:return: The settings message (the options of the matches)."""
+        t = self.tournament
+        return {"type": "settings", "time_limits": t.time_limits, "verbose": t.verbose, "show_map": t.show_map,
+                "replay_dir": t.replay_dir, "replay_stderr": t.replay_stderr, "memory_limit": t.memory_limit,
+                "turn_budgets": list(t.turn_budgets) if t.turn_budgets is not None else None}
+
+    async def _handle_worker(self, reader, writer):
+        """Talk to one worker until it has played its last game (or dies)."""
+        self.workers += 1
+        self.connections.add(writer)
+        self.handlers.add(asyncio.current_task())
+        games = {}  # game id -> game the worker is playing
+        request = None  # the task answering the last request of the worker
+        try:
+            while not self.finished.is_set():
+                # A worker waiting for games with none left to play is silent
+                waiting = request is not None and not request.done() and not games
+                try:
+                    line = await asyncio.wait_for(reader.readline(), None if waiting else self.worker_timeout)
+                    message = json.loads(line) if line else None
+                    if message is not None and message["type"] == "result":
+                        result = result_from_record(message["result"], GameResult)
+                except (asyncio.TimeoutError, ConnectionError, ValueError, KeyError, TypeError):
+                    message = None  # a dead (or broken) worker
+                if message is None:
+                    break
+                if message["type"] == "hello":
+                    writer.write(_encode(self.settings()))
+                elif message["type"] == "request":
+                    # Answered once there are games, reading the results in the meantime
+                    request = asyncio.ensure_future(self._send_batch(writer, games, message.get("size", 1)))
+                elif message["type"] == "result":
+                    await self._record(games, result)
+                try:
+                    await writer.drain()
+                except ConnectionError:
+                    break
+        except Exception as e:  # stop the tournament (not just this worker)
+            self.error = e
+            self.finished.set()
+        finally:
+            if request is not None:
+                request.cancel()
+            self.connections.discard(writer)
+            writer.close()
+            await self._release(games)
+            self.handlers.discard(asyncio.current_task())
+
+    async def _send_batch(self, writer, games, size):
+        """
+        Answer a request of a worker: send it a batch of games once there are
+        some, or "done" once the tournament is over.
+        """
+        batch = await self._next_batch(games, size)
+        writer.write(_encode({"type": "batch", "games": batch} if batch else {"type": "done"}))
+        try:
+            await writer.drain()
+        except ConnectionError:
+            pass  # the handler of the worker sees it is gone
+
+    async def _next_batch(self, games, size):
+        """
+        Wait for games for a worker.
+
+        :param dict games: The games of the worker (the batch is added to it)
+        :param int size: The most games to hand out
+        :return: list of games, empty once the tournament is over
+        """
+        async with self.changed:
+            while not self.finished.is_set():
+                batch = self._take_games(games, size)
+                if batch:
+                    for game in batch:
+                        games[game[0]] = game
+                        self.players[game[0]] += 1
+                    return [list(game) for game in batch]
+                await self.changed.wait()
+        return []
+
+    def _take_games(self, games, size):
+        """:return: Up to size games: those of dead workers, new ones, or (at the end) stolen ones."""
+        batch = []
+        while self.pending and len(batch) < size:
+            game = self.pending.popleft()
+            if game[0] in self.unfinished and not self.players[game[0]]:
+                batch.append(game)
+        while len(batch) < size:
+            game = next(self.schedule, None)
+            if game is None:
+                break
+            self.unfinished[game[0]] = game
+            batch.append(game)
+        if not batch:
+            # Steal the games which only one worker is playing, the last ones first
+            for game_id in sorted(self.unfinished, reverse=True):
+                if self.players[game_id] == 1 and game_id not in games:
+                    batch.append(self.unfinished[game_id])
+                    self.stolen += 1
+                    if len(batch) == size:
+                        break
+        return batch
+
+    async def _record(self, games, result):
+        """Record the result of a game played by a worker (unless another worker was first)."""
+        if games.pop(result.id_number, None) is not None:
+            self.players[result.id_number] -= 1
+        if self.unfinished.pop(result.id_number, None) is None:
+            self.duplicates += 1
+            return
+        self.tournament.record_result(result)
+        self.tournament.report_progress()
+        await self._check_finished()
+
+    async def _release(self, games):
+        """Hand the unfinished games of a dead (or finished) worker to the other workers."""
+        for game_id, game in games.items():
+            self.players[game_id] -= 1
+            if game_id in self.unfinished and not self.players[game_id]:
+                self.pending.append(game)
+                self.redispatched += 1
+        games.clear()
+        async with self.changed:
+            self.changed.notify_all()
+
+    async def _check_finished(self):
+        """Finish once every game of the schedule is played."""
+        if not self.unfinished:
+            game = next(self.schedule, None)
+            if game is None:
+                self.finished.set()
+            else:
+                self.unfinished[game[0]] = game
+                self.pending.append(game)
+        async with self.changed:
+            self.changed.notify_all()
+
+
+def run_worker(address, jobs=1, process_pool_type=None, output_sink=None):
+    """
+    Play the games of a coordinator until it has none left.
+
+    :param str address: "host:port" of the coordinator
+    :param int jobs: Number of matches to play at the same time
+    :param process_pool_type: The class of the pool which starts the player processes (or None)
+    :param output_sink: An output.NullSink or GameLogSink to print the matches to (or None)
+    :return: The number of games played
+    """
+    played = 0
+    worker_statistics = {}  # pid -> the statistics of the process pool of a pool worker
+    try:
+        with socket.create_connection(parse_address(address)) as connection, connection.makefile("rwb") as stream:
+            def send(message):
+                stream.write(_encode(message))
+                stream.flush()
+
+            def receive():
+                line = stream.readline()
+                return json.loads(line) if line else {"type": "done"}
+
+            send({"type": "hello"})
+            settings = receive()
+            if settings["type"] != "settings":
+                return played
+            turn_budgets = settings["turn_budgets"]
+            play = functools.partial(_play_match_in_worker, memory_limit=settings["memory_limit"],
+                                     turn_budgets=TurnBudgets(*turn_budgets) if turn_budgets else None,
+                                     output_sink=output_sink)
+            common_args = (settings["time_limits"], settings["verbose"], settings["show_map"],
+                           settings["replay_dir"], settings["replay_stderr"])
+            if settings["replay_dir"] is not None:
+                os.makedirs(settings["replay_dir"], exist_ok=True)
+
+            # The results are sent by the thread of the pool which gets them, so
+            # the connection and the counts are only used with this lock held
+            slots = threading.Condition()
+            playing = 0
+            errors = []  # the exceptions of the games (or of sending their results)
+
+            def game_over(outcome):
+                nonlocal played, playing
+                result, output, _, pool_statistics = outcome
+                with slots:
+                    if pool_statistics is not None:
+                        worker_statistics[pool_statistics[0]] = pool_statistics[1]
+                    print(output, end="")
+                    try:
+                        send({"type": "result", "result": result_record(result)})
+                        played += 1
+                    except ConnectionError as e:
+                        errors.append(e)
+                    playing -= 1
+                    slots.notify()
+
+            def game_failed(e):
+                nonlocal playing
+                with slots:
+                    errors.append(e)
+                    playing -= 1
+                    slots.notify()
+
+            with multiprocessing.Pool(jobs, _init_worker, (process_pool_type, None, game_settings())) as pool:
+                while True:
+                    # Ask for as many games as there are free processes
+                    with slots:
+                        slots.wait_for(lambda: playing < jobs or errors)
+                        if errors:
+                            raise errors[0]
+                        send({"type": "request", "size": jobs - playing})
+                    message = receive()
+                    if message["type"] != "batch":
+                        break  # the tournament is over (the games still running are moot)
+                    with slots:
+                        playing += len(message["games"])
+                    for game in message["games"]:
+                        pool.apply_async(play, (tuple(game) + common_args,), callback=game_over,
+                                         error_callback=game_failed)
+    except ConnectionError as e:
+        print("Lost the coordinator at", address, ":", e)
+    print_pool_report(process_pool_type, worker_statistics)
+    print("Worker played", played, "games")
+    return played
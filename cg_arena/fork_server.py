@@ -0,0 +1,141 @@
+"""
+A fork server ("zygote") which starts copies of one bot very quickly.
+
+Run as
+
+    python3 -u fork_server.py <socket fd> <bot>
+
+The server imports the modules the bot imports and compiles the bot script
+once.  Then for every request on the socket it forks a copy-on-write child
+which runs the bot.  A request carries the command line options of the bot
+and the three file descriptors to use as the child's stdin, stdout and
+stderr.  The server answers with the pid of the child.
+"""
+
+import ast
+import builtins
+import importlib
+import io
+import json
+import os
+import random
+import signal
+import socket
+import struct
+import sys
+import traceback
+import types
+
+PID_FORMAT = "!q"
+
+
+def imported_modules(source):
+    """
+    Find the top-level modules imported by a script.
+
+    :param source: The source code of the script
+    :return: A sorted list of module names
+    """
+    modules = set()
+    for node in ast.walk(ast.parse(source)):
+        if isinstance(node, ast.Import):
+            modules.update(alias.name for alias in node.names)
+        elif isinstance(node, ast.ImportFrom) and node.module and not node.level:
+            modules.add(node.module)
+    return sorted(modules)
+
+
+def preload(modules):
+    """Import the modules that can be imported."""
+    for name in modules:
+        try:
+            importlib.import_module(name)
+        except Exception:
+            pass
+
+
+def _text_stream(fd, mode):
+    """A fresh text stream on the file descriptor, unbuffered like python3 -u."""
+    if mode == "r":
+        return io.TextIOWrapper(open(fd, "rb", closefd=False))
+    return io.TextIOWrapper(open(fd, "wb", buffering=0, closefd=False),
+                            line_buffering=True, write_through=True)
+
+
+def run_child(code, program_name, options, fds):
+    """
+    Run the bot in the forked child.  Never returns.
+
+    :param code: The compiled bot script
+    :param str program_name: The path of the bot script
+    :param options: The command line options passed to the bot
+    :param fds: The stdin, stdout and stderr file descriptors of the child
+    """
+    exit_code = 0
+    try:
+        signal.signal(signal.SIGCHLD, signal.SIG_DFL)
+        for target, fd in enumerate(fds):
+            os.dup2(fd, target)
+            os.close(fd)
+        sys.stdin = _text_stream(0, "r")
+        sys.stdout = _text_stream(1, "w")
+        sys.stderr = _text_stream(2, "w")
+        sys.argv = [program_name] + options
+
+        # The children must not all share the random state of the server
+        random.seed()
+        if "numpy" in sys.modules:
+            sys.modules["numpy"].random.seed()
+
+        main = types.ModuleType("__main__")
+        main.__file__ = program_name
+        main.__builtins__ = builtins
+        sys.modules["__main__"] = main
+        exec(code, main.__dict__)
+    except SystemExit as e:
+        exit_code = e.code if isinstance(e.code, int) else 1
+    except BaseException as e:
+        # Print the traceback without the frames of this wrapper
+        traceback.print_exception(type(e), e, e.__traceback__.tb_next)
+        exit_code = 1
+    finally:
+        try:
+            sys.stdout.flush()
+            sys.stderr.flush()
+        finally:
+            os._exit(exit_code)
+
+
+def serve(sock, program_name):
+    """
+    Answer requests for new children until the socket is closed.
+
+    :param sock: The socket connected to the arena
+    :param str program_name: The path of the bot script
+    """
+    with open(program_name, "rb") as f:
+        source = f.read()
+    sys.path[0] = os.path.dirname(os.path.abspath(program_name))
+    preload(imported_modules(source))
+    code = compile(source, program_name, "exec")
+
+    signal.signal(signal.SIGCHLD, signal.SIG_IGN)  # children are reaped automatically
+
+    while True:
+        message, fds, _, _ = socket.recv_fds(sock, 4096, 3)
+        if not message:
+            return
+        options = json.loads(message.decode())
+
+        pid = os.fork()
+        if pid == 0:
+            sock.close()
+            run_child(code, program_name, options, fds)
+
+        for fd in fds:
+            os.close(fd)
+        sock.sendall(struct.pack(PID_FORMAT, pid))
+
+
+if __name__ == "__main__":
+    serve(socket.socket(fileno=int(sys.argv[1])), sys.argv[2])
@@ -9,16 +9,85 @@ import numpy as np
 from game.ww import BoardState
 from game.ww import MOVES
 from game.ww import WARNINGS
+from game.ww.bitboard import BitBoardState
+from game.ww.transposition import TRANSPOSITION_CACHE
 
 from game_abc import GameABC
 
 
+# The implementations of the board state (all give exactly the same games)
+ENGINES = {"numpy": BoardState,
+           "bitboard": BitBoardState.from_grid}
+
+
+def initial_position(config_str):
+    """
+    Build the starting position of a game from its configuration string.
+
+    :param str config_str: The configuration string (fields after the seed are ignored)
+    :return: The size of the map, the numpy grid (heights, -1 for holes)
+             and the positions of the four units (the first player's two first)
+    """
+    map_index_str, seed_str = config_str.split(';')[:2]
+    map_index = int(map_index_str.split('=')[1])
+    seed = int(seed_str.split("=")[1])
+    np.random.seed(seed)
+
+    # grid
+    if map_index == 0:
+        size = 5
+        grid = np.zeros((7, 7),dtype=int)
+        grid[5,:] = -1
+        grid[6,:] = -1
+        grid[:,5] = -1
+        grid[:,6] = -1
+    elif map_index == 1:
+        size = 7
+        grid = np.array([[-1,-1,-1, 0,-1,-1,-1,-1,-1],
+                         [-1,-1, 0, 0, 0,-1,-1,-1,-1],
+                         [-1, 0, 0, 0, 0, 0,-1,-1,-1],
+                         [ 0, 0, 0, 0, 0, 0, 0,-1,-1],
+                         [-1, 0, 0, 0, 0, 0,-1,-1,-1],
+                         [-1,-1, 0, 0, 0,-1,-1,-1,-1],
+                         [-1,-1,-1, 0,-1,-1,-1,-1,-1],
+                         [-1,-1,-1,-1,-1,-1,-1,-1,-1],
+                         [-1,-1,-1,-1,-1,-1,-1,-1,-1]],dtype=int)
+    elif map_index == 2:
+        size = 6
+        grid = np.zeros((8, 8),dtype=int)
+        grid[6,:] = -1
+        grid[7,:] = -1
+        grid[:,6] = -1
+        grid[:,7] = -1
+        # remove one element
+        x = np.random.randint(3)
+        y = np.random.randint(6)
+        grid[x,y] = -1
+        grid[6-x-1,y] = -1
+        # flip remining bits with one percent probability
+        prob = np.random.randint(0, 70, size=(8,8))
+        remove = (prob == 0) | (prob[[5,4,3,2,1,0,7,6],:] == 0)
+        grid[remove] = -1
+
+    # player locations
+    x, y = np.indices(grid.shape)
+    x = x[grid == 0]
+    y = y[grid == 0]
+    indx = np.random.choice(np.arange(x.size), 4, replace=False)
+    player_units = list(zip(x[indx], y[indx]))
+
+    return size, grid, player_units
+
+
 class Game(GameABC):
 
     MIN_PLAYERS = 1  # One player is allowed for debugging purposes and end game analysis
     MAX_PLAYERS = 2  # WW played with 2 players
     WARNINGS = WARNINGS  # Special debug codes
 
+    engine = "numpy"  # The key in ENGINES of the board state used by new games
+    corpus = None  # A game.corpus.Corpus to read the starting positions from (or None)
+
     @staticmethod
     def random_configuration(rng):
         """
@@ -39,6 +108,15 @@ class Game(GameABC):
 
         return config_str
 
+    @staticmethod
+    def report():
+        """
+        :return: The transposition cache statistics (if the cache is on and was used)
+        """
+        if TRANSPOSITION_CACHE.maxsize and TRANSPOSITION_CACHE.hits + TRANSPOSITION_CACHE.misses:
+            return [TRANSPOSITION_CACHE.summary()]
+        return []
+
     def __init__(self, config_str):
         """
         Read in a configuration string (generated by the random_configuration
@@ -49,56 +127,11 @@ class Game(GameABC):
         """
 
         self._config_str = config_str
-
-        map_index_str, seed_str = self._config_str.split(';')
-        map_index = int(map_index_str.split('=')[1])
-        seed = int(seed_str.split("=")[1])
-        np.random.seed(seed)
-
         self.units_per_player = 2
-
-        # grid
-        if map_index == 0:
-            self.size = 5
-            grid = np.zeros((7, 7),dtype=int)
-            grid[5,:] = -1
-            grid[6,:] = -1
-            grid[:,5] = -1
-            grid[:,6] = -1
-        elif map_index == 1:
-            self.size = 7
-            grid = np.array([[-1,-1,-1, 0,-1,-1,-1,-1,-1],
-                             [-1,-1, 0, 0, 0,-1,-1,-1,-1],
-                             [-1, 0, 0, 0, 0, 0,-1,-1,-1],
-                             [ 0, 0, 0, 0, 0, 0, 0,-1,-1],
-                             [-1, 0, 0, 0, 0, 0,-1,-1,-1],
-                             [-1,-1, 0, 0, 0,-1,-1,-1,-1],
-                             [-1,-1,-1, 0,-1,-1,-1,-1,-1],
-                             [-1,-1,-1,-1,-1,-1,-1,-1,-1],
-                             [-1,-1,-1,-1,-1,-1,-1,-1,-1]],dtype=int)
-        elif map_index == 2:
-            self.size = 6
-            grid = np.zeros((8, 8),dtype=int)
-            grid[6,:] = -1
-            grid[7,:] = -1
-            grid[:,6] = -1
-            grid[:,7] = -1
-            # remove one element
-            x = np.random.randint(3)
-            y = np.random.randint(6)
-            grid[x,y] = -1
-            grid[6-x-1,y] = -1
-            # flip remining bits with one percent probability
-            prob = np.random.randint(0, 70, size=(8,8))
-            remove = (prob == 0) | (prob[[5,4,3,2,1,0,7,6],:] == 0)
-            grid[remove] = -1
-
-        # player locations
-        x, y = np.indices(grid.shape)
-        x = x[grid == 0]
-        y = y[grid == 0]
-        indx = np.random.choice(np.arange(x.size), 4, replace=False)
-        player_units = list(zip(x[indx], y[indx]))
+        position = self.corpus.initial_position(config_str) if self.corpus is not None else None
+        if position is None:
+            position = initial_position(config_str)
+        self.size, grid, player_units = position
 
         #
         # Information which changes each turn specific the the game
@@ -106,7 +139,7 @@ class Game(GameABC):
 
         self.turn = 0
 
-        self.board_state = BoardState(grid, player_units[:2], player_units[2:], my_score=0, op_score=0, turn=0, active_players=[True, True])
+        self.board_state = ENGINES[self.engine](grid, player_units[:2], player_units[2:], my_score=0, op_score=0, turn=0, active_players=[True, True])
 
     def init_inputs(self, player):
         """
@@ -146,6 +179,15 @@ class Game(GameABC):
         """
         return [self.board_state.turn_input()]
 
+    def legal_actions(self, player):
+        """
+        Return the legal action strings of the player, in a fixed order.
+
+        :param int player: Player number (should always be the same as current player)
+        :return: A list of strings (the order they are given to the player)
+        """
+        return [str(a) for a in self.board_state.legal_actions]
+
     def validate_output(self, stdout_stream):
         """
         Validate the the output given by the player is of the correct form.
@@ -189,7 +231,7 @@ class Game(GameABC):
                 action_str = "ACCEPT-DEFEAT"
             else:
                 action_str = " ".join(move[:4])
-                if action_str not in [str(a) for a in self.board_state.legal_actions]:
+                if not self.board_state.is_legal(action_str):
                     message += "played " + raw_move + " which is not in list of legal moves."
                     issue_flag = True
                     action_str = None
@@ -221,11 +263,29 @@ class Game(GameABC):
         """
         return [self.board_state.scores[i^self.board_state.current_player_id] for i in range(2)]
 
-    def print_game(self):
+    def print_game(self, file=None):
         """
         (Optional) Print a game board or some other representation of the game state.
         Only used with show_map.
 
         This is used in conjunction with the show map attribute.
+
+        Each cell is its height ('.' for holes) followed by the unit on it, if
+        any: A and B are the units of player 0, Y and Z those of player 1.
+
+        :param file: The text stream to print to (None for sys.stdout)
         """
-        pass
+        board_state = self.board_state
+        units = {}
+        for i, player_units in enumerate(board_state.player_units):
+            player = i ^ board_state.current_player_id
+            for index, (x, y) in enumerate(player_units):
+                units[int(x), int(y)] = ("AB", "YZ")[player][index]
+
+        rows = board_state.input_grid().split("\n")
+        print(("    " + "".join("{:<3}".format(x) for x in range(len(rows[0])))).rstrip(), file=file)
+        for y, row in enumerate(rows):
+            print(("{:>2}  ".format(y) + "".join(height + units.get((x, y), " ") + " "
+                                                 for x, height in enumerate(row))).rstrip(), file=file)
+        scores = self.score_game()
+        print("Scores: player 0 (AB): {}, player 1 (YZ): {}".format(scores[0], scores[1]), file=file)
@@ -0,0 +1,97 @@
+"""
+A corpus of precomputed game configurations.
+
+The corpus is a file of fixed size records, one per configuration, holding
+the configuration string and the decoded starting position (grid and unit
+positions).  It is memory-mapped, so configuration i is read in O(1) without
+seeding NumPy and building the map, and the same file gives exactly the
+same benchmark set on every machine.
+
+The configuration strings of a corpus end with ";corpus=<i>".  With the
+corpus loaded, Game reads the starting position from record i.  Without it,
+the rest of the string still builds the same game from its seed.
+"""
+
+import numpy as np
+
+from game import initial_position
+
+MAGIC = b"CGARENA-CORPUS-1"
+HEADER = np.dtype([("magic", "S16"), ("count", "<u8"), ("record_size", "<u8")])
+GRID_SIDE = 9  # the largest map grid (smaller grids are padded with holes)
+RECORD = np.dtype([("config", "S32"),
+                   ("size", "u1"), ("rows", "u1"), ("cols", "u1"),
+                   ("grid", "i1", (GRID_SIDE, GRID_SIDE)),
+                   ("units", "u1", (4, 2))])
+
+
+def corpus_config_str(config_str, index):
+    """:return: The configuration string of record index of a corpus."""
+    return "{};corpus={}".format(config_str, index)
+
+
+def write_corpus(path, config_strs):
+    """
+    Decode the configurations and write them to a corpus file.
+
+    :param str path: The corpus file (overwritten)
+    :param config_strs: The configuration strings (without ";corpus=")
+    """
+    config_strs = list(config_strs)
+    records = np.zeros(len(config_strs), dtype=RECORD)
+    records["grid"] = -1
+    for i, config_str in enumerate(config_strs):
+        size, grid, player_units = initial_position(config_str)
+        record = records[i]
+        record["config"] = config_str.encode()
+        record["size"] = size
+        record["rows"], record["cols"] = grid.shape
+        record["grid"][:grid.shape[0], :grid.shape[1]] = grid
+        record["units"] = player_units
+
+    header = np.array([(MAGIC, len(records), RECORD.itemsize)], dtype=HEADER)
+    with open(path, "wb") as f:
+        f.write(header.tobytes())
+        f.write(records.tobytes())
+
+
+class Corpus:
+    """
+    A memory-mapped corpus file.
+
+    :param str path: A file written by write_corpus
+    :raises ValueError: if the file is not a corpus
+    """
+
+    def __init__(self, path):
+        self.path = path
+        header = np.fromfile(path, dtype=HEADER, count=1)
+        if len(header) != 1 or header["magic"][0] != MAGIC or header["record_size"][0] != RECORD.itemsize:
+            raise ValueError("Not a corpus file")
+        count = int(header["count"][0])
+        self.records = np.memmap(path, dtype=RECORD, mode="r", offset=HEADER.itemsize, shape=(count,))
+
+    def __len__(self):
+        return len(self.records)
+
+    def config_str(self, index):
+        """:return: The configuration string of the index-th configuration."""
+        return corpus_config_str(self.records[index]["config"].decode(), index)
+
+    def initial_position(self, config_str):
+        """
+        Read the starting position of a configuration of the corpus.
+
+        :param str config_str: A configuration string returned by config_str
+        :return: (size, grid, player_units) like game.initial_position, or
+                 None if the configuration is not in this corpus
+        """
+        base, _, index_str = config_str.rpartition(";corpus=")
+        if not index_str.isdigit() or int(index_str) >= len(self.records):
+            return None
+        record = self.records[int(index_str)]
+        if record["config"].decode() != base:
+            return None
+        grid = record["grid"][:record["rows"], :record["cols"]].astype(int)
+        player_units = [tuple(int(c) for c in unit) for unit in record["units"]]
+        return int(record["size"]), grid, player_units
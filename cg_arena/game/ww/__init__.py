@@ -1,5 +1,8 @@
 import random
 
+from game.ww.transposition import TRANSPOSITION_CACHE
+from game.ww.transposition import ZobristKeys
+
 ###################
 # System Settings #
 ###################
@@ -33,6 +36,8 @@ PUSH_DIR_2_OPTIONS = {'W':('SW', 'W', 'NW'),
 
 MOVES = {"ACCEPT-DEFEAT", "MOVE&BUILD", "PUSH&BUILD"}
 
+UNITS_PER_PLAYER = 2
+
 ############
 # Warnings #
 ############
@@ -45,20 +50,70 @@ WARNINGS = {"OUT OF TIME", "OUT_OF_TIME:", "Warning:"}
 ################
 
 class Action:
+    __slots__ = ("type", "index", "dir_1", "dir_2", "rank", "_str")
+
     def __init__(self, atype, index, dir_1, dir_2):
         self.type = atype
         self.index = int(index)
         self.dir_1 = dir_1
         self.dir_2 = dir_2
+        self.rank = None  # position in ACTION_TABLE
+        self._str = "{} {} {} {}".format(self.type, self.index, self.dir_1, self.dir_2)
 
     def __str__(self):
-        return "{} {} {} {}".format(self.type, self.index, self.dir_1, self.dir_2)
+        return self._str
+
+
+def _build_action_table():
+    """
+    Create one Action for every possible action, sorted by their strings.
+
+    The sort order is the order legal actions are given to the players, so
+    sorting actions is sorting their ranks.
+    """
+    actions = []
+    for index in range(UNITS_PER_PLAYER):
+        for dir_1 in DIRECTIONS:
+            actions.extend(Action("MOVE&BUILD", index, dir_1, dir_2) for dir_2 in DIRECTIONS)
+            actions.extend(Action("PUSH&BUILD", index, dir_1, dir_2) for dir_2 in PUSH_DIR_2_OPTIONS[dir_1])
+    actions.sort(key=str)
+    for rank, action in enumerate(actions):
+        action.rank = rank
+    return actions
+
+
+# Shared (flyweight) actions, never create an Action anywhere else
+ACTION_TABLE = _build_action_table()
+ACTIONS = {(a.type, a.index, a.dir_1, a.dir_2): a for a in ACTION_TABLE}
+ACTIONS_BY_STR = {str(a): a for a in ACTION_TABLE}
 
 
 ####################
 # BoardState class #
 ####################
 
+# The character of each height in the turn input (holes are -1)
+_HEIGHT_CHARS = {-1: '.', 0: '0', 1: '1', 2: '2', 3: '3', 4: '4'}
+# The "x y" strings of the unit positions
+_COORDINATE_STRS = {}
+
+
+def render_grid_rows(grid):
+    """
+    :param grid: The numpy grid (with its two rows and columns of padding)
+    :return: The rows of the grid in the turn input, as a list of strings
+    """
+    size = grid.shape[0] - 2
+    return ["".join(_HEIGHT_CHARS[h] for h in column) for column in grid[:size, :size].T.tolist()]
+
+
+def coordinate_str(pos):
+    """:return: The "x y" string of a position"""
+    s = _COORDINATE_STRS.get(pos)
+    if s is None:
+        s = _COORDINATE_STRS[pos] = "{} {}".format(*pos)
+    return s
+
 def move_by(pos, direction):
     x, y = pos
     dx, dy = DIRECTIONS[direction]
@@ -67,18 +122,71 @@ def move_by(pos, direction):
 def unit_dist(unit_1, unit_2):
     return max(abs(unit_1[0] - unit_2[0]), abs(unit_1[1] - unit_2[1]))
 
+def _patch_row(rows, pos, height):
+    """Set the character of the cell pos to height in the rendered rows."""
+    x, y = pos
+    row = rows[y]
+    rows[y] = row[:x] + _HEIGHT_CHARS[int(height)] + row[x + 1:]
+
+
 class BoardState:
-    def __init__(self, grid, my_units, op_units, my_score=0, op_score=0, turn=0, active_players=[True, True], current_player_id=0):
+    def __init__(self, grid, my_units, op_units, my_score=0, op_score=0, turn=0, active_players=[True, True], current_player_id=0, grid_hash=None, grid_rows=None):
         self.turn = turn
         self.active_players = active_players
         self.grid = grid
+        # The rendered rows of the grid: rendered once for the first position of
+        # a game, then patched by next_board_state (see input_grid)
+        self._grid_rows = render_grid_rows(grid) if grid_rows is None else grid_rows
         self.player_units = [my_units, op_units]
-        self.io_units = [my_units, [u if self.is_visible(u) else (-1,-1) for u in op_units]]
-        self.visible_units = [my_units, [u for u in op_units if self.is_visible(u)]]
-        self.legal_actions = self.my_legal_actions()
+        self._io_units = None
+        self._visible_units = None
+
+        # Look up the legal actions (and turn input) of this position in the
+        # transposition cache, computing them only if they are not there (the
+        # list of actions and the turn input only once they are needed)
+        self.zobrist = ZobristKeys.for_grid_size(grid.shape[0])
+        self.grid_hash = self.zobrist.grid_hash(grid) if grid_hash is None else grid_hash
+        self.state_hash = self.grid_hash ^ self.zobrist.units_hash(my_units + op_units)
+        self._cache_entry = TRANSPOSITION_CACHE.get(self.state_hash)
+        if self._cache_entry is None:
+            self._cache_entry = [self.my_legal_mask(), None, None]  # [legal mask, legal actions, turn input]
+            TRANSPOSITION_CACHE.put(self.state_hash, self._cache_entry)
+
+        self.legal_mask = self._cache_entry[0]  # bit i is set if ACTION_TABLE[i] is legal
         self.scores = [my_score, op_score]
         self.current_player_id = current_player_id
 
+    @property
+    def legal_actions(self):
+        """The legal actions (sorted), built from the mask once per position"""
+        if self._cache_entry[1] is None:
+            self._cache_entry[1] = self.my_legal_actions()
+        return self._cache_entry[1]
+
+    @property
+    def io_units(self):
+        """The units as the current player sees them ((-1, -1) if not visible)"""
+        if self._io_units is None:
+            my_units, op_units = self.player_units
+            self._io_units = [my_units, [u if self.is_visible(u) else (-1,-1) for u in op_units]]
+        return self._io_units
+
+    @property
+    def visible_units(self):
+        """The units the current player can see"""
+        if self._visible_units is None:
+            my_units, op_units = self.player_units
+            self._visible_units = [my_units, [u for u in op_units if self.is_visible(u)]]
+        return self._visible_units
+
+    def is_legal(self, action_str):
+        """
+        :param str action_str: An action string (any string)
+        :return: True if it is one of the legal actions
+        """
+        action = ACTIONS_BY_STR.get(action_str)
+        return action is not None and bool(self.legal_mask >> action.rank & 1)
+
     def is_visible(self, unit):
         my_units = self.player_units[0]
         return min(unit_dist(unit, u) for u in my_units) <= 1
@@ -92,13 +200,17 @@ class BoardState:
         new_turn = self.turn + 1
         new_my_active = self.active_players[0]
         new_op_active = self.active_players[1]
+        new_grid_hash = self.grid_hash
 
-        if action_str not in [str(a) for a in self.legal_actions]:
+        if not self.is_legal(action_str):
             # swap order and deactivate player
             new_my_active = False
-            return BoardState(new_grid, new_op_units, new_my_units, my_score=new_op_score, op_score=new_my_score, turn=new_turn, active_players=[new_op_active, new_my_active], current_player_id=self.current_player_id^1)
+            return BoardState(new_grid, new_op_units, new_my_units, my_score=new_op_score, op_score=new_my_score, turn=new_turn, active_players=[new_op_active, new_my_active], current_player_id=self.current_player_id^1, grid_hash=new_grid_hash, grid_rows=self._grid_rows)
         else:
-            action = Action(*action_str.split())
+            action = ACTIONS_BY_STR[action_str]
+
+        # Patch the rows of the grid instead of rendering them again
+        new_grid_rows = list(self._grid_rows)
 
         unit = new_my_units[action.index]
         first_pos = move_by(unit, action.dir_1)
@@ -112,6 +224,8 @@ class BoardState:
                 op_index = new_op_units.index(first_pos)
                 new_op_units[op_index] = second_pos
                 new_grid[first_pos] += 1
+                new_grid_hash ^= self.zobrist.cell_key(first_pos, new_grid[first_pos] - 1) ^ self.zobrist.cell_key(first_pos, new_grid[first_pos])
+                _patch_row(new_grid_rows, first_pos, new_grid[first_pos])
         else: #MOVE&BUILD
             new_my_units[action.index] = first_pos
             if new_grid[first_pos] == 3:
@@ -121,59 +235,76 @@ class BoardState:
                 pass
             else:
                 new_grid[second_pos] += 1
+                new_grid_hash ^= self.zobrist.cell_key(second_pos, new_grid[second_pos] - 1) ^ self.zobrist.cell_key(second_pos, new_grid[second_pos])
+                _patch_row(new_grid_rows, second_pos, new_grid[second_pos])
 
         if new_op_active:
             # swap my_units/score and op_units/score
-            return BoardState(new_grid, new_op_units, new_my_units, my_score=new_op_score, op_score=new_my_score, turn=new_turn, active_players=[new_op_active, new_my_active], current_player_id=self.current_player_id^1)
+            return BoardState(new_grid, new_op_units, new_my_units, my_score=new_op_score, op_score=new_my_score, turn=new_turn, active_players=[new_op_active, new_my_active], current_player_id=self.current_player_id^1, grid_hash=new_grid_hash, grid_rows=new_grid_rows)
         else:
-            return BoardState(new_grid, new_my_units, new_op_units, my_score=new_my_score, op_score=new_op_score, turn=new_turn, active_players=[new_my_active, new_op_active], current_player_id=self.current_player_id)
+            return BoardState(new_grid, new_my_units, new_op_units, my_score=new_my_score, op_score=new_op_score, turn=new_turn, active_players=[new_my_active, new_op_active], current_player_id=self.current_player_id, grid_hash=new_grid_hash, grid_rows=new_grid_rows)
 
     def my_legal_actions(self):
-        legal_actions = []
+        """
+        :return: The legal actions (sorted), built from self.legal_mask, as a tuple
+        """
+        mask = self.legal_mask
+        return tuple(a for a in ACTION_TABLE if mask >> a.rank & 1) if mask else ()
+
+    def my_legal_mask(self):
+        """
+        :return: The legal actions as a bitmask of ranks in ACTION_TABLE
+        """
+        mask = 0
+        visible_units = self.visible_units
         for index, u in enumerate(self.player_units[0]):
             height = self.grid[u]
             for dir_1 in DIRECTIONS:
                 pos_1 = move_by(u, dir_1)
-                if pos_1 in self.visible_units[1]:
+                if pos_1 in visible_units[1]:
                     #push
                     atype = "PUSH&BUILD"
                     for dir_2 in PUSH_DIR_2_OPTIONS[dir_1]:
                         pos_2 = move_by(pos_1, dir_2)
                         if (0 <= self.grid[pos_2] <= min(3, self.grid[pos_1]+1)
-                            and pos_2 not in self.visible_units[0]
-                            and pos_2 not in self.visible_units[1]):
-                            legal_actions.append(Action(atype, index, dir_1, dir_2))
-                elif 0 <= self.grid[pos_1] <= min(3, height+1) and pos_1 not in self.visible_units[0]:
+                            and pos_2 not in visible_units[0]
+                            and pos_2 not in visible_units[1]):
+                            mask |= 1 << ACTIONS[atype, index, dir_1, dir_2].rank
+                elif 0 <= self.grid[pos_1] <= min(3, height+1) and pos_1 not in visible_units[0]:
                     atype = "MOVE&BUILD"
                     for dir_2 in DIRECTIONS:
                         pos_2 = move_by(pos_1, dir_2)
                         if (pos_2 == u
                             or (0 <= self.grid[pos_2] <= 3
-                                and pos_2 not in self.visible_units[0]
-                                and pos_2 not in self.visible_units[1])):
-                            legal_actions.append(Action(atype, index, dir_1, dir_2))
+                                and pos_2 not in visible_units[0]
+                                and pos_2 not in visible_units[1])):
+                            mask |= 1 << ACTIONS[atype, index, dir_1, dir_2].rank
 
-        legal_actions.sort(key=str)
-        return legal_actions
+        return mask
 
     def input_grid(self):
-        rows = []
-        for y in range(self.grid.shape[1]-2):
-            row = []
-            for x in range(self.grid.shape[0]-2):
-                if self.grid[x,y] == -1:
-                    row.append('.')
-                else:
-                    row.append(str(self.grid[x,y]))
-            rows.append("".join(row))
-        return "\n".join(rows)
+        """
+        :return: The grid in the turn input.  Its rows are rendered for the
+                 first position and then patched by next_board_state for the
+                 cells built on, even when the turn input of a position comes
+                 from the transposition cache.
+        """
+        return "\n".join(self._grid_rows)
 
     def turn_input(self):
+        """
+        :return: The turn input text (rendered once per position and cached)
+        """
+        if self._cache_entry[2] is None:
+            self._cache_entry[2] = self.render_turn_input()
+        return self._cache_entry[2]
+
+    def render_turn_input(self):
         lines = []
         lines.append(self.input_grid())
         for units in self.io_units:
             for u in units:
-                lines.append("{} {}".format(*u))
+                lines.append(coordinate_str(u))
         lines.append(str(len(self.legal_actions)))
         for a in self.legal_actions:
             lines.append(str(a))
@@ -0,0 +1,384 @@
+"""
+A batched Wondev Woman engine for stepping many games at once with NumPy.
+
+BatchBoardState holds K games (lanes) in stacked arrays and computes legal
+moves and transitions for all of them in vectorized operations.  It is meant
+for engine-side work (random playouts, baseline policies, data generation),
+not for playing matches against bots.
+
+Every lane follows BoardState exactly: lane(k) is the BoardState that the
+same configuration and the same actions give.
+
+ - Actions are ranks in ACTION_TABLE (which is the order of the sorted legal
+   action list sent to the players).  ACCEPT_DEFEAT (-1), or any action that
+   is not legal, deactivates the current player like in BoardState.
+ - Like in BitBoardState, the grids are flat with PADDING cells of holes on
+   every side (and padded to the largest grid of the batch), so moving in a
+   direction is adding an offset.  Holes have height VOID, which fails every
+   height test.
+"""
+
+import numpy as np
+
+from game.ww import ACTION_TABLE
+from game.ww import ACTIONS_BY_STR
+from game.ww import BoardState
+from game.ww import DIRECTIONS
+
+VOID = 255  # height of holes and of the padding around the grids
+PADDING = 2  # unit positions are at most two steps from a playable cell
+
+ACCEPT_DEFEAT = -1  # The action rank of ACCEPT-DEFEAT (and of any illegal action)
+MAX_TURNS = 400  # Game ends the game after this many turns
+
+NUM_ACTIONS = len(ACTION_TABLE)
+ACTION_INDEX = np.array([a.index for a in ACTION_TABLE], dtype=np.intp)  # which of my units moves
+ACTION_IS_PUSH = np.array([a.type == "PUSH&BUILD" for a in ACTION_TABLE])
+_DIRECTION_NAMES = tuple(DIRECTIONS)
+_NEAR_STEPS = [(dx, dy) for dx in range(-2, 3) for dy in range(-2, 3)]
+
+
+def _action_columns():
+    """
+    Return, for every action rank, its column in the table of limits and in
+    the table of free heights built by BatchBoardState._legality_tables.
+
+    Limits are per (unit index, first direction) pair: the first 16 columns
+    are for pushes and the next 16 for moves.  Free heights are per unit
+    index and cell within two steps of the unit (25 columns per unit).
+    """
+    limit_columns = []
+    near_columns = []
+    for a in ACTION_TABLE:
+        (dx_1, dy_1), (dx_2, dy_2) = DIRECTIONS[a.dir_1], DIRECTIONS[a.dir_2]
+        group = a.index * 8 + _DIRECTION_NAMES.index(a.dir_1)
+        limit_columns.append(group if a.type == "PUSH&BUILD" else 16 + group)
+        near_columns.append(a.index * 25 + _NEAR_STEPS.index((dx_1 + dx_2, dy_1 + dy_2)))
+    return np.array(limit_columns, dtype=np.intp), np.array(near_columns, dtype=np.intp)
+
+
+ACTION_LIMIT_COLUMN, ACTION_NEAR_COLUMN = _action_columns()
+ACTION_IS_BACK_MOVE = np.array([a.type == "MOVE&BUILD"
+                                and tuple(-d for d in DIRECTIONS[a.dir_1]) == DIRECTIONS[a.dir_2]
+                                for a in ACTION_TABLE])  # builds where the unit was
+
+
+class BatchLayout:
+    """
+    Precomputed cell offsets for one padded grid side.
+
+    :param int side: The width (and height) of the padded grid
+    """
+
+    _layouts = {}
+
+    def __init__(self, side):
+        self.side = side
+        self.cell_count = side * side
+
+        # For each action rank, the step from the moving unit to the cell it
+        # moves to (or pushes), and from there to the cell it builds on (or
+        # pushes the opponent to)
+        self.first_offset = np.array([self.offset(a.dir_1) for a in ACTION_TABLE], dtype=np.intp)
+        self.second_offset = np.array([self.offset(a.dir_2) for a in ACTION_TABLE], dtype=np.intp)
+
+        # The cells of the columns of the limit and free height tables, as
+        # (which of my units, offset from that unit)
+        self.group_units = np.repeat([0, 1], 8)
+        self.group_offsets = np.tile([self.offset(d) for d in _DIRECTION_NAMES], 2)
+        self.near_units = np.repeat([0, 1], len(_NEAR_STEPS))
+        self.near_offsets = np.tile([dx * side + dy for dx, dy in _NEAR_STEPS], 2)
+
+        # near[c, d] is True if cells c and d are at most one step apart
+        x, y = np.divmod(np.arange(self.cell_count), side)
+        self.near = np.maximum(np.abs(x[:, None] - x[None, :]), np.abs(y[:, None] - y[None, :])) <= 1
+
+    @classmethod
+    def for_side(cls, side):
+        layout = cls._layouts.get(side)
+        if layout is None:
+            layout = cls._layouts[side] = cls(side)
+        return layout
+
+    def offset(self, direction):
+        dx, dy = DIRECTIONS[direction]
+        return dx * self.side + dy
+
+    def cell(self, x, y):
+        return (x + PADDING) * self.side + y + PADDING
+
+    def position(self, c):
+        return (c // self.side - PADDING, c % self.side - PADDING)
+
+
+class BatchBoardState:
+    """
+    The states of K Wondev Woman games, each from the point of view of its
+    current player (like BoardState).
+
+    Build the first state with BatchBoardState.from_configs (or from_board_states)
+    and step it with next_board_states.
+
+    :param layout: The BatchLayout of the padded grid
+    :param heights: uint8 array [K, cell_count] of heights (VOID for holes)
+    :param units: int array [K, 4] of unit cells (my two units, then the opponent's)
+    :param scores: int array [K, 2] (my score, the opponent's score)
+    :param active_players: bool array [K, 2] (me, the opponent)
+    :param current_player_id: int array [K]
+    :param turn: int array [K]
+    :param grid_sizes: int array [K] of the (unpadded) numpy grid size of each lane
+    """
+
+    def __init__(self, layout, heights, units, scores, active_players, current_player_id, turn, grid_sizes):
+        self.layout = layout
+        self.heights = heights
+        self.units = units
+        self.scores = scores
+        self.active_players = active_players
+        self.current_player_id = current_player_id
+        self.turn = turn
+        self.grid_sizes = grid_sizes
+        self._legal_mask = None
+        self._tables = None
+
+    def __len__(self):
+        return len(self.units)
+
+    @classmethod
+    def from_board_states(cls, board_states):
+        """
+        Stack BoardStates into a batch.
+
+        :param board_states: A list of BoardState
+        """
+        grid_sizes = np.array([b.grid.shape[0] for b in board_states], dtype=np.int32)
+        layout = BatchLayout.for_side(grid_sizes.max() + 2 * PADDING)
+        k = len(board_states)
+        grids = np.full((k, layout.side, layout.side), VOID, dtype=np.uint8)
+        units = np.empty((k, 4), dtype=np.intp)
+        for lane, b in enumerate(board_states):
+            size = b.grid.shape[0]
+            grids[lane, PADDING:PADDING + size, PADDING:PADDING + size] = np.where(b.grid >= 0, b.grid, VOID)
+            units[lane] = [layout.cell(x, y) for x, y in b.player_units[0] + b.player_units[1]]
+
+        return cls(layout,
+                   grids.reshape(k, layout.cell_count),
+                   units,
+                   np.array([b.scores for b in board_states], dtype=np.int32),
+                   np.array([b.active_players for b in board_states], dtype=bool),
+                   np.array([b.current_player_id for b in board_states], dtype=np.int8),
+                   np.array([b.turn for b in board_states], dtype=np.int32),
+                   grid_sizes)
+
+    @classmethod
+    def from_configs(cls, config_strs):
+        """
+        Build the starting states of a batch of games.
+
+        :param config_strs: A list of configuration strings (from Game.random_configuration)
+        """
+        from game import initial_position  # game imports game.ww
+
+        board_states = []
+        for config_str in config_strs:
+            _, grid, player_units = initial_position(config_str)
+            board_states.append(BoardState(grid, player_units[:2], player_units[2:]))
+        return cls.from_board_states(board_states)
+
+    def take(self, lanes):
+        """
+        :param lanes: int array of lanes (may repeat lanes)
+        :return: The BatchBoardState of those lanes, in that order
+        """
+        return BatchBoardState(self.layout, self.heights[lanes], self.units[lanes], self.scores[lanes],
+                               self.active_players[lanes], self.current_player_id[lanes], self.turn[lanes],
+                               self.grid_sizes[lanes])
+
+    def lane(self, k):
+        """
+        :return: The BoardState of lane k
+        """
+        side = self.layout.side
+        size = self.grid_sizes[k]
+        grid = self.heights[k].reshape(side, side)[PADDING:PADDING + size, PADDING:PADDING + size].astype(int)
+        grid[grid == VOID] = -1
+        positions = [self.layout.position(int(c)) for c in self.units[k]]
+        return BoardState(grid, positions[:2], positions[2:],
+                          my_score=int(self.scores[k, 0]), op_score=int(self.scores[k, 1]),
+                          turn=int(self.turn[k]), active_players=[bool(a) for a in self.active_players[k]],
+                          current_player_id=int(self.current_player_id[k]))
+
+    def game_over(self):
+        """
+        :return: bool array [K], True for the lanes where Game would have ended the game
+        """
+        return ~self.active_players.any(axis=1) | (self.turn >= MAX_TURNS)
+
+    def _legality_tables(self):
+        """
+        Compute the tables legality is read from (see _action_columns).
+
+        An action is legal if the free height of the cell it builds on (or
+        pushes to) is at most the limit of its (unit, first direction) pair,
+        or if it is a move which builds where the unit was and its limit is
+        not -1.  Cells with a unit I can see count as VOID.
+
+        :return: int16 array [K, 32] of limits, uint8 array [K, 50] of free heights
+        """
+        if self._tables is None:
+            layout = self.layout
+            heights = self.heights.reshape(-1)
+            cells = self.units + (np.arange(len(self)) * layout.cell_count)[:, None]  # in heights
+
+            # The cells of the opponent units I can see (or -1, which is no cell)
+            near = layout.near[self.units[:, :2, None], self.units[:, None, 2:]].any(axis=1)
+            visible = np.where(near, cells[:, 2:], -1)
+
+            # Heights with the cells of the units I can see blocked
+            free_heights = heights.copy()
+            free_heights[cells[:, :2]] = VOID
+            free_heights[visible[near]] = VOID
+
+            unit_heights = heights.take(cells[:, layout.group_units]).astype(np.int16)
+            first_cells = cells[:, layout.group_units] + layout.group_offsets
+            first_heights = heights.take(first_cells).astype(np.int16)
+            op_first = (first_cells == visible[:, 0:1]) | (first_cells == visible[:, 1:2])
+
+            push_limits = np.where(op_first, np.minimum(first_heights + 1, 3), -1)
+            can_move = free_heights.take(first_cells) <= np.minimum(unit_heights + 1, 3)
+            move_limits = np.where(can_move, 3, -1)
+
+            limits = np.concatenate([push_limits, move_limits], axis=1)
+            near_heights = free_heights.take(cells[:, layout.near_units] + layout.near_offsets)
+            self._tables = limits, near_heights
+        return self._tables
+
+    def are_legal(self, lanes, ranks):
+        """
+        :param lanes: int array of lanes
+        :param ranks: int array of action ranks (all valid ranks), one per lane
+        :return: bool array, True where the action is legal in its lane
+        """
+        limits, near_heights = self._legality_tables()
+        limit = limits[lanes, ACTION_LIMIT_COLUMN[ranks]]
+        return ((near_heights[lanes, ACTION_NEAR_COLUMN[ranks]] <= limit)
+                | (ACTION_IS_BACK_MOVE[ranks] & (limit >= 0)))
+
+    def legal_mask(self, lanes=None):
+        """
+        :param lanes: Optional int array of lanes (all lanes by default)
+        :return: bool array [K, NUM_ACTIONS], True where the action rank is legal in the lane
+        """
+        if lanes is not None:
+            limits, near_heights = (table[lanes] for table in self._legality_tables())
+        elif self._legal_mask is not None:
+            return self._legal_mask
+        else:
+            limits, near_heights = self._legality_tables()
+
+        limits = limits.take(ACTION_LIMIT_COLUMN, axis=1)
+        mask = ((near_heights.take(ACTION_NEAR_COLUMN, axis=1) <= limits)
+                | (ACTION_IS_BACK_MOVE & (limits >= 0)))
+        if lanes is None:
+            self._legal_mask = mask
+        return mask
+
+    def legal_actions(self, k):
+        """
+        :return: The legal action strings of lane k (in the order sent to the players)
+        """
+        return [str(ACTION_TABLE[r]) for r in np.flatnonzero(self.legal_mask()[k])]
+
+    def random_actions(self, rng, tries=8):
+        """
+        Pick a uniformly random legal action in every lane.
+
+        Draws random ranks and keeps the legal ones (which is much cheaper
+        than building the legal mask); lanes still without an action after
+        a few tries pick from their legal mask.
+
+        :param rng: A numpy random Generator
+        :param int tries: Number of rejection sampling rounds
+        :return: int array [K] of action ranks (ACCEPT_DEFEAT where there is no legal action)
+        """
+        ranks = np.full(len(self), ACCEPT_DEFEAT, dtype=np.intp)
+        pending = np.arange(len(self))
+        for _ in range(tries):
+            draws = rng.integers(NUM_ACTIONS, size=len(pending))
+            legal = self.are_legal(pending, draws)
+            ranks[pending[legal]] = draws[legal]
+            pending = pending[~legal]
+            if not len(pending):
+                return ranks
+
+        mask = self.legal_mask(pending)
+        seen = np.cumsum(mask, axis=1, dtype=np.uint8)  # there are fewer than 256 actions
+        counts = seen[:, -1]
+        choice = (rng.random(len(pending)) * counts).astype(np.uint8)
+        ranks[pending] = np.where(counts > 0, (seen > choice[:, None]).argmax(axis=1), ACCEPT_DEFEAT)
+        return ranks
+
+    @staticmethod
+    def action_ranks(action_strs):
+        """
+        :param action_strs: Action strings (one per lane)
+        :return: int array of their ranks (ACCEPT_DEFEAT for anything else)
+        """
+        return np.array([a.rank if a is not None else ACCEPT_DEFEAT
+                         for a in map(ACTIONS_BY_STR.get, action_strs)], dtype=np.intp)
+
+    def next_board_states(self, ranks, lanes=None):
+        """
+        Play one action in every lane.
+
+        :param ranks: int array [K] of action ranks (ACCEPT_DEFEAT to resign)
+        :param lanes: Optional bool array [K]; lanes where it is False are not
+                      stepped (use it to freeze finished games)
+        :return: The next BatchBoardState
+        """
+        k = len(self)
+        ranks = np.asarray(ranks, dtype=np.intp)
+        step = np.ones(k, dtype=bool) if lanes is None else np.asarray(lanes, dtype=bool)
+
+        valid = (ranks >= 0) & (ranks < NUM_ACTIONS)
+        safe_ranks = np.where(valid, ranks, 0)
+        all_lanes = np.arange(k)
+        index = ACTION_INDEX[safe_ranks]
+        unit = self.units[all_lanes, index]
+        legal = step & valid & self.are_legal(all_lanes, safe_ranks)
+
+        heights = self.heights.copy()
+        units = self.units.copy()
+        scores = self.scores.copy()
+        active_players = self.active_players.copy()
+
+        pos_1 = unit + self.layout.first_offset[safe_ranks]
+        pos_2 = pos_1 + self.layout.second_offset[safe_ranks]
+        blocked = (pos_2 == units[:, 2]) | (pos_2 == units[:, 3])  # cancelled by an (unseen) opponent
+        is_push = ACTION_IS_PUSH[safe_ranks]
+
+        # PUSH&BUILD: the opponent unit on pos_1 goes to pos_2, pos_1 is built on
+        push = np.flatnonzero(legal & is_push & ~blocked)
+        pushed = np.where(units[push, 2] == pos_1[push], 2, 3)
+        units[push, pushed] = pos_2[push]
+        heights[push, pos_1[push]] += 1
+
+        # MOVE&BUILD: the unit goes to pos_1 (scoring on level 3), pos_2 is built on
+        move = np.flatnonzero(legal & ~is_push)
+        units[move, index[move]] = pos_1[move]
+        scores[move, 0] += heights[move, pos_1[move]] == 3
+        build = np.flatnonzero(legal & ~is_push & ~blocked)
+        heights[build, pos_2[build]] += 1
+
+        # Illegal actions (and ACCEPT-DEFEAT) deactivate the player
+        active_players[step & ~legal, 0] = False
+
+        # Switch to the opponent's point of view (if they are still playing)
+        swap = step & (~legal | active_players[:, 1])
+        units[swap] = units[swap][:, [2, 3, 0, 1]]
+        scores[swap] = scores[swap][:, ::-1]
+        active_players[swap] = active_players[swap][:, ::-1]
+
+        return BatchBoardState(self.layout, heights, units, scores, active_players,
+                               self.current_player_id ^ swap.astype(np.int8),
+                               self.turn + step, self.grid_sizes)
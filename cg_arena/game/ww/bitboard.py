@@ -0,0 +1,245 @@
+"""
+A compact engine for Wondev Woman.
+
+BitBoardState behaves like BoardState (same turn_input() text, same legal
+actions, same transitions) but is built for speed:
+
+ - The grid is a flat bytes object with two cells of padding on every side,
+   so moving in a direction is adding a fixed offset and never needs a bounds
+   check.  Holes and padding have height VOID, which fails every height test.
+ - Units are cell indices, and unit occupancy is an integer bitboard.
+ - Each BoardLayout (one per grid size) precomputes, for every cell, the
+   neighbourhood mask used for visibility and every action (with its string)
+   a unit on that cell could play.
+"""
+
+from game.ww import ACTIONS_BY_STR
+from game.ww import DIRECTIONS
+from game.ww import PUSH_DIR_2_OPTIONS
+
+VOID = 255  # height of holes and of the padding around the grid
+PADDING = 2  # unit positions are at most two steps from a playable cell
+
+_DIRECTION_NAMES = tuple(DIRECTIONS)
+
+
+class BoardLayout:
+    """
+    Precomputed geometry for one grid size.
+
+    :param int grid_size: The width (and height) of the numpy grid, including
+                          its two rows/columns of holes
+    """
+
+    _layouts = {}
+
+    def __init__(self, grid_size):
+        self.grid_size = grid_size
+        self.side = side = grid_size + 2 * PADDING
+        self.cell_count = side * side
+        self.offsets = {d: dx * side + dy for d, (dx, dy) in DIRECTIONS.items()}
+
+        # For each cell the cells within one step (including itself) as a bitboard
+        self.near_masks = [0] * self.cell_count
+        for c in range(self.cell_count):
+            mask = 1 << c
+            for offset in self.offsets.values():
+                if 0 <= c + offset < self.cell_count:
+                    mask |= 1 << (c + offset)
+            self.near_masks[c] = mask
+
+        # For each unit index and cell: the actions from that cell as
+        # (pos_1, [(pos_2, move action), ...], [(pos_2, push action), ...])
+        self.actions = [[self._actions_from(index, c) for c in range(self.cell_count)]
+                        for index in (0, 1)]
+
+        # The cells (and their x, y) shown to the players in turn_input
+        self.rows = [[self.cell(x, y) for x in range(grid_size - 2)] for y in range(grid_size - 2)]
+        self.coordinates = {self.cell(x, y): "{} {}".format(x, y)
+                            for x in range(-PADDING, grid_size) for y in range(-PADDING, grid_size)}
+
+    def _actions_from(self, index, c):
+        actions = []
+        for dir_1 in _DIRECTION_NAMES:
+            pos_1 = c + self.offsets[dir_1]
+            if not 0 <= pos_1 < self.cell_count:
+                continue  # only happens for padding cells, which never hold units
+            moves = [(pos_1 + self.offsets[dir_2], "MOVE&BUILD {} {} {}".format(index, dir_1, dir_2))
+                     for dir_2 in _DIRECTION_NAMES]
+            pushes = [(pos_1 + self.offsets[dir_2], "PUSH&BUILD {} {} {}".format(index, dir_1, dir_2))
+                      for dir_2 in PUSH_DIR_2_OPTIONS[dir_1]]
+            actions.append((pos_1, moves, pushes))
+        return actions
+
+    @classmethod
+    def for_grid_size(cls, grid_size):
+        layout = cls._layouts.get(grid_size)
+        if layout is None:
+            layout = cls._layouts[grid_size] = cls(grid_size)
+        return layout
+
+    def cell(self, x, y):
+        """
+        Return the cell index of a grid position.
+
+        Negative coordinates wrap around like numpy indices do in BoardState.
+        """
+        return ((x % self.grid_size) + PADDING) * self.side + (y % self.grid_size) + PADDING
+
+    def heights_from_grid(self, grid):
+        """Convert a numpy grid to the flat heights used by BitBoardState."""
+        heights = bytearray([VOID]) * self.cell_count
+        for x in range(self.grid_size):
+            for y in range(self.grid_size):
+                h = int(grid[x, y])
+                if h >= 0:
+                    heights[self.cell(x, y)] = h
+        return bytes(heights)
+
+
+class BitBoardState:
+    """
+    The state of a Wondev Woman game from the point of view of the current player.
+
+    Build the first state with BitBoardState.from_grid.
+    """
+
+    __slots__ = ("layout", "heights", "units", "turn", "active_players", "scores",
+                 "current_player_id", "visible_op_mask", "legal_actions", "_legal_set")
+
+    def __init__(self, layout, heights, units, my_score=0, op_score=0, turn=0,
+                 active_players=(True, True), current_player_id=0):
+        """
+        :param layout: The BoardLayout of the grid
+        :param bytes heights: Height of every cell (VOID for holes)
+        :param units: Cells of my two units followed by the opponent's two units
+        """
+        self.layout = layout
+        self.heights = heights
+        self.units = units
+        self.turn = turn
+        self.active_players = list(active_players)
+        self.scores = [my_score, op_score]
+        self.current_player_id = current_player_id
+
+        near = layout.near_masks
+        visible = near[units[0]] | near[units[1]]
+        self.visible_op_mask = ((1 << units[2]) | (1 << units[3])) & visible
+        self.legal_actions = self.my_legal_actions()
+        self._legal_set = None
+
+    @classmethod
+    def from_grid(cls, grid, my_units, op_units, my_score=0, op_score=0, turn=0,
+                  active_players=(True, True), current_player_id=0):
+        """
+        Build a state with the same arguments as BoardState.
+        """
+        layout = BoardLayout.for_grid_size(grid.shape[0])
+        units = tuple(layout.cell(int(x), int(y)) for x, y in list(my_units) + list(op_units))
+        return cls(layout, layout.heights_from_grid(grid), units, my_score, op_score, turn,
+                   active_players, current_player_id)
+
+    @property
+    def player_units(self):
+        """The (x, y) positions of my units and of the opponent's units."""
+        side = self.layout.side
+        positions = [(c // side - PADDING, c % side - PADDING) for c in self.units]
+        return [positions[:2], positions[2:]]
+
+    def is_legal(self, action_str):
+        """
+        :param str action_str: An action string (any string)
+        :return: True if it is one of the legal actions
+        """
+        if self._legal_set is None:
+            self._legal_set = set(self.legal_actions)
+        return action_str in self._legal_set
+
+    def my_legal_actions(self):
+        heights = self.heights
+        units = self.units
+        my_mask = (1 << units[0]) | (1 << units[1])
+        visible_op_mask = self.visible_op_mask
+        visible_mask = my_mask | visible_op_mask
+
+        legal_actions = []
+        for index in (0, 1):
+            u = units[index]
+            max_height = min(3, heights[u] + 1)
+            for pos_1, moves, pushes in self.layout.actions[index][u]:
+                if visible_op_mask >> pos_1 & 1:
+                    max_push_height = min(3, heights[pos_1] + 1)
+                    legal_actions.extend(action for pos_2, action in pushes
+                                         if heights[pos_2] <= max_push_height and not visible_mask >> pos_2 & 1)
+                elif heights[pos_1] <= max_height and not my_mask >> pos_1 & 1:
+                    legal_actions.extend(action for pos_2, action in moves
+                                         if pos_2 == u or (heights[pos_2] <= 3 and not visible_mask >> pos_2 & 1))
+
+        legal_actions.sort()
+        return legal_actions
+
+    def _swapped(self, heights, units, my_score, op_score, my_active, op_active):
+        """The next state, seen by the opponent (unless they are inactive)."""
+        if op_active:
+            return BitBoardState(self.layout, heights, (units[2], units[3], units[0], units[1]),
+                                 my_score=op_score, op_score=my_score, turn=self.turn + 1,
+                                 active_players=(op_active, my_active),
+                                 current_player_id=self.current_player_id ^ 1)
+        return BitBoardState(self.layout, heights, units,
+                             my_score=my_score, op_score=op_score, turn=self.turn + 1,
+                             active_players=(my_active, op_active),
+                             current_player_id=self.current_player_id)
+
+    def next_board_state(self, action_str):
+        my_score, op_score = self.scores
+        my_active, op_active = self.active_players
+
+        if not self.is_legal(action_str):
+            # swap order and deactivate player
+            return BitBoardState(self.layout, self.heights, (self.units[2], self.units[3], self.units[0], self.units[1]),
+                                 my_score=op_score, op_score=my_score, turn=self.turn + 1,
+                                 active_players=(op_active, False),
+                                 current_player_id=self.current_player_id ^ 1)
+
+        action = ACTIONS_BY_STR[action_str]
+        index = action.index
+        offsets = self.layout.offsets
+        units = list(self.units)
+        heights = bytearray(self.heights)
+
+        first_pos = units[index] + offsets[action.dir_1]
+        second_pos = first_pos + offsets[action.dir_2]
+        op_units = units[2:]
+
+        if action.type == "PUSH&BUILD":
+            if second_pos in op_units:
+                pass  # cancelled move
+            else:
+                units[2 + op_units.index(first_pos)] = second_pos
+                heights[first_pos] += 1
+        else:  # MOVE&BUILD
+            units[index] = first_pos
+            if heights[first_pos] == 3:
+                my_score += 1
+            if second_pos in op_units:
+                pass  # cancelled move
+            else:
+                heights[second_pos] += 1
+
+        return self._swapped(bytes(heights), units, my_score, op_score, my_active, op_active)
+
+    def input_grid(self):
+        heights = self.heights
+        return "\n".join("".join('.' if heights[c] == VOID else str(heights[c]) for c in row)
+                         for row in self.layout.rows)
+
+    def turn_input(self):
+        coordinates = self.layout.coordinates
+        units = self.units
+        lines = [self.input_grid(), coordinates[units[0]], coordinates[units[1]]]
+        for c in units[2:]:
+            lines.append(coordinates[c] if self.visible_op_mask >> c & 1 else "-1 -1")
+        lines.append(str(len(self.legal_actions)))
+        lines.extend(self.legal_actions)
+
+        return "\n".join(lines)
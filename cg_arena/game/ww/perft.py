@@ -0,0 +1,59 @@
+"""
+Perft: count the move sequences of a given length from a position.
+
+Counting every leaf of the game tree to a small depth exercises legal move
+generation and next_board_state on a huge number of positions, so the
+engines (which must agree exactly) can be checked against each other and
+timed in nodes per second.
+
+A position where the game is over is a leaf.  A player without a legal
+action has one move, ACCEPT-DEFEAT.
+"""
+
+import numpy as np
+
+from game.ww.batch import ACCEPT_DEFEAT
+from game.ww.batch import BatchBoardState
+from game.ww.batch import MAX_TURNS
+
+
+def perft(board_state, depth):
+    """
+    :param board_state: A BoardState or BitBoardState
+    :param int depth: Number of moves
+    :return: (number of leaves, number of positions visited)
+    """
+    if depth == 0 or not any(board_state.active_players) or board_state.turn >= MAX_TURNS:
+        return 1, 1
+    leaves, nodes = 0, 1
+    for action_str in [str(a) for a in board_state.legal_actions] or ["ACCEPT-DEFEAT"]:
+        child_leaves, child_nodes = perft(board_state.next_board_state(action_str), depth - 1)
+        leaves += child_leaves
+        nodes += child_nodes
+    return leaves, nodes
+
+
+def batch_perft(board_state, depth):
+    """
+    Perft with the batch engine, one whole level of the tree at a time.
+
+    :param board_state: A BoardState
+    :param int depth: Number of moves
+    :return: (number of leaves, number of positions visited)
+    """
+    batch = BatchBoardState.from_board_states([board_state])
+    leaves, nodes = 0, 1
+    for _ in range(depth):
+        over = batch.game_over()
+        leaves += int(over.sum())
+        mask = batch.legal_mask() & ~over[:, None]
+        stuck = ~over & ~mask.any(axis=1)  # no legal action: ACCEPT-DEFEAT
+        lanes, ranks = np.nonzero(mask)
+        stuck_lanes = np.flatnonzero(stuck)
+        lanes = np.concatenate([lanes, stuck_lanes])
+        ranks = np.concatenate([ranks, np.full(len(stuck_lanes), ACCEPT_DEFEAT, dtype=ranks.dtype)])
+        if not len(lanes):
+            return leaves, nodes
+        batch = batch.take(lanes).next_board_states(ranks)
+        nodes += len(batch)
+    return leaves + len(batch), nodes
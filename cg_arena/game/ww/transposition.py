@@ -0,0 +1,115 @@
+"""
+Zobrist hashing of Wondev Woman positions and a cache of what BoardState
+computes for a position (its legal actions and its rendered turn input).
+
+The same positions come up again and again in a tournament: the two games of
+a mirrored pair start from the same configuration, and openings repeat.  The
+cache is shared by every match in the process.
+"""
+
+import collections
+import random
+
+MIN_HEIGHT = -1  # holes
+MAX_HEIGHT = 4  # domes
+
+
+class ZobristKeys:
+    """
+    Random 64-bit keys for one grid size.
+
+    The hash of a position is the xor of the keys of every (cell, height) and
+    of every (unit slot, cell), so changing one cell or moving one unit
+    updates the hash with two xors.
+    """
+
+    _keys = {}
+
+    def __init__(self, grid_size):
+        rng = random.Random(grid_size)  # the same keys in every process
+        heights = MAX_HEIGHT - MIN_HEIGHT + 1
+        self.grid_size = grid_size
+        self.cell_keys = [[[rng.getrandbits(64) for _ in range(heights)]
+                           for _ in range(grid_size)] for _ in range(grid_size)]
+        self.unit_keys = [[[rng.getrandbits(64) for _ in range(grid_size)]
+                           for _ in range(grid_size)] for _ in range(4)]
+
+    @classmethod
+    def for_grid_size(cls, grid_size):
+        keys = cls._keys.get(grid_size)
+        if keys is None:
+            keys = cls._keys[grid_size] = cls(grid_size)
+        return keys
+
+    def cell_key(self, pos, height):
+        x, y = pos
+        return self.cell_keys[x][y][height - MIN_HEIGHT]
+
+    def grid_hash(self, grid):
+        """The hash of every cell of a numpy grid."""
+        h = 0
+        for x, row in enumerate(grid.tolist()):
+            for y, height in enumerate(row):
+                h ^= self.cell_keys[x][y][height - MIN_HEIGHT]
+        return h
+
+    def units_hash(self, units):
+        """The hash of the four units (my two units, then the opponent's two)."""
+        h = 0
+        for slot, (x, y) in enumerate(units):
+            h ^= self.unit_keys[slot][x][y]
+        return h
+
+
+class TranspositionCache:
+    """
+    A bounded least-recently-used map from position hashes to cached entries.
+
+    :param int maxsize: The most entries kept (0 disables the cache)
+    """
+
+    def __init__(self, maxsize):
+        self.maxsize = maxsize
+        self.hits = 0
+        self.misses = 0
+        self._entries = collections.OrderedDict()
+
+    def get(self, key):
+        """
+        :return: The entry stored under key, or None
+        """
+        if not self.maxsize:
+            return None  # disabled (not counted as a miss)
+        entry = self._entries.get(key)
+        if entry is None:
+            self.misses += 1
+        else:
+            self.hits += 1
+            self._entries.move_to_end(key)
+        return entry
+
+    def put(self, key, entry):
+        if not self.maxsize:
+            return
+        self._entries[key] = entry
+        if len(self._entries) > self.maxsize:
+            self._entries.popitem(last=False)
+
+    def resize(self, maxsize):
+        """Change the maximum size, dropping the oldest entries if needed."""
+        self.maxsize = maxsize
+        while len(self._entries) > maxsize:
+            self._entries.popitem(last=False)
+
+    def hit_rate(self):
+        lookups = self.hits + self.misses
+        return self.hits / lookups if lookups else 0.0
+
+    def summary(self):
+        """:return: A one line summary of the cache statistics."""
+        return "Transposition cache: {} hits, {} misses ({:.1%} hit rate), {}/{} entries".format(
+            self.hits, self.misses, self.hit_rate(), len(self._entries), self.maxsize)
+
+
+# Shared by all the matches in the process
+TRANSPOSITION_CACHE = TranspositionCache(maxsize=10000)
@@ -102,6 +102,31 @@ class GameABC(metaclass=ABCMeta):
         """
         ...
 
+    def expected_output_lines(self, player):
+        """
+        Return the number of lines the player prints on each turn.
+
+        The arena ends the turn as soon as this many lines arrive, so it
+        doesn't have to wait to see if more output is coming.  Most
+        CodinGame competitions expect one line per turn, which is the default.
+
+        :param int player: Player number (should always be the same as current player)
+        :return: int
+        """
+        return 1
+
+    def legal_actions(self, player):
+        """
+        (Optional) Return the legal action strings of the player, in a fixed order.
+
+        Replays store the action of each turn as an index into this list,
+        which takes much less space than the action itself.
+
+        :param int player: Player number (should always be the same as current player)
+        :return: A list of strings, or None if the game doesn't list the legal actions
+        """
+        return None
+
     @abstractmethod
     def validate_output(self, stdout_stream):
         """
@@ -145,12 +170,24 @@ class GameABC(metaclass=ABCMeta):
         """
         ...
 
+    @staticmethod
+    def report():
+        """
+        (Optional) Return lines of statistics about the game engine (e.g. cache
+        hit rates), printed at the end of a tournament.
+
+        :return: A list of strings
+        """
+        return []
+
     @abstractmethod
-    def print_game(self):
+    def print_game(self, file=None):
         """
         (Optional) Print a game board or some other representation of the game state.
         Only used with show_map.
 
         This is used in conjunction with the show map attribute.
+
+        :param file: The text stream to print to (None for sys.stdout)
         """
         ...
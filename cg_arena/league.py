@@ -0,0 +1,156 @@
+"""
+A league: rank any number of bots with as few games as possible.
+
+Instead of giving every pairing the same number of games, the league keeps
+TrueSkill-style ratings of the bots and schedules each next pair of games
+(the same configuration with the bots in both seats) between the two bots
+whose game is expected to teach the most about the ratings: bots with close
+ratings, or whose ratings are still uncertain.  Bots which are clearly
+better or worse than the others quickly stop playing each other.
+"""
+
+import itertools
+import random
+import time
+
+from ratings import Ratings
+from results_store import ResultsStoreError
+from tournament import GameResult
+from tournament import Tournament
+
+
+class League(Tournament):
+    """
+    A tournament of two player games between any number of bots.
+
+    :param int number_of_games: Number of games in the league
+    :param program_names: List of python scripts to run (at least two, all different)
+    :param bool time_limits: Use time limits
+    :param bool verbose: Print information about every move
+    :param bool show_map: Print the game board
+    :param int jobs: Number of matches to play at the same time
+    :param process_pool_type: The class of the pool which starts the player processes (or None)
+    :param int async_games: If positive, play this many matches at the same time in one asyncio event loop
+    :param results_store: A ResultsStore to record each finished game in (or None)
+    :param str replay_dir: If given, write the replay of every match in this directory
+    :param bool replay_stderr: Include the players' stderr in the replays
+    :param profile: A profiler.Profile to add the profiles of all the matches to (or None)
+    :param memory_limit: If given, cap the memory of the bots at this many MB
+    :param turn_budgets: If given, the timing.TurnBudgets enforced by the arena
+    :param coordinator: A distributed.Coordinator which hands the matches to remote workers (or None)
+    :param output_sink: An output.NullSink or GameLogSink to print the matches to (or None)
+    """
+
+    def __init__(self, number_of_games, program_names, time_limits, verbose, show_map, jobs=1,
+                 process_pool_type=None, async_games=0, results_store=None, replay_dir=None,
+                 replay_stderr=False, profile=None, memory_limit=None, turn_budgets=None, coordinator=None,
+                 output_sink=None):
+        if len(program_names) < 2 or len(set(program_names)) != len(program_names):
+            raise ValueError("A league needs at least two different bots")
+        super().__init__(number_of_games, program_names, 2, time_limits, verbose, show_map, jobs,
+                         process_pool_type, async_games, results_store, replay_dir, replay_stderr,
+                         profile=profile, memory_limit=memory_limit, turn_budgets=turn_budgets,
+                         coordinator=coordinator, output_sink=output_sink)
+        self.set_size = 2
+        self.ratings = Ratings(program_names)
+        self.games_by_bot = {p: 0 for p in program_names}
+        self.pending = {}  # (bot, bot) -> scheduled games which haven't finished yet
+        self.first_id = 0  # first game id after the games in the results store
+
+    @staticmethod
+    def pair_key(a, b):
+        return (a, b) if a < b else (b, a)
+
+    def next_pair(self):
+        """
+        :return: The two bots whose next game is expected to be the most informative.
+                 Games already scheduled between two bots count against them, so
+                 concurrent games are spread over several pairs.
+        """
+        def value(pair):
+            info = self.ratings.information(*pair) / (1 + self.pending.get(self.pair_key(*pair), 0))
+            return info, self.schedule_rng.random()
+        return max(itertools.combinations(self.program_names, 2), key=value)
+
+    def schedule(self):
+        """
+        Generate the games of the league, one pair of games at a time.
+
+        Each pair is chosen with the ratings as they are when the pair is
+        scheduled, so the schedule depends on the results of earlier games.
+
+        :return: iterator of (id_number, player_list, config_str)
+        """
+        self.schedule_rng = random.Random(0)
+        self.config_str_rng = random.Random(0)
+        self.configs_drawn = 0
+        # Skip the configurations of the recorded pairs, so a resumed league plays new ones
+        for _ in range(self.first_id // 2):
+            self.next_configuration()
+
+        for pair_id in range(self.first_id, self.number_of_games, 2):
+            a, b = self.next_pair()
+            config_str = self.next_configuration()
+            for i, player_list in ((pair_id, [a, b]), (pair_id + 1, [b, a])):
+                if i < self.number_of_games:
+                    key = self.pair_key(a, b)
+                    self.pending[key] = self.pending.get(key, 0) + 1
+                    yield i, player_list, config_str
+
+    def load_recorded_results(self):
+        """
+        Rebuild the statistics and the ratings from the games already in the
+        results store (in the order they were recorded).  The league goes on
+        after the last recorded game.
+
+        :raises ResultsStoreError: if the stored games are corrupt or don't belong to this league
+        """
+        stored = self.results_store.load(GameResult)
+        if not stored:
+            return
+
+        for result in stored:
+            if len(result.player_list) != 2 or not set(result.player_list) <= set(self.program_names):
+                raise ResultsStoreError("Game {} in {} is not a game of this league".format(
+                    result.id_number, self.results_store.path))
+            self.update_statistics(result)
+            self.recorded_ids.add(result.id_number)
+        self.first_id = (max(self.recorded_ids) + 2) // 2 * 2
+
+        print("Resumed {} recorded games from {}".format(len(self.recorded_ids), self.results_store.path))
+
+    def update_statistics(self, result):
+        """
+        Add the result of a finished match to the statistics and the ratings.
+
+        :param result: A GameResult
+        """
+        super().update_statistics(result)
+        winner = result.player_list[result.results[0]]
+        loser = result.player_list[result.results[1]]
+        self.ratings.rate(winner, loser)
+        for name in result.player_list:
+            self.games_by_bot[name] += 1
+        key = self.pair_key(winner, loser)
+        if self.pending.get(key):
+            self.pending[key] -= 1
+
+    def print_win_data(self):
+        """
+        Print the ranking.
+        """
+        print("==========================")
+        print("League Results {}/{} games:".format(self.games_played, self.number_of_games))
+        print("Rank   mu ± sigma   mu-3σ  Games   Wins  Bot")
+        for rank, name in enumerate(self.ratings.ranking()):
+            error_note = ""
+            if self.games_with_errors[name]:
+                error_note += " ({} games with errors)".format(len(self.games_with_errors[name]))
+            if self.games_with_warnings[name]:
+                error_note += " ({} games with warnings)".format(len(self.games_with_warnings[name]))
+            if self.games_with_timeouts[name]:
+                error_note += " ({} games with timeouts)".format(len(self.games_with_timeouts[name]))
+            print("{:4} {:6.2f} ± {:5.2f} {:6.2f} {:6} {:6}  {}{}".format(
+                rank + 1, self.ratings.mu[name], self.ratings.sigma[name], self.ratings.conservative(name),
+                self.games_by_bot[name], self.wins[name], name, error_note))
+        print("Total league time:", time.perf_counter() - self.start_time, "sec")
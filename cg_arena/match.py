@@ -2,6 +2,25 @@ import time
 
 from process import PlayerProcess
 from game import Game
+from output import is_null_output
+from replay import Replay
+from replay import ReplayTurn
+from replay import action_index
+from replay import write_replay
+from resources import TurnRSS
+from resources import usage_summary
+from timing import DEFAULT_TURN_TIMEOUT
+from timing import LatencyHistogram
+
+
+def encode_inputs(lines):
+    """
+    Encode input lines as the bytes written to a bot.
+
+    :param lines: The lines (anything printable, possibly with inner newlines)
+    :return: bytes
+    """
+    return "".join(str(line) + "\n" for line in lines).encode()
 
 
 class Match:
@@ -9,9 +28,26 @@ class Match:
     Stores the current state of the match including managing the player processes.
     """
 
-    def __init__(self, id_number, config_str, player_program_list, time_limits, verbose, show_map):
+    def __init__(self, id_number, config_str, player_program_list, time_limits, verbose, show_map,
+                 process_pool=None, record_replay=False, replay_stderr=False, profile=None, memory_limit=None,
+                 turn_budgets=None, output=None):
         """
         Initializes all game data
+
+        :param process_pool: If given, the player processes are started by this
+                             pool (e.g. a PersistentProcessPool) instead of
+                             being spawned for this match only.
+        :param bool record_replay: Record the turns of the match for a replay (see write_replay)
+        :param bool replay_stderr: Also record the players' stderr in the replay
+        :param profile: A profiler.Profile timing the phases of the match (or None)
+        :param memory_limit: If given, cap the memory of each bot at this many MB
+                             (a bot going over it crashes and is deactivated)
+        :param turn_budgets: If given, the timing.TurnBudgets enforced by the
+                             arena (else it waits DEFAULT_TURN_TIMEOUT seconds
+                             for every turn and doesn't check the time)
+        :param output: The text stream the match prints to (None for sys.stdout),
+                       e.g. an io.StringIO to play it next to other matches.
+                       Nothing is formatted for an output.NullOutput.
         """
 
         #
@@ -34,24 +70,27 @@ class Match:
         self.time_limits = time_limits
         self.verbose = verbose
         self.show_map = show_map
+        self.memory_limit = memory_limit
+        self.turn_budgets = turn_budgets
+        self.output = output
+        self.printing = not is_null_output(output)  # False if the output is dropped anyway
+
+        self.profile = profile
+        if profile is not None:
+            profile.instrument(self)
 
         #
         # Start the programs running as subprocesses
         #
         self.player_processes = []
-        for program_name in player_program_list:
-
-            options = []
-            if not self.time_limits:
-                options = ['--no-time-limit']
-            self.player_processes.append(PlayerProcess(program_name, options))
+        self.start_player_processes(process_pool)
 
         #
         # Use config string to determine initial configuration/starting positions
         #
 
         # Create game
-        self.game = Game(config_str)
+        self.game = self.create_game(config_str)
 
         #
         # General information for all games
@@ -59,10 +98,51 @@ class Match:
         self.current_player = 0
         self.loss_order = []  # list of players as they lose
         self.issue_logs = [None for _ in player_program_list]
+        self.timeouts = [False for _ in player_program_list]  # deactivated for going over a budget
         self.warnings = [[] for _ in player_program_list]
         self.sum_times = [0 for _ in player_program_list]
         self.max_times = [0 for _ in player_program_list]
         self.player_turns = [0 for _ in player_program_list]
+        self.turn_times = [LatencyHistogram() for _ in player_program_list]
+        self.turn_cpu_times = [LatencyHistogram() for _ in player_program_list]
+        self.cpu_before = None  # CPU time of the current player at the start of the turn
+        self.io_before = None  # I/O calls of the current player at the start of the turn
+        self.turn_writes = [0 for _ in player_program_list]
+        self.turn_reads = [0 for _ in player_program_list]
+        self.record_replay = record_replay
+        self.replay_stderr = replay_stderr
+        self.replay_turns = []
+        self.turn_rss = [TurnRSS() for _ in player_program_list]
+        self.resource_usage = [None for _ in player_program_list]  # ResourceUsage once killed
+
+    def create_game(self, config_str):
+        """
+        :param str config_str: The configuration string
+        :return: A new Game
+        """
+        return Game(config_str)
+
+    def player_options(self):
+        """
+        :return: The command line options passed to every bot
+        """
+        options = []
+        if not self.time_limits:
+            options = ['--no-time-limit']
+        return options
+
+    def start_player_processes(self, process_pool):
+        """
+        Start one process per player.
+
+        :param process_pool: The pool which starts the processes (or None)
+        """
+        options = self.player_options()
+        for program_name in self.player_program_list:
+            if process_pool is None:
+                self.player_processes.append(PlayerProcess(program_name, options, self.memory_limit))
+            else:
+                self.player_processes.append(process_pool.start(program_name, options, self.memory_limit))
 
     def kill_player(self, player):
         """
@@ -73,35 +153,40 @@ class Match:
         # Close the process and remove from process list
         if self.player_processes[player] is not None:
             self.player_processes[player].kill()
+            self.record_resource_usage(player)
             self.player_processes[player] = None
 
         # TODO: Record loss order differently
         # Mark player as lost
         #
 
+    def print(self, *args, end="\n"):
+        """Print to the output of the match."""
+        print(*args, end=end, file=self.output)
+
     def send_init_inputs_to_player(self):
         # To avoid timing issues, I will send the information to each player seperately.
         # It will be basically the same information.
 
         try:
-            current_player_stdin = self.player_processes[self.current_player].stdin
-
-            for line in self.game.init_inputs(self.current_player):
-                print(line, file=current_player_stdin)
+            p = self.player_processes[self.current_player]
+            p.write_input(encode_inputs(self.game.init_inputs(self.current_player)))
 
             return time.perf_counter(), False  # no errors
 
         except BrokenPipeError:
-            print("Broken Pipe Error")
+            self.print("Broken Pipe Error")
             return time.perf_counter(), True  # errors (Program likely crashed)
 
     def pregame(self):
-        print("==========================")
-        print("Game:", self.id_number)
-        print("Configuration:", self.config_str)
-        print("Players:")
+        if self.printing:
+            self.print("==========================")
+            self.print("Game:", self.id_number)
+            self.print("Configuration:", self.config_str)
+            self.print("Players:")
         for player, player_name in enumerate(self.player_program_list):
-            print(player, ":", player_name)
+            if self.printing:
+                self.print(player, ":", player_name)
 
             self.current_player = player
             input_time, input_flag = self.send_init_inputs_to_player()
@@ -116,27 +201,32 @@ class Match:
         """
         Send information to the player processes at the start of the turn.
 
+        The whole input of the turn is written at once.
+
         :return: time that the input was sent (needed to measure response time)
         :return: a flag representing if there was a Broken Pipe Error
                  (which likely means the processes crashed)
         """
 
         try:
-            current_player_stdin = self.player_processes[self.current_player].stdin
-
-            for line in self.game.turn_inputs(self.current_player):
-                print(line, file=current_player_stdin)
+            p = self.player_processes[self.current_player]
+            data = encode_inputs(self.game.turn_inputs(self.current_player))
+            # The bot starts working during the write, so start timing before it
+            input_time = time.perf_counter()
+            p.write_input(data)
 
-            return time.perf_counter(), False  # no errors
+            return input_time, False  # no errors
 
         except BrokenPipeError:
-            print("Broken Pipe Error")
+            self.print("Broken Pipe Error")
             return time.perf_counter(), True  # errors (Program likely crashed)
 
     def read_player_streams(self, timeout=0.1, expected_stdout_size=1):
         """
         Get the actions from the player processes stdin (and stuff from stderr)
 
+        The turn is over as soon as expected_stdout_size lines arrive on stdout.
+
         :param timeout:
         :param expected_stdout_size:
         :return: time that the output was collected
@@ -145,18 +235,31 @@ class Match:
         """
 
         p = self.player_processes[self.current_player]
-
-        # read from stdout first since that means they are done with their turn
-        stdout_stream = list(p.read_stdout(timeout=timeout))
-        if len(stdout_stream) < expected_stdout_size:
-            stdout_stream += list(p.read_stdout(timeout=0.01))
-        output_time = time.perf_counter()
-        # read stderr next with no timeout since it should all be put into
-        # the stream by now
-        stderr_stream = list(p.read_stderr(timeout=0.01))
+        stdout_stream, stderr_stream, output_time = p.read_streams(expected_stdout_size, timeout=timeout)
 
         return output_time, stdout_stream, stderr_stream
 
+    def turn_budget(self, player):
+        """
+        :param int player: The player number
+        :return: The time budget of the player's current turn in seconds (None if there is no budget)
+        """
+        if self.turn_budgets is None:
+            return None
+        return self.turn_budgets.turn if self.player_turns[player] else self.turn_budgets.first_turn
+
+    def read_timeout(self, input_time):
+        """
+        :param input_time: When the inputs of the turn were sent
+        :return: How long to wait for the current player's output from now: until the
+                 end of its budget plus the grace period (so a frozen bot is killed
+                 as early as possible)
+        """
+        budget = self.turn_budget(self.current_player)
+        if budget is None:
+            return DEFAULT_TURN_TIMEOUT
+        return max(input_time + budget + self.turn_budgets.grace - time.perf_counter(), 0.0)
+
     def validate_player_output(self, stdout_stream):
         """
         Determine if player output was good.
@@ -193,22 +296,93 @@ class Match:
 
         self.game.process_output(self.current_player, action_str, deactivated)
 
-    def record_times(self, input_time, output_time):
+    def player_cpu_time(self, player):
+        """
+        :param int player: The player number
+        :return: The CPU time used so far by the player's process, or None if unknown
+        """
+        p = self.player_processes[player]
+        return p.cpu_time() if p is not None else None
+
+    def player_rss(self, player):
+        """
+        :param int player: The player number
+        :return: The resident memory of the player's process now (in kB), or None if unknown
+        """
+        p = self.player_processes[player]
+        return p.rss() if p is not None else None
+
+    def record_resource_usage(self, player):
+        """
+        Record the resources the player's (just killed) process used in the game.
+
+        :param int player: The player number
+        """
+        usage = self.player_processes[player].resource_usage()
+        if usage is not None:
+            turn_rss = self.turn_rss[player]
+            max_turn_rss = turn_rss.max if turn_rss.count else None
+            peak_rss = usage.peak_rss if usage.peak_rss is not None else max_turn_rss  # the bot had exited
+            self.resource_usage[player] = usage._replace(peak_rss=peak_rss, max_turn_rss=max_turn_rss,
+                                                         mean_turn_rss=turn_rss.mean())
+
+    def record_io_calls(self):
+        """Record the system calls used to talk to the current player this turn."""
+        writes_before, reads_before = self.io_before
+        writes, reads = self.player_processes[self.current_player].io_calls()
+        self.turn_writes[self.current_player] += writes - writes_before
+        if reads is not None:
+            self.turn_reads[self.current_player] += reads - reads_before
+
+    def record_times(self, input_time, output_time, cpu_time=None):
+        """
+        Record how long the current player took this turn.
+
+        :param input_time: when the inputs were sent
+        :param output_time: when the last line of output arrived
+        :param cpu_time: the CPU time the player used during the turn (or None)
+        """
         player = self.current_player
         if self.player_turns[player]:  # skip first turn
             turn_time = output_time - input_time
             self.sum_times[player] += turn_time
             if self.max_times[player] < turn_time:
                 self.max_times[player] = turn_time
+            self.turn_times[player].add(turn_time)
+            if cpu_time is not None:
+                self.turn_cpu_times[player].add(cpu_time)
 
         self.player_turns[player] += 1
 
+    def record_replay_turn(self, input_flag, turn_time, stdout_stream, stderr_stream):
+        """
+        Record the current player's turn for the replay (before it is processed).
+
+        :param bool input_flag: True if the inputs couldn't be sent
+        :param turn_time: How long the turn took
+        :param stdout_stream: The lines printed by the player
+        :param stderr_stream: The lines the player printed to stderr
+        """
+        index = action_index(stdout_stream, self.game.legal_actions(self.current_player))
+        self.replay_turns.append(ReplayTurn(self.current_player, input_flag, turn_time,
+                                            index if index is not None else list(stdout_stream),
+                                            list(stderr_stream) if self.replay_stderr else None))
+
+    def write_replay(self, path):
+        """
+        Write the replay of the match (it must have been recorded, see record_replay).
+
+        :param str path: The replay file
+        """
+        write_replay(path, Replay(self.id_number, self.config_str, list(self.player_program_list),
+                                  self.replay_turns))
+
     def print_board(self):
         """
         Print the game board.  (Used with show_map attribute.)
         """
 
-        self.game.print_game()
+        self.game.print_game(file=self.output)
 
     def print_turn_data(self, stdout_stream, stderr_stream, message, issue_flag, input_time, output_time):
         """
@@ -224,18 +398,18 @@ class Match:
         """
 
         player_name = self.player_program_list[self.current_player]
-        print("--------------------------")
-        print("Turn", self.turn, "(Player {})".format(self.current_player), player_name)
+        self.print("--------------------------")
+        self.print("Turn", self.turn, "(Player {})".format(self.current_player), player_name)
 
-        print("Standard Error Stream:")
+        self.print("Standard Error Stream:")
         for line in stderr_stream:
-            print(">", line, end="")
-        print("Standard Output Stream:")
+            self.print(">", line, end="")
+        self.print("Standard Output Stream:")
         for line in stdout_stream:
-            print(">", line, end="")
-        print("Game Information:")
-        print(">", player_name, message)
-        print("Turn time:", output_time - input_time, "sec")
+            self.print(">", line, end="")
+        self.print("Game Information:")
+        self.print(">", player_name, message)
+        self.print("Turn time:", output_time - input_time, "sec")
         if self.show_map:
             self.print_board()
 
@@ -247,16 +421,16 @@ class Match:
 
         turn, stdout_stream, stderr_stream, message, input_flag, output_flag = self.issue_logs[player]
         player_name = self.player_program_list[player]
-        print("    Error on turn", self.turn)
+        self.print("    Error on turn", self.turn)
 
-        print("    Standard Error Stream:")
+        self.print("    Standard Error Stream:")
         for line in stderr_stream:
-            print("    >", line, end="")
-        print("    Standard Output Stream:")
+            self.print("    >", line, end="")
+        self.print("    Standard Output Stream:")
         for line in stdout_stream:
-            print("    >", line, end="")
-        print("    Game Information:")
-        print("    >", player_name, message)
+            self.print("    >", line, end="")
+        self.print("    Game Information:")
+        self.print("    >", player_name, message)
 
     def one_turn(self):
         """
@@ -265,6 +439,20 @@ class Match:
         Send info to process, read info from process, validate and process moves
         """
 
+        input_time, input_flag = self.begin_turn()
+        expected_stdout_size = self.game.expected_output_lines(self.current_player)
+        output_time, stdout_stream, stderr_stream = self.read_player_streams(timeout=self.read_timeout(input_time),
+                                                                             expected_stdout_size=expected_stdout_size)
+        self.end_turn(input_time, input_flag, output_time, stdout_stream, stderr_stream)
+
+    def begin_turn(self):
+        """
+        Start the turn of the current player by sending the turn inputs.
+
+        :return: time that the input was sent
+        :return: a flag representing if there was a Broken Pipe Error
+        """
+
         #
         # Mark time that the previous move took
         #
@@ -277,11 +465,37 @@ class Match:
         #
         self.current_player = self.game.current_player()
 
-        input_time, input_flag = self.send_inputs_to_player()
-        output_time, stdout_stream, stderr_stream = self.read_player_streams(timeout=2, expected_stdout_size=1)
+        self.cpu_before = self.player_cpu_time(self.current_player)
+        self.io_before = self.player_processes[self.current_player].io_calls()
+        return self.send_inputs_to_player()
+
+    def end_turn(self, input_time, input_flag, output_time, stdout_stream, stderr_stream):
+        """
+        Finish the turn once the player's output has been read.
+
+        Validate and process the moves of the current player.
+        """
+
+        cpu_after = self.player_cpu_time(self.current_player)
+        if self.cpu_before is not None and cpu_after is not None:
+            cpu_time = cpu_after - self.cpu_before
+        else:
+            cpu_time = None
+        self.turn_rss[self.current_player].add(self.player_rss(self.current_player))
+        self.record_io_calls()
+
+        if self.record_replay:
+            self.record_replay_turn(input_flag, output_time - input_time, stdout_stream, stderr_stream)
+
         moves, message, output_flag = self.validate_player_output(stdout_stream)
+        budget = self.turn_budget(self.current_player)
+        if budget is not None and not input_flag and output_time - input_time > budget:
+            moves, output_flag = None, True
+            message = "timed out: took {:.1f} ms (budget {:.1f} ms)".format((output_time - input_time) * 1e3,
+                                                                            budget * 1e3)
+            self.timeouts[self.current_player] = True
         self.process_players_errors(stderr_stream)
-        self.record_times(input_time, output_time)
+        self.record_times(input_time, output_time, cpu_time)
         if input_flag or output_flag:
             self.kill_player(self.current_player)
             self.issue_logs[self.current_player] = (self.turn, stdout_stream,
@@ -296,7 +510,7 @@ class Match:
         if self.is_active():
             self.process_players_output(moves, deactivated)
 
-        if self.verbose:
+        if self.verbose and self.printing:
             self.print_turn_data(stdout_stream, stderr_stream, message, output_flag, input_time, output_time)
 
     def remaining_players_in_order(self):
@@ -318,22 +532,35 @@ class Match:
             self.kill_player(i)
             self.loss_order.append(i)
 
-        print("--------------------------")
-        print("Game", self.id_number, "results:")
+        if self.printing:
+            self.print_results()
+
+    def print_results(self):
+        """Print the places, times, resources and issues of the players."""
+        self.print("--------------------------")
+        self.print("Game", self.id_number, "results:")
         for place, player in enumerate(reversed(self.loss_order)):
             if self.player_turns[player]:
                 ave_time = self.sum_times[player]/self.player_turns[player]
             else:
                 ave_time = 0.0
             max_time = self.max_times[player]
-            print(place + 1, ":",
-                  "(Player {})".format(player),
-                  self.padded_names[player],
-                  "   [ave: {:.5f} sec, max: {:.5f} sec]".format(ave_time, max_time))
+            ave_cpu_time = self.turn_cpu_times[player].mean()
+            self.print(place + 1, ":",
+                       "(Player {})".format(player),
+                       self.padded_names[player],
+                       "   [ave: {:.5f} sec, max: {:.5f} sec, ave cpu: {:.5f} sec]".format(ave_time, max_time,
+                                                                                         ave_cpu_time))
+            if self.player_turns[player]:
+                self.print("    I/O per turn: {:.2f} writes, {:.2f} reads".format(
+                    self.turn_writes[player] / self.player_turns[player],
+                    self.turn_reads[player] / self.player_turns[player]))
+            if self.resource_usage[player] is not None:
+                self.print("    Resources:", usage_summary(self.resource_usage[player]))
             if self.issue_logs[player]:
                 self.print_error_report(player)
             if self.warnings[player]:
                 for turn, message in self.warnings[player]:
-                    print("    Warning on turn", turn, ":", message)
+                    self.print("    Warning on turn", turn, ":", message)
 
-        print("Total time:", time.perf_counter() - self.total_time, "sec")
+        self.print("Total time:", time.perf_counter() - self.total_time, "sec")
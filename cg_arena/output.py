@@ -0,0 +1,119 @@
+"""
+Where the printed output of the matches goes.
+
+By default a match prints to the terminal.  A tournament can instead give
+every match an output sink:
+
+ - NullSink drops the output.  A match printing to it doesn't even format
+   its headers, turn data and results (see Match.printing), which is the
+   fastest way to play a long tournament.
+ - GameLogSink writes the output of each game to its own buffered log file,
+   <dir>/game_<id>.log (optionally compressed with gzip or zstd), so verbose
+   tournaments don't flood the terminal.
+
+Sinks are picklable, so the worker processes of a tournament open the
+outputs of their own matches.
+"""
+
+import contextlib
+import gzip
+import io
+import os
+
+COMPRESSIONS = {None: "", "gzip": ".gz", "zstd": ".zst"}
+LOG_BUFFER_SIZE = 2**16
+
+
+class NullOutput(io.TextIOBase):
+    """A text stream which drops everything written to it."""
+
+    def writable(self):
+        return True
+
+    def write(self, s):
+        return len(s)
+
+
+def is_null_output(output):
+    """:return: True if the output drops everything (so there is no need to format it)"""
+    return isinstance(output, NullOutput)
+
+
+class NullSink:
+    """Drop the output of every match."""
+
+    def open(self, id_number):
+        """:return: The output of the game (a text stream to use in a with statement)"""
+        return NullOutput()
+
+
+def check_compression(compression):
+    """
+    :param compression: None, "gzip" or "zstd"
+    :raises ValueError: if the compression is unknown or its module isn't installed
+    """
+    if compression not in COMPRESSIONS:
+        raise ValueError("unknown compression {} (choose from gzip, zstd)".format(compression))
+    if compression == "zstd":
+        try:
+            import zstandard  # noqa: F401
+        except ImportError:
+            raise ValueError("zstd compression needs the zstandard package") from None
+
+
+def log_path(directory, id_number, compression=None):
+    """:return: The path of the log file of a game"""
+    return os.path.join(directory, "game_{}.log{}".format(id_number, COMPRESSIONS[compression]))
+
+
+class GameLogSink:
+    """
+    Write the output of every match to its own log file.
+
+    :param str directory: The directory of the log files (created if needed)
+    :param compression: None, "gzip" or "zstd" (needs the zstandard package)
+    """
+
+    def __init__(self, directory, compression=None):
+        check_compression(compression)
+        self.directory = directory
+        self.compression = compression
+        os.makedirs(directory, exist_ok=True)
+
+    def open(self, id_number):
+        """:return: The output of the game (a text stream to use in a with statement)"""
+        path = log_path(self.directory, id_number, self.compression)
+        if self.compression == "gzip":
+            raw = gzip.open(path, "wb", compresslevel=6)
+        elif self.compression == "zstd":
+            import zstandard
+            raw = zstandard.ZstdCompressor().stream_writer(open(path, "wb"), closefd=True)
+        else:
+            raw = open(path, "wb", buffering=0)
+        return io.TextIOWrapper(io.BufferedWriter(raw, LOG_BUFFER_SIZE), encoding="utf-8")
+
+
+def open_log(path):
+    """
+    :param str path: A log file written by GameLogSink
+    :return: The log as a text stream (decompressed)
+    """
+    if path.endswith(".gz"):
+        return gzip.open(path, "rt", encoding="utf-8")
+    if path.endswith(".zst"):
+        import zstandard
+        return io.TextIOWrapper(zstandard.ZstdDecompressor().stream_reader(open(path, "rb"), closefd=True),
+                                encoding="utf-8")
+    return open(path, encoding="utf-8")
+
+
+def open_output(output_sink, id_number):
+    """
+    :param output_sink: A sink (or None for the terminal)
+    :param int id_number: The game id
+    :return: The output of the game in the sink, to use in a with statement
+             (it gives None, i.e. sys.stdout, without a sink)
+    """
+    if output_sink is None:
+        return contextlib.nullcontext()
+    return output_sink.open(id_number)
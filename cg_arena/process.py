@@ -1,70 +1,527 @@
+import collections
+import json
+import os
+import signal
+import socket
+import struct
+import time
 from subprocess import Popen
 from subprocess import PIPE
-from threading import Thread
-from queue import Queue
-from queue import Empty
+from subprocess import DEVNULL
+import selectors
 
+from bot_shim import END_OF_GAME
+from fork_server import PID_FORMAT
+from fork_server import imported_modules
+from resources import memory_limiter
+from resources import proc_usage
+from resources import process_rss
+from resources import rusage_usage
+from resources import usage_since
+from timing import process_cpu_time
 
-# Helper functions to avoid blocking of the streams.
-# We us this technique: http://stackoverflow.com/a/4896288/3494621
+BOT_SHIM = os.path.join(os.path.dirname(os.path.abspath(__file__)), "bot_shim.py")
+FORK_SERVER = os.path.join(os.path.dirname(os.path.abspath(__file__)), "fork_server.py")
 
-def _enqueue_output(out, queue):
-    """
-    Wrap the output stream in a queue, which when placed in a thread,
-    will avoid blocking.
-    """
-    for line in iter(out.readline, ""):  # loop over the out file
-        queue.put(line)
-    out.close()
+READ_SIZE = 65536
 
+# The statistics of the fork servers of one bot, added up over the servers
+ForkServerStats = collections.namedtuple("ForkServerStats", ["servers", "cold_start_time", "spawn_count", "spawn_time",
+                                                             "memory_samples", "total_rss", "total_shared"])
 
-def _convert_output_stream_to_threaded_queue(out):
-    """Convert the output stream to a threaded queue."""
-    out_queue = Queue()
-    t = Thread(target=_enqueue_output, args=(out, out_queue))
-    t.daemon = True  # thread dies with the program
-    t.start()
-    return out_queue
 
-
-def _read_non_blocking(queue, timeout):
+class _StreamReader:
     """
-    Enumerate all the lines currently in the stream queue without waiting for
-    more to be added later.  The timeout is how long I wait for something to
-    come through the buffer.  Once it does, I read without waiting.
+    Splits the output stream of a process into lines as it is read.
+
+    Each read is one system call into a buffer which is reused for the life
+    of the stream.
     """
-    while True:
-        # read line without blocking
-        try:
-            yield queue.get(timeout=timeout)  # or queue.get_nowait()
-            timeout = 0
-        except Empty:
-            return  # done enumerating
+
+    def __init__(self, stream):
+        self.stream = stream
+        self.fd = stream.fileno()
+        self.lines = []  # complete lines which haven't been taken yet
+        self.line_time = None  # when the last complete line arrived
+        self.eof = False
+        self.read_calls = 0
+        self._partial = b""
+        self._buffer = bytearray(READ_SIZE)
+
+    def read(self):
+        """Read what is available on the stream (call only when it is ready)."""
+        size = os.readv(self.fd, [self._buffer])
+        arrival_time = time.perf_counter()
+        self.read_calls += 1
+        data = self._buffer[:size]
+        if not data:
+            self.eof = True
+            if self._partial:
+                self.lines.append(self._partial.decode(errors="replace"))
+                self.line_time = arrival_time
+                self._partial = b""
+            return
+        *lines, self._partial = (self._partial + data).split(b"\n")
+        if lines:
+            self.lines.extend(line.decode(errors="replace") + "\n" for line in lines)
+            self.line_time = arrival_time
+
+    def take_lines(self):
+        lines = self.lines
+        self.lines = []
+        return lines
 
 
 class PlayerProcess:
     """
     Keeps track of a players process including all the tricks we use to avoid
     issues with the streams blocking.
+
+    Both output streams are watched by one selector, so everything the bot
+    wrote to stderr before its last stdout line is read at the same time as
+    that line.
+
+    :param str program_name: The path of the bot script
+    :param options: The command line options passed to the bot
+    :param memory_limit: If given, cap the memory of the bot at this many MB (RLIMIT_AS)
     """
 
-    def __init__(self, program_name, options):
+    def __init__(self, program_name, options, memory_limit=None):
         p = Popen(['python3', '-u', program_name] + options,  # -u prevents
                                                               # buffering on
                                                               # the child's side
                   stdout=PIPE, stdin=PIPE, stderr=PIPE,
-                  bufsize=1,  # Prevents buffering parent's end
-                  universal_newlines=True)  # Streams are text instead of bytes
+                  bufsize=0,  # Unbuffered bytes; the arena writes whole turns at once
+                  preexec_fn=memory_limiter(memory_limit))
         self._process = p
-        self._stdout_queue = _convert_output_stream_to_threaded_queue(p.stdout)
-        self._stderr_queue = _convert_output_stream_to_threaded_queue(p.stderr)
-        self.stdin = p.stdin
+        self.pid = p.pid
+        self.final_usage = None
+        self._attach_streams(p.stdin, p.stdout, p.stderr)
+
+    def _attach_streams(self, stdin, stdout, stderr):
+        """Start watching the output streams of the process."""
+        self.stdin = stdin
+        self.write_calls = 0
+        self._stdout = _StreamReader(stdout)
+        self._stderr = _StreamReader(stderr)
+        self._selector = selectors.DefaultSelector()
+        for reader in (self._stdout, self._stderr):
+            self._selector.register(reader.fd, selectors.EVENT_READ, reader)
+
+    def _poll(self, timeout):
+        """
+        Read whatever is available on the output streams, waiting at most
+        timeout seconds for something to arrive.
+
+        :return: True if something was read
+        """
+        events = self._selector.select(timeout)
+        for key, _ in events:
+            reader = key.data
+            reader.read()
+            if reader.eof:
+                self._selector.unregister(key.fd)
+        return bool(events)
 
-    def read_stdout(self, timeout=.1):
-        return _read_non_blocking(self._stdout_queue, timeout=timeout)
+    def read_streams(self, expected_stdout_lines=1, timeout=.1):
+        """
+        Read the output of the bot for one turn.
 
-    def read_stderr(self, timeout=.1):
-        return _read_non_blocking(self._stderr_queue, timeout=timeout)
+        Returns as soon as the expected number of stdout lines has arrived (or
+        the timeout passes, or stdout closes).  Stderr is then collected
+        without waiting.
+
+        The output time is when the last stdout line was read from the pipe
+        (or the time the reading stopped if there is no stdout line).
+
+        :param int expected_stdout_lines: Number of stdout lines which end the turn
+        :param timeout: The longest time to wait for the stdout lines
+        :return: stdout lines, stderr lines, output time
+        """
+        deadline = time.perf_counter() + timeout
+        while len(self._stdout.lines) < expected_stdout_lines and not self._stdout.eof:
+            remaining = deadline - time.perf_counter()
+            if remaining <= 0 or not self._poll(remaining):
+                break
+        output_time = self._stdout.line_time if self._stdout.lines else time.perf_counter()
+        self._poll(0)
+        return self._stdout.take_lines(), self._stderr.take_lines(), output_time
+
+    def write_input(self, data):
+        """
+        Write to the bot's stdin, in a single system call unless the pipe is full.
+
+        :param bytes data: The input
+        :raises BrokenPipeError: if the bot closed its stdin (likely crashed)
+        """
+        view = memoryview(data)
+        while view:
+            written = os.write(self.stdin.fileno(), view)
+            self.write_calls += 1
+            view = view[written:]
+
+    def io_calls(self):
+        """
+        :return: The number of writes to stdin and the number of reads of
+                 stdout and stderr so far
+        """
+        return self.write_calls, self._stdout.read_calls + self._stderr.read_calls
+
+    def cpu_time(self):
+        """
+        :return: The CPU time used so far by the bot (in seconds), or None if unknown
+        """
+        return process_cpu_time(self.pid) if self.pid is not None else None
+
+    def rss(self):
+        """
+        :return: The resident memory of the bot now (in kB), or None if unknown
+        """
+        return process_rss(self.pid) if self.pid is not None else None
+
+    def resource_usage(self):
+        """
+        :return: The ResourceUsage of the bot in this game (once it is killed), or None if unknown
+        """
+        return self.final_usage
+
+    def _close_streams(self):
+        """Stop watching the output streams and close all the pipes."""
+        self._selector.close()
+        for stream in (self.stdin, self._stdout.stream, self._stderr.stream):
+            try:
+                stream.close()
+            except OSError:
+                pass
 
     def kill(self):
-        self._process.kill()
+        if self._process.returncode is not None:
+            return  # already killed (and reaped)
+        # Read the usage from /proc just before the kill, like AsyncPlayerProcess.kill,
+        # so both engines report the same numbers (the rusage peak RSS would also
+        # count the arena's memory before the exec)
+        usage = proc_usage(self.pid)
+        os.kill(self.pid, signal.SIGKILL)  # not Popen.kill, which would reap an exited bot without its rusage
+        self._close_streams()
+        try:
+            _, status, rusage = os.wait4(self.pid, 0)
+        except ChildProcessError:
+            return
+        self._process.returncode = os.waitstatus_to_exitcode(status)
+        self.final_usage = usage if usage is not None else rusage_usage(rusage)
+
+
+class PersistentPlayerProcess(PlayerProcess):
+    """
+    A player process which is reused for many games.
+
+    The bot runs inside bot_shim.py, which re-executes it for every game.
+    Killing the process only ends the current game and returns the process
+    to its pool.
+    """
+
+    def __init__(self, pool, program_name, options, memory_limit=None):
+        self._pool = pool
+        self.key = (program_name, tuple(options), memory_limit)
+        self._game_start_usage = None
+        super().__init__(BOT_SHIM, [program_name] + options, memory_limit)
+
+    def begin_game(self):
+        """Start measuring the resources used in a new game."""
+        self.final_usage = None
+        self._game_start_usage = proc_usage(self.pid)
+
+    def end_game(self, timeout=1.0):
+        """
+        End the current game and wait for the bot to finish it.
+
+        :param timeout: How long to wait for the bot to finish
+        :return: True if the process is ready for another game
+        """
+        try:
+            self.write_input(END_OF_GAME.encode())
+        except OSError:
+            return False
+
+        # Discard what is left of the game on both streams
+        deadline = time.perf_counter() + timeout
+        finished = set()
+        while len(finished) < 2:
+            for reader in (self._stdout, self._stderr):
+                if any(line.endswith(END_OF_GAME) for line in reader.take_lines()):
+                    finished.add(reader)
+                elif reader.eof and reader not in finished:
+                    return False
+            remaining = deadline - time.perf_counter()
+            if len(finished) < 2 and (remaining <= 0 or not self._poll(remaining)):
+                return False
+        return True
+
+    def kill(self):
+        self.final_usage = usage_since(self._game_start_usage, proc_usage(self.pid))
+        self._pool.release(self)
+
+    def terminate(self):
+        """Kill the process for real."""
+        game_usage = self.final_usage
+        super().kill()
+        self.final_usage = game_usage  # not the usage of the whole life of the process
+
+
+class PersistentProcessPool:
+    """
+    Keeps one long-lived process per bot seat so that bots are not restarted
+    for every game.
+    """
+
+    def __init__(self):
+        self._idle = {}  # (program_name, options, memory_limit) -> list of idle processes
+
+    def start(self, program_name, options, memory_limit=None):
+        """
+        Start a bot for a new game, reusing an idle process if there is one.
+
+        :param str program_name: The path of the bot script
+        :param options: The command line options passed to the bot
+        :param memory_limit: If given, cap the memory of the bot at this many MB
+        :return: A PersistentPlayerProcess
+        """
+        idle = self._idle.get((program_name, tuple(options), memory_limit))
+        process = idle.pop() if idle else PersistentPlayerProcess(self, program_name, options, memory_limit)
+        process.begin_game()
+        return process
+
+    def release(self, process):
+        """
+        End the game of the process and keep it for later if it is still healthy.
+
+        :param process: A PersistentPlayerProcess
+        """
+        if process.end_game():
+            self._idle.setdefault(process.key, []).append(process)
+        else:
+            process.terminate()
+
+    def close(self):
+        """Kill all the idle processes."""
+        for processes in self._idle.values():
+            for process in processes:
+                process.terminate()
+        self._idle = {}
+
+
+def _memory_usage(pid):
+    """
+    Read the resident memory of a process from /proc.
+
+    :param int pid: The process id
+    :return: (resident kB, kB shared with other processes) or None
+    """
+    try:
+        with open("/proc/{}/smaps_rollup".format(pid)) as f:
+            fields = dict(line.split(":", 1) for line in f if ":" in line and not line.startswith(" "))
+    except (OSError, ValueError):
+        return None
+    try:
+        rss = int(fields["Rss"].split()[0])
+        shared = int(fields["Shared_Clean"].split()[0]) + int(fields["Shared_Dirty"].split()[0])
+    except (KeyError, ValueError):
+        return None
+    return rss, shared
+
+
+class ForkedPlayerProcess(PlayerProcess):
+    """
+    A player process forked by a ForkServer.
+
+    To the match it looks exactly like a PlayerProcess.
+    """
+
+    def __init__(self, server, pid, stdin, stdout, stderr):
+        self._server = server
+        self.pid = pid
+        self.final_usage = None
+        self._attach_streams(stdin, stdout, stderr)
+
+    def kill(self):
+        if self.pid is None:
+            return
+        self.final_usage = proc_usage(self.pid)
+        self._server.record_memory(_memory_usage(self.pid))
+        try:
+            os.kill(self.pid, signal.SIGKILL)
+        except ProcessLookupError:
+            pass  # already gone
+        self.pid = None
+        self._close_streams()
+
+
+class ForkServer:
+    """
+    The arena side of a fork_server.py process for one bot.
+
+    Also keeps statistics on how much time and memory the forked children save.
+    """
+
+    def __init__(self, program_name, memory_limit=None):
+        self.program_name = program_name
+        arena_sock, server_sock = socket.socketpair()
+        self._sock = arena_sock
+        # The children inherit the memory limit of the server
+        self._process = Popen(['python3', '-u', FORK_SERVER, str(server_sock.fileno()), program_name],
+                              stdin=DEVNULL, stdout=DEVNULL,
+                              pass_fds=[server_sock.fileno()], preexec_fn=memory_limiter(memory_limit))
+        server_sock.close()
+
+        self.spawn_count = 0
+        self.spawn_time = 0.0
+        self.memory_samples = 0
+        self.total_rss = 0
+        self.total_shared = 0
+        self.cold_start_time = self._measure_cold_start()
+
+    def _measure_cold_start(self):
+        """
+        Time one cold start of an interpreter importing the same modules as the bot.
+
+        :return: the time in seconds
+        """
+        with open(self.program_name) as f:
+            modules = imported_modules(f.read())
+        imports = "".join("try:\n import {}\nexcept Exception:\n pass\n".format(m) for m in modules)
+        start = time.perf_counter()
+        Popen(['python3', '-u', '-c', imports], stdin=DEVNULL, stdout=DEVNULL, stderr=DEVNULL,
+              cwd=os.path.dirname(os.path.abspath(self.program_name))).wait()
+        return time.perf_counter() - start
+
+    def spawn(self, options):
+        """
+        Fork a new child running the bot.
+
+        :param options: The command line options passed to the bot
+        :return: A ForkedPlayerProcess
+        """
+        start = time.perf_counter()
+        stdin_r, stdin_w = os.pipe()
+        stdout_r, stdout_w = os.pipe()
+        stderr_r, stderr_w = os.pipe()
+        child_fds = [stdin_r, stdout_w, stderr_w]
+        try:
+            socket.send_fds(self._sock, [json.dumps(options).encode()], child_fds)
+            pid, = struct.unpack(PID_FORMAT, self._recv_exactly(struct.calcsize(PID_FORMAT)))
+        finally:
+            for fd in child_fds:
+                os.close(fd)
+        stdin = open(stdin_w, "wb", buffering=0)
+        stdout = open(stdout_r, "rb", buffering=0)
+        stderr = open(stderr_r, "rb", buffering=0)
+        self.spawn_count += 1
+        self.spawn_time += time.perf_counter() - start
+        return ForkedPlayerProcess(self, pid, stdin, stdout, stderr)
+
+    def _recv_exactly(self, size):
+        data = b""
+        while len(data) < size:
+            chunk = self._sock.recv(size - len(data))
+            if not chunk:
+                raise ConnectionError("Fork server for {} stopped.".format(self.program_name))
+            data += chunk
+        return data
+
+    def record_memory(self, usage):
+        """Record the memory usage of a child (or None if unknown)."""
+        if usage is not None:
+            rss, shared = usage
+            self.memory_samples += 1
+            self.total_rss += rss
+            self.total_shared += shared
+
+    def statistics(self):
+        """:return: The ForkServerStats of this server"""
+        return ForkServerStats(1, self.cold_start_time, self.spawn_count, self.spawn_time,
+                               self.memory_samples, self.total_rss, self.total_shared)
+
+    def close(self):
+        self._sock.close()  # the server exits when the socket closes
+        self._process.wait()
+
+
+def merge_fork_server_statistics(all_statistics):
+    """
+    Add up the statistics of several ForkServerPools (e.g. those of the
+    worker processes of a tournament).
+
+    :param all_statistics: list of the ForkServerPool.statistics() dicts
+    :return: dict of program name -> ForkServerStats
+    """
+    merged = {}
+    for statistics in all_statistics:
+        for program_name, stats in statistics.items():
+            if program_name in merged:
+                stats = ForkServerStats(*(a + b for a, b in zip(merged[program_name], stats)))
+            merged[program_name] = stats
+    return merged
+
+
+def fork_server_report(statistics):
+    """
+    :param statistics: dict of program name -> ForkServerStats
+    :return: A list of summary lines (of the time and memory saved), one per bot.
+    """
+    lines = []
+    for program_name, stats in statistics.items():
+        line = "Fork server {}: {} children, spawn {:.2f} ms (cold start {:.2f} ms)".format(
+            program_name, stats.spawn_count,
+            1000 * stats.spawn_time / max(stats.spawn_count, 1), 1000 * stats.cold_start_time / stats.servers)
+        if stats.memory_samples:
+            line += ", child RSS {:.1f} MB of which {:.1f} MB shared".format(
+                stats.total_rss / stats.memory_samples / 1024,
+                stats.total_shared / stats.memory_samples / 1024)
+        lines.append(line)
+    return lines
+
+
+class ForkServerPool:
+    """
+    Starts player processes by forking them from one fork server per bot.
+    """
+
+    def __init__(self):
+        self._servers = {}  # (program_name, memory_limit) -> ForkServer
+
+    def start(self, program_name, options, memory_limit=None):
+        """
+        Start a bot for a new game.
+
+        :param str program_name: The path of the bot script
+        :param options: The command line options passed to the bot
+        :param memory_limit: If given, cap the memory of the bot at this many MB
+        :return: A ForkedPlayerProcess
+        """
+        server = self._servers.get((program_name, memory_limit))
+        if server is None:
+            server = self._servers[program_name, memory_limit] = ForkServer(program_name, memory_limit)
+        return server.spawn(options)
+
+    def statistics(self):
+        """:return: dict of program name -> ForkServerStats of its servers (picklable)"""
+        return merge_fork_server_statistics([{server.program_name: server.statistics()}
+                                             for server in self._servers.values()])
+
+    def report(self):
+        """:return: A list of summary lines, one per bot."""
+        return fork_server_report(self.statistics())
+
+    @staticmethod
+    def merged_report(all_statistics):
+        """
+        :param all_statistics: The statistics() of several pools (e.g. one per worker process)
+        :return: A list of summary lines, one per bot.
+        """
+        return fork_server_report(merge_fork_server_statistics(all_statistics))
+
+    def close(self):
+        """Stop all the fork servers."""
+        for server in self._servers.values():
+            server.close()
+        self._servers = {}
@@ -0,0 +1,143 @@
+"""
+Measure where the time of a match goes: in the bots or in the arena.
+
+A Profile wraps the methods of a Match which make up each phase of a game
+(starting the bots, sending the inputs, waiting for the outputs, validating
+and processing them, printing, ...) and adds up the time spent in each.
+Matches which are not profiled are not touched at all, so profiling costs
+nothing when it is off.
+
+The profiles of the games are added up into the profile of the tournament,
+which can also be exported as a Chrome trace (chrome://tracing or
+https://ui.perfetto.dev) with one row per game.
+"""
+
+import inspect
+import json
+import os
+import time
+
+# The methods of Match (and its subclasses) timed as each phase
+PHASES = {"start_player_processes": "spawn",
+          "start": "spawn",  # AsyncMatch
+          "create_game": "setup",
+          "send_init_inputs_to_player": "send_inputs",
+          "send_inputs_to_player": "send_inputs",
+          "read_player_streams": "read_wait",
+          "validate_player_output": "validate",
+          "process_players_output": "process",
+          "print_turn_data": "print",
+          "end_of_game": "teardown"}
+
+# The order of the phases in the summaries
+PHASE_ORDER = ["spawn", "setup", "send_inputs", "read_wait", "validate", "process", "print", "teardown"]
+
+
+class Profile:
+    """
+    The time spent in each phase of one or more games.
+
+    :param game_id: The game profiled (None for the profile of a tournament)
+    :param bool keep_events: Keep every timed call for a Chrome trace (else only the totals)
+    """
+
+    def __init__(self, game_id=None, keep_events=False):
+        self.game_id = game_id
+        self.keep_events = keep_events
+        self.pid = os.getpid()
+        self.totals = {}  # phase -> [calls, seconds]
+        self.events = []  # (phase, pid, game id, start, end)
+        self.games = 0
+        self.game_time = 0.0
+        self.start_time = None
+
+    def record(self, phase, start, end):
+        """Add one timed call of a phase (perf_counter times)."""
+        total = self.totals.get(phase)
+        if total is None:
+            total = self.totals[phase] = [0, 0.0]
+        total[0] += 1
+        total[1] += end - start
+        if self.keep_events:
+            self.events.append((phase, self.pid, self.game_id, start, end))
+
+    def wrap(self, phase, method):
+        """:return: method (a function or a coroutine function) timed as phase."""
+        if inspect.iscoroutinefunction(method):
+            async def timed(*args, **kwargs):
+                start = time.perf_counter()
+                try:
+                    return await method(*args, **kwargs)
+                finally:
+                    self.record(phase, start, time.perf_counter())
+        else:
+            def timed(*args, **kwargs):
+                start = time.perf_counter()
+                try:
+                    return method(*args, **kwargs)
+                finally:
+                    self.record(phase, start, time.perf_counter())
+        return timed
+
+    def instrument(self, match):
+        """
+        Time the phases of a match from now on (call finish at the end of the game).
+
+        :param match: A Match
+        """
+        for name, phase in PHASES.items():
+            method = getattr(match, name, None)
+            if method is not None:
+                setattr(match, name, self.wrap(phase, method))
+        self.start_time = time.perf_counter()
+
+    def finish(self):
+        """Mark the end of the profiled game."""
+        end = time.perf_counter()
+        self.games += 1
+        self.game_time += end - self.start_time
+        if self.keep_events:
+            self.events.append(("game {}".format(self.game_id), self.pid, self.game_id, self.start_time, end))
+
+    def add(self, other):
+        """Add the times of another profile (e.g. of a game) to this one."""
+        for phase, (calls, seconds) in other.totals.items():
+            total = self.totals.setdefault(phase, [0, 0.0])
+            total[0] += calls
+            total[1] += seconds
+        self.events.extend(other.events)
+        self.games += other.games
+        self.game_time += other.game_time
+
+    def _phases(self):
+        """:return: (phase, calls, seconds), with the untimed time of the games as "other"."""
+        phases = [(p, *self.totals[p]) for p in PHASE_ORDER if p in self.totals]
+        other = self.game_time - sum(seconds for _, _, seconds in phases)
+        return phases + [("other", None, max(other, 0.0))]
+
+    def game_summary(self):
+        """:return: One line with the milliseconds spent in each phase."""
+        return "Profile (ms): " + ", ".join("{} {:.2f}".format(phase, seconds * 1e3)
+                                            for phase, _, seconds in self._phases())
+
+    def summary(self):
+        """:return: Lines with the time spent in each phase over all the games."""
+        lines = ["Arena profile: {} games, {:.3f} sec of game time".format(self.games, self.game_time)]
+        for phase, calls, seconds in self._phases():
+            share = 100 * seconds / self.game_time if self.game_time else 0.0
+            per_call = "" if not calls else "{:8} calls, {:9.1f} us/call".format(calls, seconds / calls * 1e6)
+            lines.append("    {:12} {:9.3f} sec {:5.1f}%  {}".format(phase, seconds, share, per_call))
+        return lines
+
+    def chrome_trace(self):
+        """:return: The events as a Chrome trace (JSON-compatible dict)."""
+        t0 = min((start for _, _, _, start, _ in self.events), default=0.0)
+        trace_events = [{"name": phase, "cat": "arena", "ph": "X", "pid": pid,
+                         "tid": game_id if game_id is not None else 0,
+                         "ts": round((start - t0) * 1e6, 3), "dur": round((end - start) * 1e6, 3)}
+                        for phase, pid, game_id, start, end in self.events]
+        return {"traceEvents": trace_events, "displayTimeUnit": "ms"}
+
+    def write_chrome_trace(self, path):
+        with open(path, "w") as f:
+            json.dump(self.chrome_trace(), f)
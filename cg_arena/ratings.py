@@ -0,0 +1,84 @@
+"""
+TrueSkill-style ratings for two player games without draws.
+
+Each bot has a Gaussian belief (mu, sigma) about its skill.  A game is won
+by the bot with the higher performance, drawn from N(skill, beta^2), and the
+belief of both bots is updated with the closed form of the TrueSkill
+factor graph for two players.  Sigma shrinks as a bot plays, so it tells
+how much a rating can still be trusted.
+"""
+
+import math
+
+MU = 25.0
+SIGMA = MU / 3
+BETA = SIGMA / 2  # performance noise: a BETA skill gap wins about 76% of the games
+TAU = SIGMA / 100  # skill drift per game, keeps sigma from reaching 0
+
+
+def _pdf(x):
+    return math.exp(-x * x / 2) / math.sqrt(2 * math.pi)
+
+
+def _cdf(x):
+    return (1 + math.erf(x / math.sqrt(2))) / 2
+
+
+class Ratings:
+    """
+    The ratings of a set of bots.
+
+    :param names: The bots (all start at MU, SIGMA)
+    """
+
+    def __init__(self, names):
+        self.mu = {name: MU for name in names}
+        self.sigma = {name: SIGMA for name in names}
+
+    def _c(self, a, b):
+        return math.sqrt(2 * BETA ** 2 + self.sigma[a] ** 2 + self.sigma[b] ** 2)
+
+    def win_probability(self, a, b):
+        """:return: The probability that bot a beats bot b."""
+        return _cdf((self.mu[a] - self.mu[b]) / self._c(a, b))
+
+    def information(self, a, b):
+        """
+        How much a game between a and b is expected to teach about the ratings.
+
+        It is large when the result is hard to predict (close ratings) and
+        when the ratings are uncertain (large sigmas compared to the noise of
+        a single game).
+
+        :return: p (1 - p) (sigma_a^2 + sigma_b^2) / c^2 where p is the
+                 probability that a wins and c^2 the variance of the difference
+                 of the performances
+        """
+        p = self.win_probability(a, b)
+        return p * (1 - p) * (self.sigma[a] ** 2 + self.sigma[b] ** 2) / self._c(a, b) ** 2
+
+    def rate(self, winner, loser):
+        """
+        Update the ratings after a game.
+
+        :param winner: The bot which won
+        :param loser: The bot which lost
+        """
+        for name in (winner, loser):
+            self.sigma[name] = math.sqrt(self.sigma[name] ** 2 + TAU ** 2)
+        c = self._c(winner, loser)
+        t = (self.mu[winner] - self.mu[loser]) / c
+        v = _pdf(t) / max(_cdf(t), 1e-300)
+        w = v * (v + t)
+        for name, sign in ((winner, 1), (loser, -1)):
+            variance = self.sigma[name] ** 2
+            self.mu[name] += sign * variance / c * v
+            self.sigma[name] = math.sqrt(variance * max(1 - variance / c ** 2 * w, 1e-6))
+
+    def conservative(self, name):
+        """:return: mu - 3 sigma, a rating the bot very likely deserves at least."""
+        return self.mu[name] - 3 * self.sigma[name]
+
+    def ranking(self):
+        """:return: The bots from best to worst conservative rating."""
+        return sorted(self.mu, key=self.conservative, reverse=True)
@@ -0,0 +1,158 @@
+"""
+A compact binary format for replays of matches.
+
+A replay holds everything needed to play a match again without the bots:
+the configuration string, the players and, for every turn, what the player
+printed (as an index into the sorted legal actions when possible), how long
+the turn took and, optionally, the player's stderr.
+
+The file is MAGIC followed by the zlib-compressed replay.  Integers are
+unsigned LEB128 varints and strings are a varint length followed by UTF-8.
+"""
+
+import collections
+import os
+import zlib
+
+MAGIC = b"CGARENA-REPLAY-1\n"
+
+# One turn of a replay.  The action is the index of the printed action in the
+# game's legal actions, or the list of stdout lines if they can't be written
+# as an index.  The stderr is a list of lines, or None if it was not recorded.
+ReplayTurn = collections.namedtuple("ReplayTurn", ["player", "input_flag", "turn_time", "action", "stderr"])
+
+Replay = collections.namedtuple("Replay", ["id_number", "config_str", "player_list", "turns"])
+
+# The flags byte of a turn: the player number is in the low bits
+_PLAYER_MASK = 0x0f
+_INPUT_FLAG = 0x10
+_ACTION_LINES = 0x20
+_HAS_STDERR = 0x40
+
+
+def action_index(stdout_stream, legal_actions):
+    """
+    :param stdout_stream: The lines printed by the player
+    :param legal_actions: The legal action strings (or None)
+    :return: The index of the action printed in legal_actions, or None if the
+             output isn't exactly one legal action
+    """
+    if legal_actions is None or len(stdout_stream) != 1 or not stdout_stream[0].endswith("\n"):
+        return None
+    try:
+        return legal_actions.index(stdout_stream[0][:-1])
+    except ValueError:
+        return None
+
+
+def _write_uint(out, n):
+    while n >= 0x80:
+        out.append(n & 0x7f | 0x80)
+        n >>= 7
+    out.append(n)
+
+
+def _write_str(out, s):
+    data = s.encode()
+    _write_uint(out, len(data))
+    out += data
+
+
+def _write_lines(out, lines):
+    _write_uint(out, len(lines))
+    for line in lines:
+        _write_str(out, line)
+
+
+class _Reader:
+    def __init__(self, data):
+        self.data = data
+        self.pos = 0
+
+    def uint(self):
+        n = shift = 0
+        while True:
+            byte = self.data[self.pos]
+            self.pos += 1
+            n |= (byte & 0x7f) << shift
+            if byte < 0x80:
+                return n
+            shift += 7
+
+    def str(self):
+        size = self.uint()
+        self.pos += size
+        return self.data[self.pos - size:self.pos].decode()
+
+    def lines(self):
+        return [self.str() for _ in range(self.uint())]
+
+
+def encode_replay(replay):
+    """
+    :param replay: A Replay
+    :return: bytes
+    """
+    out = bytearray()
+    _write_uint(out, replay.id_number)
+    _write_str(out, replay.config_str)
+    _write_lines(out, replay.player_list)
+    _write_uint(out, len(replay.turns))
+    for turn in replay.turns:
+        flags = turn.player
+        if turn.input_flag:
+            flags |= _INPUT_FLAG
+        if not isinstance(turn.action, int):
+            flags |= _ACTION_LINES
+        if turn.stderr is not None:
+            flags |= _HAS_STDERR
+        out.append(flags)
+        _write_uint(out, max(0, round(turn.turn_time * 1e6)))  # microseconds
+        if isinstance(turn.action, int):
+            _write_uint(out, turn.action)
+        else:
+            _write_lines(out, turn.action)
+        if turn.stderr is not None:
+            _write_lines(out, turn.stderr)
+    return MAGIC + zlib.compress(bytes(out))
+
+
+def decode_replay(data):
+    """
+    :param bytes data: A replay encoded by encode_replay
+    :return: The Replay
+    :raises ValueError: if data is not a replay
+    """
+    if not data.startswith(MAGIC):
+        raise ValueError("Not a replay file")
+    try:
+        reader = _Reader(zlib.decompress(data[len(MAGIC):]))
+        id_number = reader.uint()
+        config_str = reader.str()
+        player_list = reader.lines()
+        turns = []
+        for _ in range(reader.uint()):
+            flags = reader.data[reader.pos]
+            reader.pos += 1
+            turn_time = reader.uint() / 1e6
+            action = reader.lines() if flags & _ACTION_LINES else reader.uint()
+            stderr = reader.lines() if flags & _HAS_STDERR else None
+            turns.append(ReplayTurn(flags & _PLAYER_MASK, bool(flags & _INPUT_FLAG), turn_time, action, stderr))
+    except (zlib.error, IndexError, UnicodeDecodeError):
+        raise ValueError("Corrupted replay file")
+    return Replay(id_number, config_str, player_list, turns)
+
+
+def replay_path(replay_dir, id_number):
+    """:return: The path of the replay of a tournament game in replay_dir."""
+    return os.path.join(replay_dir, "game_{}.cgr".format(id_number))
+
+
+def write_replay(path, replay):
+    with open(path, "wb") as f:
+        f.write(encode_replay(replay))
+
+
+def read_replay(path):
+    with open(path, "rb") as f:
+        return decode_replay(f.read())
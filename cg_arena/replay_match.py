@@ -0,0 +1,93 @@
+"""
+Play a recorded match again without the bots.
+
+ReplayMatch is a Match whose players are the turns of a replay: instead of
+sending inputs to a process and reading its output, each turn hands the
+recorded output to Match.end_turn, which validates and processes it exactly
+like in the original match (and prints the same verbose output).
+"""
+
+from match import Match
+
+
+class ReplayMatch(Match):
+    """
+    A Match played from a Replay.
+
+    :param replay: The Replay (see replay.read_replay)
+    :param bool verbose: Print information about every move
+    :param bool show_map: Print the game board
+    :param turn_budgets: The timing.TurnBudgets of the original match (or None).  The
+                         recorded turn times are checked against them, so the
+                         same turns time out.
+    """
+
+    def __init__(self, replay, verbose=True, show_map=False, turn_budgets=None):
+        self.replay = replay
+        self.next_turn = 0
+        super().__init__(replay.id_number, replay.config_str, replay.player_list, False, verbose, show_map,
+                         turn_budgets=turn_budgets)
+
+    def start_player_processes(self, process_pool):
+        self.player_processes = [None for _ in self.player_program_list]
+
+    def send_init_inputs_to_player(self):
+        return 0.0, False
+
+    def record_io_calls(self):
+        pass
+
+    def begin_turn(self):
+        """
+        Start the turn of the current player.
+
+        :return: time that the input was sent (always 0)
+        :return: the recorded Broken Pipe Error flag
+        """
+        self.turn += 1
+        self.current_player = self.game.current_player()
+
+        if self.next_turn >= len(self.replay.turns):
+            raise ValueError("The replay ended before the game (turn {})".format(self.turn))
+        replay_turn = self.replay.turns[self.next_turn]
+        if replay_turn.player != self.current_player:
+            raise ValueError("The replay doesn't match the game: turn {} is player {}'s, not player {}'s".format(
+                self.turn, self.current_player, replay_turn.player))
+        if replay_turn.input_flag:
+            self.print("Broken Pipe Error")
+        return 0.0, replay_turn.input_flag
+
+    def one_turn(self):
+        """
+        Replay one turn: hand the recorded output to end_turn.
+        """
+        input_time, input_flag = self.begin_turn()
+        replay_turn = self.replay.turns[self.next_turn]
+        self.next_turn += 1
+
+        if isinstance(replay_turn.action, int):
+            legal_actions = self.game.legal_actions(self.current_player) or []
+            if replay_turn.action >= len(legal_actions):
+                raise ValueError("The replay doesn't match the game: turn {} has no action {}".format(
+                    self.turn, replay_turn.action))
+            stdout_stream = [legal_actions[replay_turn.action] + "\n"]
+        else:
+            stdout_stream = replay_turn.action
+        stderr_stream = replay_turn.stderr or []
+
+        self.end_turn(input_time, input_flag, replay_turn.turn_time, stdout_stream, stderr_stream)
+
+
+def play_replay(replay, verbose=True, show_map=False, turn_budgets=None):
+    """
+    Play a replay from beginning to end.
+
+    :param turn_budgets: The timing.TurnBudgets of the original match (or None)
+    :return: The finished ReplayMatch
+    """
+    match = ReplayMatch(replay, verbose, show_map, turn_budgets)
+    match.pregame()
+    while match.is_active():
+        match.one_turn()
+    match.end_of_game()
+    return match
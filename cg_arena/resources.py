@@ -0,0 +1,174 @@
+"""
+Tools to measure the memory and the other resources used by the bots.
+
+At the end of a game each bot's usage is summarized in a ResourceUsage: its
+peak resident memory, the CPU time it used (user and system) and its
+voluntary and involuntary context switches.  A bot the arena spawned itself
+is reaped with wait4, which returns all of these at once (except the peak
+RSS, which would include the arena's memory from before the exec, so it is
+read from /proc while the bot is still alive, or else taken from the RSS
+sampled after its turns).  Peak RSS is None if it is not known at all.  Bots started in
+other ways (forked by a fork server, reused between games or run by an
+asyncio event loop) are read from /proc just before they are killed.
+
+The memory of a bot can also be capped with RLIMIT_AS: allocations over
+the limit fail, so the bot crashes (MemoryError) and is deactivated.
+"""
+
+import collections
+import os
+import resource
+
+_PAGE_KB = (os.sysconf("SC_PAGE_SIZE") if hasattr(os, "sysconf") else 4096) // 1024
+_CLOCK_TICKS = os.sysconf("SC_CLK_TCK") if hasattr(os, "sysconf") else 100
+
+# Memory in kB, times in seconds.  The turn RSS fields summarize the RSS
+# sampled after each of the bot's turns (None if it couldn't be sampled).
+ResourceUsage = collections.namedtuple("ResourceUsage", ["peak_rss", "user_time", "system_time",
+                                                         "voluntary_switches", "involuntary_switches",
+                                                         "max_turn_rss", "mean_turn_rss"])
+
+
+def process_rss(pid):
+    """
+    :param int pid: The process id
+    :return: The resident memory of the process in kB, or None if it can't be read
+    """
+    try:
+        with open("/proc/{}/statm".format(pid)) as f:
+            rss = int(f.read().split()[1]) * _PAGE_KB
+        return rss or None  # an exited (zombie) process has no memory
+    except (OSError, ValueError, IndexError):
+        return None
+
+
+def proc_usage(pid):
+    """
+    Read the resources used so far by a process from /proc.
+
+    A process which already exited (but isn't reaped yet) has no memory left,
+    so its peak RSS is None, but its CPU times and context switches are still
+    there (they are the ones os.wait4 would give).
+
+    :param int pid: The process id
+    :return: A ResourceUsage (without turn RSS), or None if it can't be read
+    """
+    try:
+        with open("/proc/{}/status".format(pid)) as f:
+            status = dict(line.split(":", 1) for line in f if ":" in line)
+        with open("/proc/{}/stat".format(pid)) as f:
+            # The command name (field 2) can contain spaces, so split after it
+            fields = f.read().rsplit(")", 1)[1].split()
+        return ResourceUsage(int(status["VmHWM"].split()[0]) if "VmHWM" in status else None,
+                             int(fields[11]) / _CLOCK_TICKS, int(fields[12]) / _CLOCK_TICKS,
+                             int(status["voluntary_ctxt_switches"]), int(status["nonvoluntary_ctxt_switches"]),
+                             None, None)
+    except (OSError, ValueError, IndexError, KeyError):
+        return None
+
+
+def rusage_usage(rusage, peak_rss=None):
+    """
+    :param rusage: The resource.struct_rusage of a reaped child (from os.wait4)
+    :param peak_rss: The peak RSS of the child in kB, read from /proc (or
+                     None).  ru_maxrss isn't used: it includes the memory of
+                     the arena before the exec.
+    :return: A ResourceUsage (without turn RSS)
+    """
+    return ResourceUsage(peak_rss, rusage.ru_utime, rusage.ru_stime,
+                         rusage.ru_nvcsw, rusage.ru_nivcsw, None, None)
+
+
+def usage_since(before, after):
+    """
+    :return: The usage between two proc_usage snapshots of a process (the
+             peak RSS is the peak of the whole life of the process), or None
+    """
+    if before is None or after is None:
+        return after
+    return after._replace(user_time=after.user_time - before.user_time,
+                          system_time=after.system_time - before.system_time,
+                          voluntary_switches=after.voluntary_switches - before.voluntary_switches,
+                          involuntary_switches=after.involuntary_switches - before.involuntary_switches)
+
+
+def memory_limiter(memory_limit):
+    """
+    :param memory_limit: The limit in MB (or None)
+    :return: A function which caps the memory of the current process (to run
+             in the child process before it starts the bot), or None
+    """
+    if memory_limit is None:
+        return None
+    limit = int(memory_limit * 1024 * 1024)
+
+    def limit_memory():
+        resource.setrlimit(resource.RLIMIT_AS, (limit, limit))
+    return limit_memory
+
+
+class TurnRSS:
+    """The RSS samples of one bot during a game, in constant memory."""
+
+    def __init__(self):
+        self.count = 0
+        self.total = 0
+        self.max = 0
+
+    def add(self, rss):
+        if rss is not None:
+            self.count += 1
+            self.total += rss
+            self.max = max(self.max, rss)
+
+    def mean(self):
+        return self.total / self.count if self.count else None
+
+
+class ResourceTotals:
+    """The resources used by one bot over many games."""
+
+    def __init__(self):
+        self.games = 0
+        self.peak_rss_games = 0  # games with a known peak RSS
+        self.max_peak_rss = 0
+        self.total_peak_rss = 0
+        self.max_turn_rss = 0
+        self.user_time = 0.0
+        self.system_time = 0.0
+        self.voluntary_switches = 0
+        self.involuntary_switches = 0
+
+    def add(self, usage):
+        """Add the ResourceUsage of one game (or None)."""
+        if usage is None:
+            return
+        self.games += 1
+        if usage.peak_rss is not None:
+            self.peak_rss_games += 1
+            self.max_peak_rss = max(self.max_peak_rss, usage.peak_rss)
+            self.total_peak_rss += usage.peak_rss
+        self.max_turn_rss = max(self.max_turn_rss, usage.max_turn_rss or 0)
+        self.user_time += usage.user_time
+        self.system_time += usage.system_time
+        self.voluntary_switches += usage.voluntary_switches
+        self.involuntary_switches += usage.involuntary_switches
+
+    def summary(self):
+        return ("peak RSS max {:.1f} MB (avg {:.1f} MB), turn RSS max {:.1f} MB, "
+                "cpu user {:.2f} sec sys {:.2f} sec, context switches {} vol {} invol").format(
+            self.max_peak_rss / 1024, self.total_peak_rss / max(self.peak_rss_games, 1) / 1024,
+            self.max_turn_rss / 1024,
+            self.user_time, self.system_time, self.voluntary_switches, self.involuntary_switches)
+
+
+def usage_summary(usage):
+    """:return: A one line summary of the ResourceUsage of one game."""
+    if usage.peak_rss is not None:
+        line = "peak RSS {:.1f} MB".format(usage.peak_rss / 1024)
+    else:
+        line = "peak RSS unknown"
+    if usage.max_turn_rss is not None:
+        line += ", turn RSS avg {:.1f} MB max {:.1f} MB".format(usage.mean_turn_rss / 1024, usage.max_turn_rss / 1024)
+    return line + ", cpu user {:.3f} sec sys {:.3f} sec, context switches {} vol {} invol".format(
+        usage.user_time, usage.system_time, usage.voluntary_switches, usage.involuntary_switches)
@@ -0,0 +1,135 @@
+"""
+An append-only file of the finished games of a tournament.
+
+Each game is one line of JSON, flushed and fsync'd to disk as soon as the
+game is recorded, so the file survives the arena (or the machine) crashing.
+A tournament can then be resumed from it: the recorded games are not played
+again and the statistics are rebuilt from the file.
+"""
+
+import json
+import os
+
+from resources import ResourceUsage
+from timing import LatencyHistogram
+
+
+class ResultsStoreError(ValueError):
+    """A results file which can't be resumed: it is corrupt or from another tournament."""
+
+
+class ResultsStore:
+    """
+    A JSON lines file of GameResults.
+
+    :param str path: The file (created if it doesn't exist)
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self._file = None
+
+    def is_empty(self):
+        """:return: True if no game was recorded in the file yet."""
+        return not os.path.exists(self.path) or os.path.getsize(self.path) == 0
+
+    def load(self, result_type):
+        """
+        Read all the recorded games.
+
+        A crash in the middle of writing can leave a partial last line.  It is
+        dropped (and cut from the file so new games are appended after the
+        last complete one).  A bad line anywhere else means the file is
+        corrupt.
+
+        :param result_type: The namedtuple to build (tournament.GameResult)
+        :return: list of results, in the order they were recorded
+        :raises ResultsStoreError: if a line other than the last one is bad
+        """
+        if self.is_empty():
+            return []
+
+        results = []
+        good_size = 0
+        with open(self.path, "rb") as f:
+            lines = f.readlines()
+        for number, line in enumerate(lines, 1):
+            try:
+                if not line.endswith(b"\n"):
+                    raise ValueError("partially written")
+                results.append(self._decode(line, result_type))
+            except (ValueError, KeyError, TypeError) as e:
+                if number < len(lines):
+                    raise ResultsStoreError("Line {} of {} is corrupt ({})".format(number, self.path, e)) from None
+                break  # the last line was being written
+            good_size += len(line)
+
+        if good_size < os.path.getsize(self.path):
+            os.truncate(self.path, good_size)
+        return results
+
+    def append(self, result):
+        """
+        Record a finished game (on disk when this returns).
+
+        :param result: A GameResult
+        """
+        if self._file is None:
+            self._file = open(self.path, "ab")
+        self._file.write(self._encode(result))
+        self._file.flush()
+        os.fsync(self._file.fileno())
+
+    def close(self):
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+
+    @staticmethod
+    def _encode(result):
+        return (json.dumps(result_record(result), separators=(",", ":")) + "\n").encode()
+
+    @staticmethod
+    def _decode(line, result_type):
+        return result_from_record(json.loads(line), result_type)
+
+
+def result_record(result):
+    """
+    :param result: A GameResult
+    :return: The result as a JSON-compatible dict
+    """
+    record = {"id": result.id_number,
+              "config": result.config_str,
+              "players": list(result.player_list),
+              "results": list(result.results),
+              "errors": list(result.error_flags),
+              "warnings": list(result.warning_flags),
+              "turn_times": [h.to_dict() for h in result.turn_times],
+              "turn_cpu_times": [h.to_dict() for h in result.turn_cpu_times]}
+    if result.resources is not None:
+        record["resources"] = [u._asdict() if u is not None else None for u in result.resources]
+    if result.timeout_flags is not None:
+        record["timeouts"] = list(result.timeout_flags)
+    return record
+
+
+def result_from_record(record, result_type):
+    """
+    :param dict record: A dict made by result_record
+    :param result_type: The namedtuple to build (tournament.GameResult)
+    :return: The result
+    """
+    return result_type(record["id"], tuple(record["players"]), record["config"],
+                       tuple(record["results"]), tuple(record["errors"]), tuple(record["warnings"]),
+                       tuple(LatencyHistogram.from_dict(h) for h in record["turn_times"]),
+                       tuple(LatencyHistogram.from_dict(h) for h in record["turn_cpu_times"]),
+                       _decode_resources(record.get("resources")),
+                       tuple(record["timeouts"]) if "timeouts" in record else None)
+
+
+def _decode_resources(resources):
+    # Files written before the resources were recorded don't have them
+    if resources is None:
+        return None
+    return tuple(ResourceUsage(**u) if u is not None else None for u in resources)
@@ -0,0 +1,140 @@
+"""
+A sequential probability ratio test (SPRT) for two-bot tournaments.
+
+The tournament plays games in mirrored pairs (same configuration, the bots
+swap seats), so the test is run on pairs: a pair scores 1 if the first bot
+won both games, 0.5 if the bots won one each and 0 if the first bot lost
+both.  The test decides between
+
+    H0: the first bot is elo0 Elo stronger than the second (usually 0)
+    H1: the first bot is elo1 Elo stronger than the second
+
+with error rates alpha (accepting H1 when H0 holds) and beta (accepting H0
+when H1 holds), as soon as the evidence allows.  It uses the usual normal
+approximation of the log-likelihood ratio (as in chess engine testing):
+
+    LLR = N (s1 - s0) (2 m - s0 - s1) / (2 v)
+
+where m and v are the mean and variance of the pair scores and s0, s1 the
+scores expected under H0 and H1.
+"""
+
+import math
+
+# Pseudo-count added to each pair outcome when estimating the variance, so
+# that a few pairs with the same outcome don't end the test
+PSEUDO_COUNT = 0.5
+
+# z-score of the reported confidence interval (95%)
+INTERVAL_Z = 1.959964
+
+
+def elo_to_score(elo):
+    """:return: The expected score of a player elo Elo stronger than their opponent."""
+    return 1 / (1 + 10 ** (-elo / 400))
+
+
+def score_to_elo(score):
+    """:return: The Elo difference which gives this expected score."""
+    score = min(max(score, 1e-6), 1 - 1e-6)
+    return -400 * math.log10(1 / score - 1)
+
+
+class SPRT:
+    """
+    The state of a sequential probability ratio test.
+
+    :param float elo0: The Elo difference of H0
+    :param float elo1: The Elo difference of H1 (greater than elo0)
+    :param float alpha: Probability of accepting H1 when H0 is true
+    :param float beta: Probability of accepting H0 when H1 is true
+    """
+
+    def __init__(self, elo0, elo1, alpha=0.05, beta=0.05):
+        if not elo0 < elo1:
+            raise ValueError("elo0 must be less than elo1")
+        if not (0 < alpha < 1 and 0 < beta < 1):
+            raise ValueError("alpha and beta must be between 0 and 1")
+        self.elo0 = elo0
+        self.elo1 = elo1
+        self.alpha = alpha
+        self.beta = beta
+        self.lower_bound = math.log(beta / (1 - alpha))
+        self.upper_bound = math.log((1 - beta) / alpha)
+        self.pair_counts = [0, 0, 0]  # pairs scoring 0, 0.5 and 1
+        self.accepted = None  # "H0" or "H1" once the LLR crossed a bound
+        self.decision_pairs = None  # number of pairs when it did
+
+    def add_pair(self, score):
+        """
+        Add the result of a pair of games.
+
+        Pairs added after a decision (games which were already running) still
+        count in the statistics, but don't change the decision.
+
+        :param score: The first bot's share of the pair's wins (0, 0.5 or 1)
+        """
+        self.pair_counts[round(score * 2)] += 1
+        if self.accepted is None:
+            llr = self.llr()
+            if llr >= self.upper_bound:
+                self.accepted = "H1"
+            elif llr <= self.lower_bound:
+                self.accepted = "H0"
+            if self.accepted is not None:
+                self.decision_pairs = self.pairs()
+
+    def pairs(self):
+        return sum(self.pair_counts)
+
+    def mean(self):
+        """:return: The average pair score (0.5 if there are no pairs)."""
+        n = self.pairs()
+        return (0.5 * self.pair_counts[1] + self.pair_counts[2]) / n if n else 0.5
+
+    def variance(self):
+        """:return: The (regularized) variance of the pair scores."""
+        counts = [c + PSEUDO_COUNT for c in self.pair_counts]
+        n = sum(counts)
+        mean = (0.5 * counts[1] + counts[2]) / n
+        return (0.25 * counts[1] + counts[2]) / n - mean ** 2
+
+    def llr(self):
+        """:return: The log-likelihood ratio of H1 against H0."""
+        s0, s1 = elo_to_score(self.elo0), elo_to_score(self.elo1)
+        return self.pairs() * (s1 - s0) * (2 * self.mean() - s0 - s1) / (2 * self.variance())
+
+    def decision(self):
+        """:return: "H1" or "H0" once the test has accepted one, else None."""
+        return self.accepted
+
+    def elo_interval(self):
+        """:return: The estimated Elo difference and its 95% confidence interval."""
+        n = max(self.pairs(), 1)
+        mean = self.mean()
+        margin = INTERVAL_Z * math.sqrt(self.variance() / n)
+        return score_to_elo(mean), score_to_elo(mean - margin), score_to_elo(mean + margin)
+
+    def summary(self, program_names):
+        """
+        :param program_names: The names of the two bots
+        :return: Lines describing the state of the test
+        """
+        first, second = program_names
+        elo, low, high = self.elo_interval()
+        decision = self.decision()
+        if decision == "H1":
+            verdict = "H1 accepted after {} pairs: {} is at least {:+g} Elo stronger".format(
+                self.decision_pairs, first, self.elo1)
+        elif decision == "H0":
+            verdict = "H0 accepted after {} pairs: {} is not {:+g} Elo stronger".format(
+                self.decision_pairs, first, self.elo1)
+        else:
+            verdict = "no decision yet"
+        return ["SPRT elo0={:g} elo1={:g} alpha={:g} beta={:g}: {}".format(
+                    self.elo0, self.elo1, self.alpha, self.beta, verdict),
+                "    LLR {:.3f} [{:.3f}, {:.3f}] after {} pairs ({} both won, {} split, {} both lost)".format(
+                    self.llr(), self.lower_bound, self.upper_bound, self.pairs(),
+                    self.pair_counts[2], self.pair_counts[1], self.pair_counts[0]),
+                "    Elo difference {} - {}: {:+.1f} (95% interval {:+.1f} to {:+.1f})".format(
+                    first, second, elo, low, high)]
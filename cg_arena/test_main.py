@@ -1,6 +1,49 @@
+import asyncio
+import contextlib
+import io
+import json
+import os
+import socket
+import subprocess
+import sys
+import tempfile
+import threading
+import time
 from unittest import TestCase
 
 import arena
+from async_match import AsyncPlayerProcess
+from game import Game
+from game.corpus import Corpus
+from game.corpus import write_corpus
+from game.ww.transposition import TRANSPOSITION_CACHE
+from distributed import Coordinator
+from league import League
+from output import GameLogSink
+from output import NullOutput
+from output import NullSink
+from output import log_path
+from output import open_log
+from match import Match
+from process import PlayerProcess
+from process import _StreamReader
+from ratings import Ratings
+from resources import ResourceTotals
+from results_store import ResultsStore
+from results_store import ResultsStoreError
+from sprt import SPRT
+from timing import LatencyHistogram
+from timing import TurnBudgets
+from timing import process_cpu_time
+from tournament import GameList
+from tournament import GameResult
+from tournament import Tournament
+from tournament import _init_worker
+from tournament import game_settings
+from tournament import play_match
+from replay import read_replay
+from replay import replay_path
+from replay_match import play_replay
 
 
 class TestMain(TestCase):
@@ -16,3 +59,483 @@ class TestMain(TestCase):
         file2 = '../examples/ww/default.py'
         arena.Arena(["arena", file1, file2, '-n 1', '-v']).run()
 
+    def test_usage(self):
+        """Test the usage string mentions every option."""
+        for option in arena.SHORT_OPTIONS.replace(":", ""):
+            self.assertRegex(arena.USAGE, "-" + option + r"\b")
+        for option in arena.LONG_OPTIONS:
+            self.assertIn("--" + option.rstrip("="), arena.USAGE)
+
+    def test_parallel_tournament(self):
+        """Test a tournament played by a pool of worker processes."""
+        file1 = '../examples/ww/simple.py'
+        file2 = '../examples/ww/random_move.py'
+        arena.Arena(["arena", file1, file2, '-n 4', '-j 2']).run()
+
+    def test_persistent_processes(self):
+        """Test a tournament which reuses the bot processes between games."""
+        file1 = '../examples/ww/simple.py'
+        file2 = '../examples/ww/default.py'
+        arena.Arena(["arena", file1, file2, '-n 4', '-p']).run()
+
+    def test_fork_server(self):
+        """Test a tournament which forks the bot processes from fork servers."""
+        file1 = '../examples/ww/simple.py'
+        file2 = '../examples/ww/random_move.py'
+        arena.Arena(["arena", file1, file2, '-n 2', '-f']).run()
+
+    def test_parallel_fork_server_report(self):
+        """Test the fork servers of the worker processes are reported together."""
+        file1 = '../examples/ww/simple.py'
+        file2 = '../examples/ww/default.py'
+        with contextlib.redirect_stdout(io.StringIO()) as stream:
+            arena.Arena(["arena", file1, file2, '-n 4', '-j 2', '-f']).run()
+        reports = [line for line in stream.getvalue().split("\n") if line.startswith("Fork server")]
+        self.assertEqual(len(reports), 2)
+        for report in reports:
+            self.assertIn(": 4 children", report)
+
+    def test_async_tournament(self):
+        """Test a tournament played concurrently in one asyncio event loop."""
+        file1 = '../examples/ww/simple.py'
+        file2 = '../examples/ww/random_move.py'
+        arena.Arena(["arena", file1, file2, '-n 4', '-a 4']).run()
+
+    def test_async_matches_serial(self):
+        """Test the asyncio engine plays the same games, and measures the same resources, as the serial one."""
+        file1 = '../examples/ww/simple.py'
+        file2 = '../examples/ww/default.py'
+        games = []
+        with tempfile.TemporaryDirectory() as directory:
+            for options in ([], ['-a', '4']):
+                path = os.path.join(directory, "results{}.jsonl".format(len(games)))
+                with contextlib.redirect_stdout(io.StringIO()):
+                    arena.Arena(["arena", file1, file2, '-n 4', '-o', path] + options).run()
+                games.append(sorted(ResultsStore(path).load(GameResult), key=lambda r: r.id_number))
+        serial, concurrent = games
+        self.assertEqual(len(serial), 4)
+        for serial_result, async_result in zip(serial, concurrent):
+            self.assertEqual(serial_result[:6], async_result[:6])  # players, configuration, placements and flags
+            for serial_usage, async_usage in zip(serial_result.resources, async_result.resources):
+                self.assertEqual([value is None for value in serial_usage], [value is None for value in async_usage])
+                self.assertGreater(async_usage[0], 0)  # peak RSS
+
+    def test_resume_tournament(self):
+        """Test a tournament recorded in a results file can be resumed after a crash."""
+        file1 = '../examples/ww/simple.py'
+        file2 = '../examples/ww/default.py'
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, "results.jsonl")
+            arena.Arena(["arena", file1, file2, '-n 4', '-o', path]).run()
+            with open(path) as f:
+                lines = f.readlines()
+            with open(path, "w") as f:
+                f.writelines(lines[:2])
+                f.write(lines[2][:20])  # crashed while writing the third game
+
+            arena.Arena(["arena", file1, file2, '-n 4', '-o', path, '--resume']).run()
+            with open(path) as f:
+                resumed_lines = f.readlines()
+            self.assertEqual(resumed_lines[:2], lines[:2])
+            self.assertEqual(sorted(json.loads(line)["id"] for line in resumed_lines), [0, 1, 2, 3])
+
+            # A bad line in the middle of the file isn't a crash while writing: it isn't cut
+            with open(path, "w") as f:
+                f.writelines([lines[0], lines[1][:20] + "\n", lines[2]])
+            with self.assertRaises(ResultsStoreError):
+                ResultsStore(path).load(GameResult)
+            with self.assertRaises(SystemExit), contextlib.redirect_stdout(io.StringIO()):
+                arena.Arena(["arena", file1, file2, '-n 4', '-o', path, '--resume']).run()
+            with open(path) as f:
+                self.assertEqual(len(f.readlines()), 3)
+
+    def test_replay(self):
+        """Test the replays of a tournament replay the games without the bots."""
+        file1 = '../examples/ww/simple.py'
+        file2 = '../examples/ww/random_move.py'
+        with tempfile.TemporaryDirectory() as directory:
+            results_path = os.path.join(directory, "results.jsonl")
+            arena.Arena(["arena", file1, file2, '-n 2', '-o', results_path, '-r', directory, '--replay-stderr']).run()
+            with open(results_path) as f:
+                records = [json.loads(line) for line in f]
+
+            for record in records:
+                path = replay_path(directory, record["id"])
+                with contextlib.redirect_stdout(io.StringIO()):
+                    match = play_replay(read_replay(path))
+                self.assertEqual(list(reversed(match.loss_order)), record["results"])
+            arena.Arena(["arena", "--replay", path, "-m"]).run()
+
+    def test_sprt(self):
+        """Test the SPRT stops a tournament between bots of different strength early."""
+        file1 = '../examples/ww/simple.py'
+        file2 = '../examples/ww/random_move.py'
+        sprt = SPRT(0, 50)
+        t = Tournament(400, [file1, file2], None, False, False, False, async_games=8, sprt=sprt)
+        with contextlib.redirect_stdout(io.StringIO()):
+            t.play_all_games()
+        self.assertEqual(sprt.decision(), "H1")
+        self.assertLess(t.games_played, 400)
+        self.assertEqual(sprt.pairs(), t.games_played // 2)
+        elo, low, high = sprt.elo_interval()
+        self.assertLess(low, elo)
+        self.assertLess(elo, high)
+
+    def test_league(self):
+        """Test a league ranks more than four bots and plays the informative pairs."""
+        with tempfile.TemporaryDirectory() as directory:
+            bots = []
+            for i in range(3):
+                for name in ('simple', 'random_move'):
+                    bots.append(os.path.join(directory, "{}_{}.py".format(name, i)))
+                    with open('../examples/ww/{}.py'.format(name)) as src, open(bots[-1], "w") as dst:
+                        dst.write(src.read())
+            arena.Arena(["arena", "-l", *bots, '-n 4', '-a 4']).run()
+
+            league = League(30, bots, False, False, False, async_games=6)
+            with contextlib.redirect_stdout(io.StringIO()):
+                league.play_all_games()
+            self.assertEqual(league.games_played, 30)
+            self.assertEqual(sum(league.games_by_bot.values()), 60)
+            self.assertTrue(all(sigma < 25 / 3 for sigma in league.ratings.sigma.values()))
+
+            # A resumed league plays new configurations
+            path = os.path.join(directory, "league.jsonl")
+            with contextlib.redirect_stdout(io.StringIO()):
+                League(4, bots[:2], False, False, False, results_store=ResultsStore(path)).play_all_games()
+                League(8, bots[:2], False, False, False, results_store=ResultsStore(path)).play_all_games()
+            config_strs = [result.config_str for result in ResultsStore(path).load(GameResult)]
+            self.assertEqual(len(config_strs), 8)
+            self.assertEqual(len(set(config_strs)), 4)  # one per pair of games
+
+        ratings = Ratings(["a", "b", "c"])
+        for _ in range(5):
+            ratings.rate("a", "c")
+        self.assertEqual(ratings.ranking()[0], "a")
+        self.assertGreater(ratings.win_probability("a", "c"), 0.9)
+        self.assertLess(ratings.sigma["a"], ratings.sigma["b"])
+        self.assertGreater(ratings.information("a", "b"), ratings.information("a", "c"))
+
+    def test_profile(self):
+        """Test the arena phases are timed and exported as a Chrome trace."""
+        file1 = '../examples/ww/simple.py'
+        file2 = '../examples/ww/random_move.py'
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, "trace.json")
+            with contextlib.redirect_stdout(io.StringIO()) as stream:
+                arena.Arena(["arena", file1, file2, '-n 2', '-j 2', '--profile-trace', path]).run()
+            self.assertIn("Arena profile: 2 games", stream.getvalue())
+            with open(path) as f:
+                events = json.load(f)["traceEvents"]
+            self.assertEqual({e["tid"] for e in events}, {0, 1})
+            phases = {e["name"] for e in events}
+            for phase in ("spawn", "setup", "send_inputs", "read_wait", "validate", "process", "teardown"):
+                self.assertIn(phase, phases)
+
+    def test_resources(self):
+        """Test the resources of the bots are recorded and their memory can be capped."""
+        player_list = ['../examples/ww/simple.py', '../examples/ww/random_move.py']
+        with contextlib.redirect_stdout(io.StringIO()) as stream:
+            result = play_match(0, player_list, "mapIndex=0;seed=1", False, False, False)
+        self.assertIn("Resources: peak RSS", stream.getvalue())
+        for usage in result.resources:
+            self.assertGreater(usage.peak_rss, 0)
+            self.assertGreaterEqual(usage.peak_rss, usage.max_turn_rss)
+            self.assertGreater(usage.user_time + usage.system_time, 0)
+
+        # A bot which exits at once doesn't get the memory of the arena before the exec
+        ballast = b"x" * (200 * 2**20)
+        with tempfile.TemporaryDirectory() as directory, contextlib.redirect_stdout(io.StringIO()):
+            crash = os.path.join(directory, "crash.py")
+            with open(crash, "w") as f:
+                f.write("import sys\nsys.exit(1)\n")
+            result = play_match(0, [crash, player_list[0]], "mapIndex=0;seed=1", False, False, False)
+        del ballast
+        self.assertTrue(result.resources[0].peak_rss is None or result.resources[0].peak_rss < 100 * 1024)
+        totals = ResourceTotals()
+        for usage in result.resources:
+            totals.add(usage)
+        self.assertLess(totals.max_peak_rss, 100 * 1024)
+
+        # A bot can't even start python in 10 MB
+        with contextlib.redirect_stdout(io.StringIO()):
+            result = play_match(0, player_list, "mapIndex=0;seed=1", False, False, False, memory_limit=10)
+        self.assertEqual(result.error_flags, (True, True))
+        for limit in ('0', '-5'):
+            with self.assertRaises(SystemExit), contextlib.redirect_stdout(io.StringIO()):
+                arena.Arena(["arena"] + player_list + ['-M', limit]).run()
+
+    def test_turn_budgets(self):
+        """Test a bot which hangs is killed as soon as its budget and the grace period run out."""
+        hung_bot = ("import time\n"
+                    "input()\n"
+                    "time.sleep(10)\n")
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, "hung_bot.py")
+            with open(path, "w") as f:
+                f.write(hung_bot)
+            start = time.perf_counter()
+            with contextlib.redirect_stdout(io.StringIO()) as stream:
+                result = play_match(0, [path, '../examples/ww/random_move.py'], "mapIndex=0;seed=1",
+                                    False, False, False, turn_budgets=TurnBudgets(0.3, 0.05, 0.05))
+            self.assertLess(time.perf_counter() - start, 2)
+        self.assertEqual(result.timeout_flags, (True, False))
+        self.assertEqual(result.results, (1, 0))
+        self.assertIn("timed out", stream.getvalue())
+
+    def test_game_list(self):
+        """Test the lists of games keep their first and last games in any order."""
+        games = GameList(keep=3)
+        for game in (5, 1, 9, 3, 7, 2, 8):
+            games.add(game)
+        self.assertEqual(len(games), 7)
+        self.assertEqual(str(games), "1, 2, 3, ..., 7, 8, 9")
+        games = GameList(keep=3)
+        for game in ((2, 3), (0, 1)):
+            games.add(game)
+        self.assertEqual(str(games), "(0, 1), (2, 3)")
+
+    def test_distributed_tournament(self):
+        """Test workers on localhost play the same tournament as one machine, even if one dies."""
+        file1 = '../examples/ww/simple.py'
+        file2 = '../examples/ww/default.py'
+        with contextlib.redirect_stdout(io.StringIO()):
+            local = Tournament(12, [file1, file2], None, False, False, False)
+            local.play_all_games()
+
+            coordinator = Coordinator("localhost", 0)
+            distributed = Tournament(12, [file1, file2], None, False, False, False, coordinator=coordinator)
+            thread = threading.Thread(target=distributed.play_all_games)
+            thread.start()
+            coordinator.listening.wait(10)
+            address = "localhost:{}".format(coordinator.port)
+
+            # A worker which takes three games and dies
+            with socket.create_connection(("localhost", coordinator.port)) as connection, \
+                    connection.makefile("rwb") as stream:
+                for message in ({"type": "hello"}, {"type": "request", "size": 3}):
+                    stream.write((json.dumps(message) + "\n").encode())
+                    stream.flush()
+                    stream.readline()
+            time.sleep(0.2)
+
+            workers = [subprocess.Popen([sys.executable, "__main__.py", "--worker", address, "-j", "2"],
+                                        stdout=subprocess.DEVNULL) for _ in range(2)]
+            for worker in workers:
+                worker.wait(60)
+            thread.join(60)
+
+        self.assertEqual(coordinator.redispatched, 3)
+        self.assertEqual(distributed.games_played, 12)
+        self.assertEqual(distributed.wins, local.wins)
+        self.assertEqual(distributed.placements, local.placements)
+        self.assertEqual(distributed.diff_wins, local.diff_wins)
+        self.assertEqual(str(distributed.games_to_look_at), str(local.games_to_look_at))
+
+    def test_distributed_refill(self):
+        """Test a lone worker which asks for games while it plays others gets its results recorded."""
+        file1 = '../examples/ww/simple.py'
+        file2 = '../examples/ww/default.py'
+        with contextlib.redirect_stdout(io.StringIO()):
+            coordinator = Coordinator("localhost", 0)
+            distributed = Tournament(8, [file1, file2], None, False, False, False, coordinator=coordinator)
+            thread = threading.Thread(target=distributed.play_all_games, daemon=True)
+            thread.start()
+            coordinator.listening.wait(10)
+            worker = subprocess.run([sys.executable, "__main__.py", "--worker", "localhost:{}".format(coordinator.port),
+                                     "-j", "3"], stdout=subprocess.PIPE, timeout=60)
+            thread.join(60)
+        self.assertFalse(thread.is_alive())
+        self.assertEqual(distributed.games_played, 8)
+        self.assertIn(b"Worker played 8 games", worker.stdout)
+
+    def test_concurrent_pairs(self):
+        """Test the double game and a tournament of concurrent pairs print and play like before."""
+        file1 = '../examples/ww/simple.py'
+        file2 = '../examples/ww/default.py'
+        with contextlib.redirect_stdout(io.StringIO()) as stream:
+            arena.Arena(["arena", file1, file2, '-d', 'mapIndex=1;seed=5', '-m']).run()
+        lines = [line.rstrip() for line in stream.getvalue().split("\n")]
+        self.assertIn("Game: 0".ljust(80) + "Game: 1", lines)
+        self.assertTrue(any(line.startswith("Game 0 results:") and "Game 1 results:" in line for line in lines))
+
+        with contextlib.redirect_stdout(io.StringIO()) as stream:
+            serial = Tournament(6, [file1, file2], None, False, True, False)
+            serial.play_all_games()
+            pairs = Tournament(6, [file1, file2], None, False, True, False, concurrent_sets=True)
+            pairs.play_all_games()
+        self.assertEqual(pairs.games_played, 6)
+        self.assertEqual(pairs.wins, serial.wins)
+        self.assertEqual(pairs.placements, serial.placements)
+        self.assertEqual(str(pairs.games_to_look_at), str(serial.games_to_look_at))
+        games = [line for line in stream.getvalue().split("\n") if line.startswith("Game:")]
+        self.assertEqual(games, ["Game: {}".format(i) for i in range(6)] * 2)  # each game's output in one piece
+
+    def test_output_sinks(self):
+        """Test the output of tournament games can be dropped or written to compressed logs."""
+        file1 = '../examples/ww/simple.py'
+        file2 = '../examples/ww/default.py'
+        with contextlib.redirect_stdout(io.StringIO()) as stream:
+            Tournament(2, [file1, file2], None, False, True, False, output_sink=NullSink()).play_all_games()
+        self.assertNotIn("Game:", stream.getvalue())
+        self.assertIn("Tournament Results", stream.getvalue())
+
+        with tempfile.TemporaryDirectory() as directory, contextlib.redirect_stdout(io.StringIO()) as stream:
+            sink = GameLogSink(directory, "gzip")
+            Tournament(4, [file1, file2], None, False, True, False, jobs=2, output_sink=sink).play_all_games()
+            self.assertNotIn("Game:", stream.getvalue())
+            for i in range(4):
+                with open_log(log_path(directory, i, "gzip")) as f:
+                    log = f.read()
+                self.assertIn("Game: {}\n".format(i), log)
+                self.assertIn("Standard Output Stream:", log)
+                self.assertIn("Game {} results:".format(i), log)
+
+    def test_worker_game_settings(self):
+        """Test the worker processes get the engine, corpus and cache size without relying on fork."""
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, "corpus.bin")
+            write_corpus(path, ["mapIndex=0;seed=1", "mapIndex=1;seed=2"])
+            try:
+                Game.engine, Game.corpus = "bitboard", Corpus(path)
+                TRANSPOSITION_CACHE.resize(123)
+                settings = game_settings()
+                Game.engine, Game.corpus = "numpy", None  # the state of a freshly spawned worker
+                TRANSPOSITION_CACHE.resize(10000)
+                _init_worker(None, None, settings)
+                self.assertEqual(Game.engine, "bitboard")
+                self.assertEqual(Game.corpus.path, path)
+                self.assertEqual(TRANSPOSITION_CACHE.maxsize, 123)
+            finally:
+                Game.engine, Game.corpus = "numpy", None
+                TRANSPOSITION_CACHE.resize(10000)
+
+
+def start_bot(directory, source, process_type=PlayerProcess):
+    """Write a bot script in the directory and start it (an AsyncPlayerProcess must be awaited)."""
+    path = os.path.join(directory, "bot.py")
+    with open(path, "w") as f:
+        f.write(source)
+    if process_type is AsyncPlayerProcess:
+        return AsyncPlayerProcess.create(path, [])
+    return process_type(path, [])
+
+
+class TestPlayerProcess(TestCase):
+    def test_read_streams(self):
+        """Test the output of a turn is returned as soon as its lines arrive, with the stderr written before them."""
+        source = ("import sys, time\n"
+                  "print('debug', file=sys.stderr)\n"
+                  "print('a')\nprint('b')\nprint('c')\n"
+                  "time.sleep(10)\n")
+        expected = (["a\n", "b\n", "c\n"], ["debug\n"])
+
+        with tempfile.TemporaryDirectory() as directory:
+            p = start_bot(directory, source)
+            try:
+                start = time.perf_counter()
+                stdout_lines, stderr_lines, output_time = p.read_streams(3, timeout=5)
+                self.assertLess(time.perf_counter() - start, 2)
+                self.assertEqual((stdout_lines, stderr_lines), expected)
+                self.assertLessEqual(output_time, time.perf_counter())
+            finally:
+                p.kill()
+
+            async def read_async():
+                p = await start_bot(directory, source, AsyncPlayerProcess)
+                try:
+                    start = time.perf_counter()
+                    stdout_lines, stderr_lines, _ = await p.read_streams(3, timeout=5)
+                    return time.perf_counter() - start, (stdout_lines, stderr_lines)
+                finally:
+                    await p.wait_closed()
+
+            elapsed, lines = asyncio.run(read_async())
+            self.assertLess(elapsed, 2)
+            self.assertEqual(lines, expected)
+
+    def test_one_write_per_turn(self):
+        """Test all the input lines of a turn are written to the bot in one system call."""
+        match = Match(0, "mapIndex=0;seed=1", ['../examples/ww/simple.py', '../examples/ww/simple.py'],
+                      False, False, False, output=NullOutput())
+        try:
+            match.pregame()
+            while match.is_active():
+                match.one_turn()
+            match.end_of_game()
+        finally:
+            for p in match.player_processes:
+                if p:
+                    p.kill()
+        self.assertGreater(min(match.player_turns), 5)
+        self.assertEqual(match.turn_writes, match.player_turns)
+
+    def test_stream_reader_lines(self):
+        """Test lines split across reads are put back together, and a partial last line is kept at EOF."""
+        read_fd, write_fd = os.pipe()
+        with open(read_fd, "rb", buffering=0) as stream:
+            reader = _StreamReader(stream)
+            os.write(write_fd, b"first li")
+            reader.read()
+            self.assertEqual(reader.take_lines(), [])
+            os.write(write_fd, b"ne\nsecond line\nlast")
+            reader.read()
+            self.assertEqual(reader.take_lines(), ["first line\n", "second line\n"])
+            os.close(write_fd)
+            reader.read()
+            self.assertTrue(reader.eof)
+            self.assertEqual(reader.take_lines(), ["last"])
+            self.assertEqual(reader.read_calls, 3)
+
+
+class TestTiming(TestCase):
+    def assertWithinBucket(self, estimate, exact):
+        ratio = 10 ** (1 / LatencyHistogram.BUCKETS_PER_DECADE)
+        self.assertGreaterEqual(estimate, exact / ratio)
+        self.assertLessEqual(estimate, exact * ratio)
+
+    def test_latency_histogram(self):
+        """Test the percentiles of a histogram, and of merged histograms, are within a bucket of the exact ones."""
+        times = [i / 1000 for i in range(1, 101)]  # 1 to 100 ms
+        histogram = LatencyHistogram()
+        for t in times:
+            histogram.add(t)
+        self.assertEqual((histogram.count, histogram.max), (100, 0.1))
+        self.assertAlmostEqual(histogram.mean(), 0.0505)
+        for p in (1, 10, 50, 90, 99, 100):
+            self.assertWithinBucket(histogram.percentile(p), times[p - 1])
+
+        odd, even = LatencyHistogram(), LatencyHistogram()
+        for t in times[::2]:
+            odd.add(t)
+        for t in times[1::2]:
+            even.add(t)
+        odd.merge(even)
+        self.assertEqual(odd.counts, histogram.counts)
+        self.assertEqual((odd.count, odd.max), (histogram.count, histogram.max))
+        self.assertAlmostEqual(odd.total, histogram.total)
+        for p in (1, 10, 50, 90, 99, 100):
+            self.assertEqual(odd.percentile(p), histogram.percentile(p))
+
+        self.assertEqual(LatencyHistogram().percentile(50), 0.0)
+        slow = LatencyHistogram()
+        slow.add(1e3)  # after the last bucket
+        self.assertEqual(slow.percentile(50), 1e3)
+
+    def test_process_cpu_time(self):
+        """Test the CPU time of a process counts all of its threads."""
+        source = ("import threading, time\n"
+                  "def spin():\n"
+                  "    end = time.time() + 10\n"
+                  "    while time.time() < end:\n"
+                  "        pass\n"
+                  "thread = threading.Thread(target=spin)\n"
+                  "thread.start()\n"
+                  "thread.join()\n")
+        p = subprocess.Popen([sys.executable, "-c", source])
+        try:
+            time.sleep(1)
+            self.assertGreater(process_cpu_time(p.pid), 0.5)
+        finally:
+            p.kill()
+            p.wait()
@@ -0,0 +1,204 @@
+import os
+import random
+import tempfile
+from unittest import TestCase
+from unittest import mock
+
+import numpy as np
+
+from game import Game
+from game.corpus import Corpus
+from game.corpus import write_corpus
+from game.ww import ACTION_TABLE
+from game.ww import render_grid_rows
+from game.ww.batch import ACCEPT_DEFEAT
+from game.ww.batch import BatchBoardState
+from game.ww.perft import batch_perft
+from game.ww.perft import perft
+from game.ww.transposition import TRANSPOSITION_CACHE
+from game.ww.transposition import ZobristKeys
+
+
+def play_random_game(config_str, engine, seed):
+    """
+    Play a game with random moves (and some bad ones) on the given engine.
+
+    :return: The list of turn inputs, actions and scores seen during the game
+    """
+    Game.engine = engine
+    game = Game(config_str)
+    rng = random.Random(seed)
+    history = []
+    while game.is_active():
+        board_state = game.board_state
+        history.append(board_state.turn_input())
+        legal_actions = [str(a) for a in board_state.legal_actions]
+        r = rng.random()
+        if not legal_actions or r < 0.01:
+            action_str = "ACCEPT-DEFEAT"
+        elif r < 0.02:
+            action_str = "MOVE&BUILD 0 N N"  # usually illegal
+        else:
+            action_str = rng.choice(legal_actions)
+        action_str, message, issue_flag = game.validate_output([action_str + "\n"])
+        game.process_output(game.current_player(), action_str, issue_flag)
+        history.append((action_str, message, tuple(game.score_game())))
+    return history
+
+
+def random_legal_game(seed):
+    """
+    Play a game with random legal moves on the numpy engine, rendering the
+    turn input of every position like the arena.
+
+    :return: The list of the board states of the game
+    """
+    Game.engine = "numpy"
+    game = Game(Game.random_configuration(random.Random(seed)))
+    rng = random.Random(seed)
+    board_states = []
+    while game.is_active() and game.board_state.legal_actions:
+        board_states.append(game.board_state)
+        game.board_state.turn_input()
+        game.process_output(game.current_player(), str(rng.choice(game.board_state.legal_actions)), False)
+    return board_states
+
+
+class TestEngines(TestCase):
+    def tearDown(self):
+        Game.engine = "numpy"
+
+    def test_bitboard_matches_numpy(self):
+        """Test the bitboard engine plays exactly the same games as the numpy engine."""
+        rng = random.Random(0)
+        for seed in range(30):
+            config_str = Game.random_configuration(rng)
+            self.assertEqual(play_random_game(config_str, "numpy", seed),
+                             play_random_game(config_str, "bitboard", seed))
+
+
+class TestTranspositionCache(TestCase):
+    def tearDown(self):
+        TRANSPOSITION_CACHE.resize(10000)
+
+    def test_cached_games_match_uncached_games(self):
+        """Test a full cache, an empty cache and no cache all give the same games."""
+        rng = random.Random(1)
+        for seed in range(10):
+            config_str = Game.random_configuration(rng)
+            TRANSPOSITION_CACHE.resize(0)
+            uncached = play_random_game(config_str, "numpy", seed)
+            TRANSPOSITION_CACHE.resize(10000)
+            first = play_random_game(config_str, "numpy", seed)
+            hits = TRANSPOSITION_CACHE.hits
+            second = play_random_game(config_str, "numpy", seed)  # every position is cached
+            self.assertEqual(uncached, first)
+            self.assertEqual(uncached, second)
+            self.assertGreater(TRANSPOSITION_CACHE.hits, hits)
+
+    def test_disabled_cache(self):
+        """Test a disabled cache isn't looked up and isn't reported."""
+        TRANSPOSITION_CACHE.resize(0)
+        lookups = TRANSPOSITION_CACHE.hits, TRANSPOSITION_CACHE.misses
+        random_legal_game(4)
+        self.assertEqual((TRANSPOSITION_CACHE.hits, TRANSPOSITION_CACHE.misses), lookups)
+        self.assertEqual(Game.report(), [])
+
+    def test_incremental_hash(self):
+        """Test the hash updated in next_board_state is the hash of the new grid."""
+        board_states = random_legal_game(2)
+        self.assertGreater(len(board_states), 20)
+        for board_state in board_states:
+            zobrist = ZobristKeys.for_grid_size(board_state.grid.shape[0])
+            self.assertEqual(board_state.grid_hash, zobrist.grid_hash(board_state.grid))
+
+    def test_incremental_grid_rows(self):
+        """Test the grid rows patched in next_board_state are those of the new grid."""
+        TRANSPOSITION_CACHE.resize(0)  # render (and patch) the turn input of every position
+        board_states = random_legal_game(3)
+        self.assertGreater(len(board_states), 20)
+        for board_state in board_states:
+            self.assertEqual(board_state.input_grid(), "\n".join(render_grid_rows(board_state.grid)))
+
+    def test_grid_rows_patched_after_cache_hits(self):
+        """Test a position missing from the cache patches the grid rows of a parent whose turn input was cached."""
+        random_legal_game(5)  # caches every position of the game
+        misses = TRANSPOSITION_CACHE.misses
+        with mock.patch("game.ww.render_grid_rows", wraps=render_grid_rows) as render:
+            last = random_legal_game(5)[-1]  # every turn input comes from the cache
+            self.assertEqual(TRANSPOSITION_CACHE.misses, misses)
+            children = [last.next_board_state(str(a)) for a in last.legal_actions]
+            for board_state in children:
+                board_state.turn_input()
+        self.assertGreater(TRANSPOSITION_CACHE.misses, misses)
+        self.assertEqual(render.call_count, 1)  # the first position of the game
+        for board_state in children:
+            self.assertEqual(board_state.input_grid(), "\n".join(render_grid_rows(board_state.grid)))
+
+
+class TestBatch(TestCase):
+    def test_lanes_match_board_state(self):
+        """Test every lane of a batch plays exactly like BoardState (including illegal moves)."""
+        rng = random.Random(3)
+        batch = BatchBoardState.from_configs([Game.random_configuration(rng) for _ in range(30)])
+        board_states = [batch.lane(k) for k in range(len(batch))]
+        np_rng = np.random.default_rng(3)
+        while not batch.game_over().all():
+            ranks = batch.random_actions(np_rng)
+            r = np_rng.random(len(batch))
+            ranks[r < 0.02] = 7  # usually illegal
+            ranks[r < 0.01] = ACCEPT_DEFEAT
+            live = ~batch.game_over()
+            for k in np.flatnonzero(live):
+                b = board_states[k]
+                self.assertEqual(batch.legal_actions(k), [str(a) for a in b.legal_actions])
+                action_str = str(ACTION_TABLE[ranks[k]]) if ranks[k] >= 0 else "ACCEPT-DEFEAT"
+                board_states[k] = b.next_board_state(action_str)
+
+            batch = batch.next_board_states(ranks, live)
+            for k, b in enumerate(board_states):
+                lane = batch.lane(k)
+                self.assertEqual(lane.turn_input(), b.turn_input())
+                self.assertTrue((lane.grid == b.grid).all())
+                self.assertEqual((lane.scores, lane.active_players, lane.current_player_id, lane.turn),
+                                 (b.scores, b.active_players, b.current_player_id, b.turn))
+
+
+class TestCorpus(TestCase):
+    def tearDown(self):
+        Game.corpus = None
+
+    def test_corpus_games_match_seeded_games(self):
+        """Games read from a corpus are the same as the games built from their seed."""
+        rng = random.Random(3)
+        config_strs = [Game.random_configuration(rng) for _ in range(30)]
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, "corpus.bin")
+            write_corpus(path, config_strs)
+            corpus = Corpus(path)
+            self.assertEqual(len(corpus), 30)
+            for i in range(30):
+                config_str = corpus.config_str(i)
+                self.assertTrue(config_str.startswith(config_strs[i] + ";"))
+                Game.corpus = None
+                expected = play_random_game(config_str, "numpy", i)
+                Game.corpus = corpus
+                self.assertEqual(play_random_game(config_str, "numpy", i), expected)
+            self.assertIsNone(corpus.initial_position(config_strs[0] + ";corpus=1"))
+            del corpus
+
+
+class TestPerft(TestCase):
+    def tearDown(self):
+        Game.engine = "numpy"
+
+    def test_engines_agree(self):
+        """All engines count the same move sequences (a regression check too)."""
+        config_str = "mapIndex=2;seed=3"
+        for engine in ("numpy", "bitboard"):
+            Game.engine = engine
+            self.assertEqual(perft(Game(config_str).board_state, 1), (48, 49))
+            self.assertEqual(perft(Game(config_str).board_state, 2)[0], 2368)
+        Game.engine = "numpy"
+        self.assertEqual(batch_perft(Game(config_str).board_state, 2), (2368, 2417))
+        self.assertEqual(batch_perft(Game("mapIndex=0;seed=1").board_state, 3)[0], 260476)
@@ -0,0 +1,161 @@
+"""
+Tools to measure how long the bots take.
+"""
+
+import bisect
+import collections
+import math
+import os
+
+_CLOCK_TICKS = os.sysconf("SC_CLK_TCK") if hasattr(os, "sysconf") else 100
+
+# How long the arena waits for a turn when there is no budget (seconds)
+DEFAULT_TURN_TIMEOUT = 2.0
+# How long the arena waits after a budget before it kills a silent bot (seconds)
+DEFAULT_GRACE = 0.05
+
+# The time budgets of the turns enforced by the arena, in seconds: the
+# first turn of a bot (which includes its start up) and its later turns.  A
+# bot which answers after its budget is deactivated, and one which hasn't
+# answered grace seconds after its budget is killed.
+TurnBudgets = collections.namedtuple("TurnBudgets", ["first_turn", "turn", "grace"],
+                                     defaults=(DEFAULT_GRACE,))
+
+
+def parse_turn_budgets(arg):
+    """
+    :param str arg: "<first turn ms>,<later turns ms>[,<grace ms>]", or one
+                    number for all the turns
+    :return: TurnBudgets (in seconds)
+    :raises ValueError: if arg is malformed
+    """
+    values = [float(x) / 1000 for x in arg.split(",")]
+    if len(values) == 1:
+        values *= 2
+    if len(values) not in (2, 3) or any(v < 0 for v in values):
+        raise ValueError("expected <first turn ms>,<later turns ms>[,<grace ms>]")
+    return TurnBudgets(*values)
+
+
+def process_cpu_time(pid):
+    """
+    Return the CPU time (user and system) used so far by a process.
+
+    Adds up /proc/<pid>/task/<tid>/schedstat over the threads of the process
+    (nanosecond resolution), and falls back to /proc/<pid>/stat (clock tick
+    resolution).  The threads which already exited are no longer counted in
+    the former, so the CPU time of a bot which starts and ends threads
+    every turn is under-counted.
+
+    :param int pid: The process id
+    :return: The CPU time in seconds, or None if it can't be read
+    """
+    task_dir = "/proc/{}/task".format(pid)
+    try:
+        total = 0
+        for tid in os.listdir(task_dir):
+            try:
+                with open(os.path.join(task_dir, tid, "schedstat")) as f:
+                    total += int(f.read().split()[0])
+            except FileNotFoundError:
+                pass  # the thread just exited
+        if total:
+            return total / 1e9
+    except (OSError, ValueError, IndexError):
+        pass
+    try:
+        with open("/proc/{}/stat".format(pid)) as f:
+            # The command name (field 2) can contain spaces, so split after it
+            fields = f.read().rsplit(")", 1)[1].split()
+        return (int(fields[11]) + int(fields[12])) / _CLOCK_TICKS  # utime + stime
+    except (OSError, ValueError, IndexError):
+        return None
+
+
+def _bucket_bounds(min_time, buckets_per_decade, decades):
+    """:return: logarithmically spaced bucket bounds starting at min_time"""
+    return [min_time * 10 ** (i / buckets_per_decade) for i in range(buckets_per_decade * decades)]
+
+
+class LatencyHistogram:
+    """
+    A histogram of times with logarithmic buckets.
+
+    The buckets are fixed (BUCKETS_PER_DECADE per factor of ten from MIN_TIME
+    up), so histograms take constant memory and can be added together.
+    Percentiles are accurate to about 6%.
+    """
+
+    MIN_TIME = 1e-6  # seconds
+    BUCKETS_PER_DECADE = 40
+    DECADES = 8
+
+    # Upper bound of every bucket but the last, which holds everything bigger
+    BOUNDS = _bucket_bounds(MIN_TIME, BUCKETS_PER_DECADE, DECADES)
+
+    def __init__(self):
+        self.counts = [0] * (len(self.BOUNDS) + 1)
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+
+    def add(self, t):
+        """Add one time (in seconds)."""
+        self.counts[bisect.bisect_left(self.BOUNDS, t)] += 1
+        self.count += 1
+        self.total += t
+        if t > self.max:
+            self.max = t
+
+    def merge(self, other):
+        """Add all the times of another histogram to this one."""
+        for i, c in enumerate(other.counts):
+            self.counts[i] += c
+        self.count += other.count
+        self.total += other.total
+        self.max = max(self.max, other.max)
+
+    def to_dict(self):
+        """:return: The histogram as a small JSON-compatible dict (only non-empty buckets)."""
+        return {"buckets": [[i, c] for i, c in enumerate(self.counts) if c],
+                "count": self.count, "total": self.total, "max": self.max}
+
+    @classmethod
+    def from_dict(cls, d):
+        """Rebuild a histogram saved with to_dict."""
+        histogram = cls()
+        for i, c in d["buckets"]:
+            histogram.counts[i] = c
+        histogram.count = d["count"]
+        histogram.total = d["total"]
+        histogram.max = d["max"]
+        return histogram
+
+    def mean(self):
+        return self.total / self.count if self.count else 0.0
+
+    def percentile(self, p):
+        """
+        Return (an estimate of) the p-th percentile.
+
+        :param p: A number from 0 to 100
+        :return: The time in seconds (0.0 if the histogram is empty)
+        """
+        if not self.count:
+            return 0.0
+        rank = max(1, math.ceil(self.count * p / 100))
+        seen = 0
+        for i, c in enumerate(self.counts):
+            seen += c
+            if seen >= rank:
+                if i == len(self.BOUNDS):
+                    return self.max
+                # geometric middle of the bucket (but never more than the max)
+                lower = self.BOUNDS[i - 1] if i else 0.0
+                return min(math.sqrt(lower * self.BOUNDS[i]) if lower else self.BOUNDS[i], self.max)
+        return self.max
+
+    def summary(self):
+        """:return: A short string with the main percentiles."""
+        return "p50: {:.5f}, p90: {:.5f}, p99: {:.5f}, max: {:.5f} sec".format(
+            self.percentile(50), self.percentile(90), self.percentile(99), self.max)
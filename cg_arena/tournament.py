@@ -1,15 +1,233 @@
+import asyncio
+import bisect
+import collections
+import contextlib
+import io
+import multiprocessing
+import os
+import queue
 import random
 import time
 
 from match import Match
+from output import open_output
+from async_match import play_match_async
+from replay import replay_path
+from results_store import ResultsStoreError
+from profiler import Profile
+from resources import ResourceTotals
+from timing import LatencyHistogram
 from game import Game
+from game.corpus import Corpus
+from game.ww.transposition import TRANSPOSITION_CACHE
+
+
+# The summary of a finished match.  It is all the tournament needs to update
+# its statistics, and it is small enough to send back from a worker process.
+# resources holds a resources.ResourceUsage (or None) per seat and
+# timeout_flags whether each seat went over its time budget.
+GameResult = collections.namedtuple("GameResult", ["id_number", "player_list", "config_str",
+                                                   "results", "error_flags", "warning_flags",
+                                                   "turn_times", "turn_cpu_times", "resources",
+                                                   "timeout_flags"],
+                                    defaults=(None, None))
+
+# Games between the lines of progress (and between the full results)
+PROGRESS_EVERY = 10
+WIN_DATA_EVERY = 100
+
+
+class GameList:
+    """
+    The games of a tournament with something to look at (errors, different
+    results, ...) in constant memory: how many there are, and the first
+    and last few of them (by game id).
+
+    :param int keep: Number of games kept at each end
+    """
+
+    def __init__(self, keep=5):
+        self.keep = keep
+        self.count = 0
+        self.first = []  # the smallest games, sorted
+        self.last = []  # the largest games which aren't in first, sorted
+
+    def __len__(self):
+        return self.count
+
+    def add(self, game):
+        """:param game: A game id (or a tuple of game ids)"""
+        self.count += 1
+        bisect.insort(self.first, game)
+        if len(self.first) > self.keep:
+            bisect.insort(self.last, self.first.pop())
+            if len(self.last) > self.keep:
+                del self.last[0]
+
+    def __str__(self):
+        games = [str(g) for g in self.first]
+        if self.count > len(self.first) + len(self.last):
+            games.append("...")
+        games += [str(g) for g in self.last]
+        return ", ".join(games)
+
+
+def play_match(id_number, player_list, config_str, time_limits, verbose, show_map,
+               replay_dir=None, replay_stderr=False, process_pool=None, profile=None, memory_limit=None,
+               turn_budgets=None, output=None):
+    """
+    Plays the match from beginning to end.
+
+    :param int id_number: The game id
+    :param player_list: List of python scripts, one per seat
+    :param str config_str: The configuration string of the game
+    :param bool time_limits: Use time limits
+    :param bool verbose: Print information about every move
+    :param bool show_map: Print the game board
+    :param str replay_dir: If given, write the replay of the match in this directory
+    :param bool replay_stderr: Include the players' stderr in the replay
+    :param process_pool: The pool which starts the player processes (or None)
+    :param profile: A profiler.Profile to time the phases of the match in (or None)
+    :param memory_limit: If given, cap the memory of the bots at this many MB
+    :param turn_budgets: If given, the timing.TurnBudgets enforced by the arena
+    :param output: The text stream the match prints to (None for sys.stdout)
+    :return: A GameResult
+    """
+    match = None
+    try:
+        # Initialization
+        match = Match(id_number, config_str, player_list, time_limits, verbose, show_map, process_pool,
+                      record_replay=replay_dir is not None, replay_stderr=replay_stderr, profile=profile,
+                      memory_limit=memory_limit, turn_budgets=turn_budgets, output=output)
+
+        match.pregame()
+        # Game Loop
+        while match.is_active():
+            # Play one round of the game
+            match.one_turn()
+
+        # Handle end of game details
+        match.end_of_game()
+        if replay_dir is not None:
+            match.write_replay(replay_path(replay_dir, id_number))
+
+    except:
+        raise
+    finally:
+        # Kill all subprocesses even if a crash
+        if match is not None:
+            for player, p in enumerate(match.player_processes):
+                if p:
+                    p.kill()
+                    match.record_resource_usage(player)
+
+    if profile is not None:
+        profile.finish()
+        if match.printing:
+            match.print(profile.game_summary())
+
+    return game_result(match)
+
+
+def game_result(match):
+    """
+    Summarize a finished match.
+
+    :param match: The finished Match
+    :return: A GameResult
+    """
+    return GameResult(match.id_number, tuple(match.player_program_list), match.config_str,
+                      tuple(reversed(match.loss_order)),
+                      tuple(bool(log) for log in match.issue_logs),
+                      tuple(bool(warning_log) for warning_log in match.warnings),
+                      tuple(match.turn_times), tuple(match.turn_cpu_times), tuple(match.resource_usage),
+                      tuple(match.timeouts))
+
+
+# The process pool of a worker process of the tournament (if any)
+_worker_process_pool = None
+# Whether the worker profiles its matches: None (no), False (totals only) or True (with events)
+_worker_profile = None
+
+
+def game_settings():
+    """
+    :return: The settings of the Game class in this process (passed on to the
+             worker processes by _init_worker, whatever their start method):
+             the engine, the path of the corpus (or None) and the size of the
+             transposition cache
+    """
+    corpus = Game.corpus
+    return Game.engine, corpus.path if corpus is not None else None, TRANSPOSITION_CACHE.maxsize
+
+
+def _init_worker(process_pool_type, profile=None, settings=None):
+    """
+    Set up a worker process of the tournament.
+
+    :param process_pool_type: The class of the process pool (or None)
+    :param profile: None to not profile the matches, else whether to keep
+                    the events of the profiles (for a Chrome trace)
+    :param settings: The game_settings() of the main process (or None to keep the defaults)
+    """
+    global _worker_process_pool, _worker_profile
+    if process_pool_type is not None:
+        _worker_process_pool = process_pool_type()
+    _worker_profile = profile
+    if settings is not None:
+        engine, corpus_path, cache_size = settings
+        Game.engine = engine
+        Game.corpus = Corpus(corpus_path) if corpus_path is not None else None
+        TRANSPOSITION_CACHE.resize(cache_size)
+
+
+def _play_match_in_worker(args, memory_limit=None, turn_budgets=None, output_sink=None):
+    """
+    Run play_match inside a worker process of the pool.
+
+    The printed output of the match is captured so that the main process can
+    print it in one piece instead of interleaving it with other matches.
+
+    :param args: The arguments to play_match
+    :param memory_limit: If given, cap the memory of the bots at this many MB
+    :param turn_budgets: If given, the timing.TurnBudgets enforced by the arena
+    :param output_sink: The output.NullSink or GameLogSink the match prints to
+                        (or None to capture its output)
+    :return: The GameResult, the captured output, the Profile of the match
+             (or None) and the worker's pid with the statistics of its process
+             pool so far (or None if the pool keeps none)
+    """
+    profile = Profile(args[0], _worker_profile) if _worker_profile is not None else None
+    with contextlib.redirect_stdout(io.StringIO()) as stream, open_output(output_sink, args[0]) as output:
+        result = play_match(*args, process_pool=_worker_process_pool, profile=profile, memory_limit=memory_limit,
+                            turn_budgets=turn_budgets, output=output)
+    pool_statistics = None
+    if hasattr(_worker_process_pool, "statistics"):
+        pool_statistics = os.getpid(), _worker_process_pool.statistics()
+    return result, stream.getvalue(), profile, pool_statistics
+
+
+def print_pool_report(process_pool_type, worker_statistics):
+    """
+    Print the report of the process pools of the worker processes of a tournament.
+
+    :param process_pool_type: The class of the pools (or None)
+    :param dict worker_statistics: worker pid -> the latest statistics of its pool
+    """
+    merged_report = getattr(process_pool_type, "merged_report", None)
+    if merged_report is not None and worker_statistics:
+        for line in merged_report(list(worker_statistics.values())):
+            print(line)
 
 
 class Tournament:
     """
     Manages a tournament of multiple games.
     """
-    def __init__(self, number_of_games, program_names, game_arity, time_limits, verbose, show_map):
+    def __init__(self, number_of_games, program_names, game_arity, time_limits, verbose, show_map, jobs=1,
+                 process_pool_type=None, async_games=0, results_store=None, replay_dir=None,
+                 replay_stderr=False, sprt=None, profile=None, memory_limit=None, turn_budgets=None,
+                 coordinator=None, concurrent_sets=False, output_sink=None):
         """
         Initialize
 
@@ -19,36 +237,78 @@ class Tournament:
         :param bool time_limits: Use time limits
         :param bool verbose: Print information about every move
         :param bool show_map: Print the game board
+        :param int jobs: Number of matches to play at the same time
+        :param process_pool_type: The class of the pool which starts the player
+                                  processes, e.g. PersistentProcessPool or
+                                  ForkServerPool (None to spawn them per match)
+        :param int async_games: If positive, play this many matches at the same
+                                time in one asyncio event loop
+        :param results_store: A ResultsStore to record each finished game in (or
+                              None).  Games already in it are not played again.
+        :param str replay_dir: If given, write the replay of every match in this directory
+        :param bool replay_stderr: Include the players' stderr in the replays
+        :param sprt: An SPRT run on the pairs of games of a two-bot tournament
+                     (or None).  The tournament stops as soon as it reaches a
+                     decision, so number_of_games is then a maximum.
+        :param profile: A profiler.Profile to add the profiles of all the
+                        matches to (or None to not profile them)
+        :param memory_limit: If given, cap the memory of the bots at this many MB
+        :param turn_budgets: If given, the timing.TurnBudgets enforced by the arena
+        :param coordinator: A distributed.Coordinator which hands the matches to
+                            remote workers (or None to play them here)
+        :param bool concurrent_sets: Play the games of each set (the games with
+                                     the same configuration, e.g. a mirrored
+                                     pair) at the same time, one set after the other
+        :param output_sink: An output.NullSink or GameLogSink to print the
+                            matches to instead of the terminal (or None)
         :return:
         """
 
         self.number_of_games = number_of_games
         self.program_names = program_names
         self.num_bots = len(self.program_names)
+        self.set_size = self.num_bots  # consecutive games with the same configuration
         self.game_arity = game_arity
         self.time_limits = time_limits
         self.verbose = verbose
         self.show_map = show_map
+        self.jobs = jobs
+        self.process_pool_type = process_pool_type
+        self.process_pool = None
+        self.async_games = async_games
+        self.results_store = results_store
+        self.replay_dir = replay_dir
+        self.replay_stderr = replay_stderr
+        self.sprt = sprt
+        self.profile = profile
+        self.memory_limit = memory_limit
+        self.turn_budgets = turn_budgets
+        self.coordinator = coordinator
+        self.concurrent_sets = concurrent_sets
+        self.output_sink = output_sink
+        if sprt is not None and (self.num_bots != 2 or (game_arity or 2) != 2):
+            raise ValueError("The SPRT needs two bots playing two player games")
+        self.recorded_ids = set()  # games already in the results store when the tournament started
 
-        self.results = []
-        self.player_lists = []
         self.wins = {p: 0 for p in program_names}
         self.placements = {(p, a, i): 0 for p in program_names for a in (2, 3, 4) for i in range(a)}
         self.totals_by_arity = {a: 0 for a in (2, 3, 4)}
-        self.diff_results = []
         self.diff_totals_by_arity = {a: 0 for a in (2, 3, 4)}
         self.diff_wins = {p: 0 for p in program_names}
         self.diff_placements = {(p, a, i): 0 for p in program_names for a in (2, 3, 4) for i in range(a)}
-        self.games_with_errors = {p: [] for p in program_names}
-        self.games_with_warnings = {p: [] for p in program_names}
+        self.games_with_errors = {p: GameList() for p in program_names}
+        self.games_with_warnings = {p: GameList() for p in program_names}
+        self.games_with_timeouts = {p: GameList() for p in program_names}
+        self.turn_times = {p: LatencyHistogram() for p in program_names}
+        self.turn_cpu_times = {p: LatencyHistogram() for p in program_names}
+        self.resources = {p: ResourceTotals() for p in program_names}
         self.games_played = 0
-        self.games_to_look_at = []
+        self.games_resumed = 0  # games_played which were read from the results store
+        self.games_to_look_at = GameList()
+        self.unfinished_sets = {}  # set number -> results of the set so far
 
         self.start_time = time.perf_counter()
 
-        self.player_order_rng = random.Random(0)
-        self.config_str_rng = random.Random(0)
-
     def generate_random_configurations(self):
         """
         Generators a tuple specifying which players are playing in what order.
@@ -66,10 +326,10 @@ class Tournament:
 
         # get random configuration so that not all one player
         while player_order is None or all(i == player_order[0] for i in player_order):
-            player_order = [random.randrange(num_bots) for _ in range(game_arity)]
+            player_order = [self.player_order_rng.randrange(num_bots) for _ in range(game_arity)]
 
         # generate configuration string
-        config_str = Game.random_configuration(self.config_str_rng)
+        config_str = self.next_configuration()
 
         # rotate players to give some semplance of symmetry (esp in 2 bot case)
         random_configs = []
@@ -79,6 +339,98 @@ class Tournament:
 
         return random_configs
 
+    def next_configuration(self):
+        """
+        :return: The configuration string of the next set of games: the next
+                 configuration of the corpus (Game.corpus) if there is one,
+                 else a random one
+        """
+        corpus = getattr(Game, "corpus", None)
+        if corpus is not None:
+            config_str = corpus.config_str(self.configs_drawn % len(corpus))
+        else:
+            config_str = Game.random_configuration(self.config_str_rng)
+        self.configs_drawn += 1
+        return config_str
+
+    def schedule(self):
+        """
+        Generate the games of the tournament in order.
+
+        The schedule only depends on the random number generators, so the game
+        ids, player lists and configurations are the same however the games
+        are played.
+
+        :return: iterator of (id_number, player_list, config_str)
+        """
+        self.player_order_rng = random.Random(0)
+        self.config_str_rng = random.Random(0)
+        self.configs_drawn = 0
+        random_configs = []
+
+        for i in range(self.number_of_games):
+            if not random_configs:
+                random_configs = self.generate_random_configurations()
+
+            player_list, config_str = random_configs.pop()
+            yield i, player_list, config_str
+
+    def unplayed_games(self):
+        """
+        :return: iterator of the (id_number, player_list, config_str) in the
+                 schedule which are not already in the results store (stops
+                 early once the SPRT reaches a decision)
+        """
+        for game in self.schedule():
+            if self.is_decided():
+                return
+            if game[0] not in self.recorded_ids:
+                yield game
+
+    def unplayed_sets(self):
+        """
+        :return: iterator of the lists of unplayed games of each set of games
+                 with the same configuration (stops early once the SPRT
+                 reaches a decision)
+        """
+        game_set = []
+        for game in self.schedule():
+            if game[0] % self.set_size == 0:  # the first game of a set
+                if game_set:
+                    yield game_set
+                    game_set = []
+                if self.is_decided():
+                    return
+            if game[0] not in self.recorded_ids:
+                game_set.append(game)
+        if game_set:
+            yield game_set
+
+    def is_decided(self):
+        """:return: True if the SPRT (if any) has accepted one of its hypotheses."""
+        return self.sprt is not None and self.sprt.decision() is not None
+
+    def load_recorded_results(self):
+        """
+        Rebuild the statistics from the games already in the results store.
+
+        :raises ResultsStoreError: if the stored games are corrupt or don't belong to this tournament
+        """
+        stored = {r.id_number: r for r in self.results_store.load(GameResult)}
+        if not stored:
+            return
+
+        for i, player_list, config_str in self.schedule():
+            result = stored.get(i)
+            if result is None:
+                continue
+            if result.player_list != tuple(player_list) or result.config_str != config_str:
+                raise ResultsStoreError("Game {} in {} is not a game of this tournament".format(i, self.results_store.path))
+            self.update_statistics(result)
+            self.recorded_ids.add(i)
+
+        print("Resumed {} recorded games from {}".format(len(self.recorded_ids), self.results_store.path))
+
     def play_game(self, id_number, player_list, config_str):
         """
         Plays the match from beginning to end, recording the results.
@@ -87,76 +439,270 @@ class Tournament:
         :param player_list:
         :param config_str:
         """
-        match = None
-        try:
-            # Initialization
-            match = Match(id_number, config_str, player_list, self.time_limits, self.verbose, self.show_map)
+        profile = self.new_match_profile(id_number)
+        with open_output(self.output_sink, id_number) as output:
+            result = play_match(id_number, player_list, config_str,
+                                self.time_limits, self.verbose, self.show_map,
+                                self.replay_dir, self.replay_stderr, self.process_pool, profile, self.memory_limit,
+                                self.turn_budgets, output)
+        self.add_match_profile(profile)
+        self.record_result(result)
 
-            match.pregame()
-            # Game Loop
-            while match.is_active():
-                # Play one round of the game
-                match.one_turn()
+    def new_match_profile(self, id_number):
+        """:return: A Profile for the match (None if the tournament isn't profiled)."""
+        if self.profile is None:
+            return None
+        return Profile(id_number, self.profile.keep_events)
 
-            # Handle end of game details
-            match.end_of_game()
+    def add_match_profile(self, profile):
+        """Add the Profile of a finished match (or None) to the tournament's."""
+        if profile is not None and self.profile is not None:
+            self.profile.add(profile)
 
-        except:
-            raise
-        finally:
-            # Kill all subprocesses even if a crash
-            if match is not None:
-                for p in match.player_processes:
-                    if p:
-                        p.kill()
+    def record_result(self, result):
+        """
+        Save the result of a finished match (if there is a results store) and
+        add it to the statistics.
+
+        :param result: A GameResult
+        """
+        if self.results_store is not None:
+            self.results_store.append(result)
+        self.update_statistics(result)
 
-        results = tuple(reversed(match.loss_order))
+    def update_statistics(self, result):
+        """
+        Add the result of a finished match to the statistics.
+
+        The results can be recorded in any order.  Each set of games with the
+        same configuration is compared once all of its games are recorded.
+
+        :param result: A GameResult
+        """
+        results = result.results
+        player_list = result.player_list
         arity = len(player_list)
-        self.results.append(results)
-        self.player_lists.append(player_list)
         self.totals_by_arity[arity] += 1
         self.wins[player_list[results[0]]] += 1
         for place, i in enumerate(results):
             player_name = player_list[i]
             self.placements[player_name, arity, place] += 1
-        for i, log in enumerate(match.issue_logs):
+        for i, error_flag in enumerate(result.error_flags):
             player_name = player_list[i]
-            if log:
-                self.games_with_errors[player_name].append(match.id_number)
-        for i, warning_log in enumerate(match.warnings):
+            if error_flag:
+                self.games_with_errors[player_name].add(result.id_number)
+        for i, warning_flag in enumerate(result.warning_flags):
             player_name = player_list[i]
-            if warning_log:
-                self.games_with_warnings[player_name].append(match.id_number)
+            if warning_flag:
+                self.games_with_warnings[player_name].add(result.id_number)
+        for i, timeout_flag in enumerate(result.timeout_flags or ()):
+            if timeout_flag:
+                self.games_with_timeouts[player_list[i]].add(result.id_number)
+        for i, player_name in enumerate(player_list):
+            self.turn_times[player_name].merge(result.turn_times[i])
+            self.turn_cpu_times[player_name].merge(result.turn_cpu_times[i])
+            if result.resources is not None:
+                self.resources[player_name].add(result.resources[i])
+        self.games_played += 1
+
+        # check if all the results of a finished set are not the same
+        set_number = result.id_number // self.set_size
+        finished_set = self.unfinished_sets.setdefault(set_number, {})
+        finished_set[result.id_number] = result
+        if len(finished_set) < self.set_size:
+            return
+        del self.unfinished_sets[set_number]
+        set_results = [finished_set[i] for i in sorted(finished_set)]
+
+        if self.sprt is not None:
+            first_bot = self.program_names[0]
+            first_bot_wins = sum(r.player_list[r.results[0]] == first_bot for r in set_results)
+            self.sprt.add_pair(first_bot_wins / len(set_results))
+
+        if len(set(r.results for r in set_results)) > 1:
+            self.games_to_look_at.add(tuple(sorted(finished_set)))
+            for r in set_results:
+                results = r.results
+                player_list = r.player_list
+                arity = len(results)
+                self.diff_totals_by_arity[arity] += 1
+                self.diff_wins[player_list[results[0]]] += 1
+                for place, j in enumerate(results):
+                    player_name = player_list[j]
+                    self.diff_placements[player_name, arity, place] += 1
 
     def play_all_games(self):
         """
         Play all the matches.
+
+        With more than one job, the matches are played by a pool of worker
+        processes and their results are recorded as they finish.  With
+        concurrent sets, the games of each set are played at the same time.  With a
+        coordinator, they are played by remote workers.  Games already in
+        the results store are not played again.
         """
-        random_configs = []
+        if self.results_store is not None:
+            self.load_recorded_results()
+        self.games_resumed = self.games_played
+        self.play_start_time = time.perf_counter()
 
-        for i in range(self.number_of_games):
-            if i % 10 == 0:
-                self.print_win_data()
+        try:
+            if self.coordinator is not None:
+                self.coordinator.play_all_games(self)
+            elif self.async_games > 0 or self.concurrent_sets:
+                asyncio.run(self.play_all_sets_async() if self.concurrent_sets else self.play_all_games_async())
+                for line in Game.report():
+                    print(line)
+            elif self.jobs > 1:
+                self.play_all_games_in_parallel()
+            else:
+                self.play_all_games_serially()
+        finally:
+            if self.results_store is not None:
+                self.results_store.close()
+            if self.profile is not None:
+                for line in self.profile.summary():
+                    print(line)
 
-            if not random_configs:
-                random_configs = self.generate_random_configurations()
+    def play_all_games_serially(self):
+        """
+        Play all the matches one after the other.
+        """
+        if self.process_pool_type is not None:
+            self.process_pool = self.process_pool_type()
+        try:
+            self.print_win_data()
+            for i, player_list, config_str in self.unplayed_games():
+                self.play_game(i, player_list, config_str)
+                self.report_progress()
+        finally:
+            if self.process_pool is not None:
+                for line in getattr(self.process_pool, "report", list)():
+                    print(line)
+                self.process_pool.close()
+            for line in Game.report():
+                print(line)
 
-            player_list, config_str = random_configs.pop()
-            self.play_game(i, player_list, config_str)
-            self.games_played += 1
+    def play_all_games_in_parallel(self):
+        """
+        Play all the matches with a pool of self.jobs worker processes.
 
-            if not random_configs:
-                # check if all the results of the last set are not the same
-                if len(set(self.results[-self.num_bots:])) > 1:
-                    self.games_to_look_at.append(tuple(range(i-self.num_bots+1, i+1)))
-                    for results, player_list in zip(self.results[-self.num_bots:], self.player_lists[-self.num_bots:]):
-                        arity = len(results)
-                        self.diff_results.append(results)
-                        self.diff_totals_by_arity[arity] += 1
-                        self.diff_wins[player_list[results[0]]] += 1
-                        for place, j in enumerate(results):
-                            player_name = player_list[j]
-                            self.diff_placements[player_name, arity, place] += 1
+        Only self.jobs matches are handed to the pool at a time, so that no new
+        match is started once the SPRT reaches a decision.
+        """
+        settings = (self.time_limits, self.verbose, self.show_map, self.replay_dir, self.replay_stderr)
+        all_args = ((i, player_list, config_str) + settings
+                    for i, player_list, config_str in self.unplayed_games())
+        finished = queue.Queue()  # the return value or the exception of a worker
+        running = 0
+        worker_statistics = {}  # pid -> the statistics of the worker's process pool
+
+        self.print_win_data()
+        worker_profile = self.profile.keep_events if self.profile is not None else None
+        try:
+            with multiprocessing.Pool(self.jobs, _init_worker,
+                                      (self.process_pool_type, worker_profile, game_settings())) as pool:
+                while True:
+                    for args in all_args:
+                        pool.apply_async(_play_match_in_worker, (args,),
+                                         {"memory_limit": self.memory_limit, "turn_budgets": self.turn_budgets,
+                                          "output_sink": self.output_sink},
+                                         callback=finished.put, error_callback=finished.put)
+                        running += 1
+                        if running == self.jobs:
+                            break
+                    if not running:
+                        break
+
+                    item = finished.get()
+                    running -= 1
+                    if isinstance(item, BaseException):
+                        raise item
+                    result, output, profile, pool_statistics = item
+                    if pool_statistics is not None:
+                        worker_statistics[pool_statistics[0]] = pool_statistics[1]
+                    print(output, end="")
+                    self.add_match_profile(profile)
+                    self.record_result(result)
+                    self.report_progress()
+        finally:
+            print_pool_report(self.process_pool_type, worker_statistics)
+
+    async def play_all_games_async(self):
+        """
+        Play all the matches in one asyncio event loop, self.async_games at a time.
+        """
+        schedule = self.unplayed_games()
+        running = set()
+
+        self.print_win_data()
+        while True:
+            for game in schedule:
+                running.add(asyncio.ensure_future(self.play_game_async(*game)))
+                if len(running) == self.async_games:
+                    break
+            if not running:
+                break
+
+            done, running = await asyncio.wait(running, return_when=asyncio.FIRST_COMPLETED)
+            for task in done:
+                self.record_match(*task.result())
+
+    async def play_all_sets_async(self):
+        """
+        Play the games of each set at the same time in one asyncio event loop,
+        so a set takes as long as its longest game instead of the sum of them.
+        The games are recorded (and their output printed) in order.
+        """
+        self.print_win_data()
+        for game_set in self.unplayed_sets():
+            for match, output in await asyncio.gather(*(self.play_game_async(*game) for game in game_set)):
+                self.record_match(match, output)
+
+    async def play_game_async(self, id_number, player_list, config_str):
+        """
+        Play one match in the event loop.  It prints to its own buffer (or
+        output of the sink), so that the output of the matches played at the
+        same time isn't interleaved.
+
+        :return: The finished AsyncMatch and its output for the terminal
+        """
+        with (self.output_sink.open(id_number) if self.output_sink is not None else io.StringIO()) as output:
+            match = await play_match_async(id_number, player_list, config_str, self.time_limits, self.verbose,
+                                           self.show_map, self.replay_dir, self.replay_stderr,
+                                           profile=self.new_match_profile(id_number),
+                                           memory_limit=self.memory_limit, turn_budgets=self.turn_budgets,
+                                           output=output)
+            printed = output.getvalue() if self.output_sink is None else ""
+        return match, printed
+
+    def record_match(self, match, output):
+        """Print the output of a match played in the event loop and record its result."""
+        print(output, end="")
+        self.add_match_profile(match.profile)
+        self.record_result(game_result(match))
+        self.report_progress()
+
+    def report_progress(self):
+        """
+        Print a line of progress every PROGRESS_EVERY games, and all the results
+        every WIN_DATA_EVERY games, so the output grows linearly with the games.
+        """
+        if self.games_played % PROGRESS_EVERY or self.games_played >= self.number_of_games:
+            return
+        if self.games_played % WIN_DATA_EVERY == 0:
+            self.print_win_data()
+        else:
+            print(self.progress_line())
+
+    def progress_line(self):
+        """:return: The number of games played, the games played per second and the time left."""
+        elapsed = time.perf_counter() - self.play_start_time
+        rate = (self.games_played - self.games_resumed) / elapsed if elapsed > 0 else 0.0
+        line = "Progress: {}/{} games, {:.2f} games/sec".format(self.games_played, self.number_of_games, rate)
+        if rate > 0:
+            line += ", ETA {:.0f} sec".format((self.number_of_games - self.games_played) / rate)
+        return line
 
     def print_win_data(self):
         """
@@ -167,15 +713,16 @@ class Tournament:
         for name in self.program_names:
             error_note = ""
             if self.games_with_errors[name]:
-                error_games = ", ".join(map(str, self.games_with_errors[name]))
-                error_note += "(Errors on games {}) ".format(error_games)
+                error_note += "(Errors on {} games: {}) ".format(len(self.games_with_errors[name]),
+                                                                 self.games_with_errors[name])
 
             if self.games_with_warnings[name]:
-                warnings_games = self.games_with_warnings[name]
-                if len(warnings_games) > 5:
-                    warnings_games = ["..."] + warnings_games[-5:]
-                warning_str = ", ".join(map(str, warnings_games))
-                error_note += "(Warnings on games {}) ".format(warning_str)
+                error_note += "(Warnings on {} games: {}) ".format(len(self.games_with_warnings[name]),
+                                                                   self.games_with_warnings[name])
+
+            if self.games_with_timeouts[name]:
+                error_note += "(Timeouts on {} games: {}) ".format(len(self.games_with_timeouts[name]),
+                                                                   self.games_with_timeouts[name])
 
             print("{} : {} [{}] wins {}".format(name, self.wins[name], self.diff_wins[name], error_note))
 
@@ -184,6 +731,15 @@ class Tournament:
                     stats = ["{}. {:3} [{:3}] ".format(i+1, self.placements[name, arity, i],
                                                        self.diff_placements[name, arity, i]) for i in range(arity)]
                     print("   ", arity, "player games: ", *stats)
+            if self.turn_times[name].count:
+                print("    turn time ", self.turn_times[name].summary())
+            if self.turn_cpu_times[name].count:
+                print("    turn cpu  ", self.turn_cpu_times[name].summary())
+            if self.resources[name].games:
+                print("    resources ", self.resources[name].summary())
         if self.games_to_look_at:
-            print("Games where results differ:", *self.games_to_look_at)
+            print("Games where results differ ({} sets): {}".format(len(self.games_to_look_at), self.games_to_look_at))
+        if self.sprt is not None:
+            for line in self.sprt.summary(self.program_names):
+                print(line)
         print("Total tournament time:", time.perf_counter() - self.start_time, "sec")